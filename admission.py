@@ -0,0 +1,260 @@
+import os
+import math
+import time
+import random
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: slots are counted in-process only
+    fcntl = None
+
+
+class Rejected(Exception):
+    """A call turned away before doing any work; `status` and `retry_after` (seconds) are for the HTTP reply."""
+
+    status = 503
+    reason = 'rejected'
+
+    def __init__(self, guard, retry_after):
+        super().__init__(f"{guard}: {self.reason}, retry after {retry_after}s")
+        self.guard = guard
+        self.retry_after = max(int(math.ceil(retry_after)), 1)
+        metrics.registry.inc('libra_admission_rejected_total', guard, self.reason)
+
+
+class RateLimited(Rejected):
+    status = 429
+    reason = 'rate_limited'
+
+
+class Saturated(Rejected):
+    reason = 'saturated'
+
+
+class CircuitOpen(Rejected):
+    reason = 'circuit_open'
+
+
+_bulkheads = []
+_breakers = []
+
+
+class Bulkhead:
+    """At most `limit` holders of a slot at once, across every process using `lock_dir`.
+
+    Slot i is an flock on `lock_dir/<name>.<i>.lock`, so gunicorn workers
+    on one host share the limit and a slot is freed when its holder dies.
+    A caller finding every slot taken waits up to `max_wait` seconds, then
+    gets Saturated with a Retry-After of the average time a slot is held.
+    """
+
+    def __init__(self, name, limit, lock_dir, max_wait=0.0, poll=0.05):
+        self.name = name
+        self.limit = max(int(limit), 1)
+        self.lock_dir = lock_dir
+        self.max_wait = max_wait
+        self.poll = poll
+        self.in_flight = 0        # in this process
+        self.queued = 0
+        self._held = 1.0          # moving average of seconds a slot is held
+        self._lock = threading.Lock()
+        self._local_slots = threading.BoundedSemaphore(self.limit)
+        os.makedirs(lock_dir, exist_ok=True)
+        _bulkheads.append(self)
+
+    def _try_acquire(self):
+        """An open, locked slot file descriptor, or None if all are taken."""
+        for i in random.sample(range(self.limit), self.limit):
+            fd = os.open(os.path.join(self.lock_dir, f"{self.name}.{i}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except OSError:
+                os.close(fd)
+        return None
+
+    def _acquire(self, max_wait):
+        if fcntl is None:
+            return self._local_slots.acquire(timeout=max_wait) or None
+        deadline = time.monotonic() + max_wait
+        while True:
+            fd = self._try_acquire()
+            if fd is not None or time.monotonic() >= deadline:
+                return fd
+            time.sleep(min(self.poll, max(deadline - time.monotonic(), 0)))
+
+    async def _acquire_async(self, max_wait):
+        deadline = time.monotonic() + max_wait
+        while True:
+            if fcntl is None:
+                fd = self._local_slots.acquire(blocking=False) or None
+            else:
+                fd = self._try_acquire()
+            if fd is not None or time.monotonic() >= deadline:
+                return fd
+            await asyncio.sleep(min(self.poll, max(deadline - time.monotonic(), 0)))
+
+    def _release(self, fd):
+        if fcntl is None:
+            self._local_slots.release()
+            return
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def _queue(self, delta):
+        with self._lock:
+            self.queued += delta
+
+    def _admit(self, fd, started):
+        """Account for a finished wait; raises Saturated if it got no slot."""
+        metrics.registry.observe('libra_admission_wait_seconds', time.perf_counter() - started, self.name)
+        if fd is None:
+            raise Saturated(self.name, self._held)
+        with self._lock:
+            self.in_flight += 1
+        return time.perf_counter()
+
+    def _leave(self, fd, started):
+        held = time.perf_counter() - started
+        with self._lock:
+            self.in_flight -= 1
+            self._held += (held - self._held) * 0.2
+        self._release(fd)
+
+    @contextmanager
+    def slot(self, max_wait=None):
+        """Hold a slot for the block; raises Saturated if none frees up within `max_wait` (default self.max_wait)."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        self._queue(1)
+        started = time.perf_counter()
+        try:
+            fd = self._acquire(max_wait)
+        finally:
+            self._queue(-1)
+        started = self._admit(fd, started)
+        try:
+            yield
+        finally:
+            self._leave(fd, started)
+
+    @asynccontextmanager
+    async def async_slot(self, max_wait=None):
+        """slot() for coroutines: waits with asyncio.sleep instead of blocking the event loop."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        self._queue(1)
+        started = time.perf_counter()
+        try:
+            fd = await self._acquire_async(max_wait)
+        finally:
+            self._queue(-1)
+        started = self._admit(fd, started)
+        try:
+            yield
+        finally:
+            self._leave(fd, started)
+
+
+class RateLimiter:
+    """Token bucket per key (a user or client address): `rate` calls per second, bursts of `burst`.
+
+    Buckets live in this process, so with several gunicorn workers a key
+    gets up to `rate` per worker. Only the `max_keys` most recently seen
+    keys are remembered; a forgotten key starts again with a full bucket.
+    """
+
+    def __init__(self, name, rate, burst, max_keys=10000):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, monotonic time of last update)
+        self._lock = threading.Lock()
+
+    def take(self, key, cost=1):
+        """Charge `cost` tokens to `key`, or raise RateLimited with the seconds until they are there."""
+        now = time.monotonic()
+        cost = min(cost, self.burst)
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        if not allowed:
+            raise RateLimited(self.name, (cost - tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Stop calling a backend after `failures` consecutive failures.
+
+    While open, calls fail at once with CircuitOpen. After `reset_after`
+    seconds one trial call is let through (half-open): success closes the
+    circuit, failure opens it for another `reset_after`.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name, failures=5, reset_after=30.0):
+        self.name = name
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self._count = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+        _breakers.append(self)
+
+    def before(self):
+        """Raise CircuitOpen unless a call may go ahead now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            wait = self._opened_at + self.reset_after - time.monotonic()
+            if wait <= 0 and not self._trial:
+                self.state, self._trial = self.HALF_OPEN, True
+                return
+        raise CircuitOpen(self.name, max(wait, 1))
+
+    def success(self):
+        with self._lock:
+            self.state, self._count, self._trial = self.CLOSED, 0, False
+
+    def failure(self):
+        with self._lock:
+            self._count += 1
+            if self.state == self.HALF_OPEN or self._count >= self.failures:
+                if self.state != self.OPEN:
+                    print(f"Circuit {self.name} opened after {self._count} failures")
+                self.state, self._opened_at, self._trial = self.OPEN, time.monotonic(), False
+
+    @contextmanager
+    def guard(self):
+        """`with breaker.guard():` around one backend call; an exception in the block counts as a failure."""
+        self.before()
+        try:
+            yield
+        except BaseException:
+            self.failure()
+            raise
+        self.success()
+
+
+metrics.registry.counter('libra_admission_rejected_total', 'Calls turned away by a rate limit, a full bulkhead or an open circuit.',
+                         ('guard', 'reason'))
+metrics.registry.histogram('libra_admission_wait_seconds', 'Time spent queued for a bulkhead slot.', ('guard',))
+metrics.registry.gauge('libra_admission_in_flight', 'Bulkhead slots held by this process.',
+                       lambda: {(b.name,): b.in_flight for b in _bulkheads}, ('guard',))
+metrics.registry.gauge('libra_admission_queued', 'Callers of this process waiting for a bulkhead slot.',
+                       lambda: {(b.name,): b.queued for b in _bulkheads}, ('guard',))
+metrics.registry.gauge('libra_circuit_state', 'Circuit breaker state: 0 closed, 1 half-open, 2 open.',
+                       lambda: {(b.name,): b.state for b in _breakers}, ('backend',))
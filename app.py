@@ -1,49 +1,90 @@
 import os
+import time
+_IMPORT_STARTED = time.perf_counter()
+import csv
 import json
 import uuid
+import zlib
+import logging
 import base64 
+import threading
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import services
-import firebase_admin
-from firebase_admin import credentials, auth
+import storage
+import search_index
+import catalog_stats
+import dashboard_views
+import inventory
+import catalog_io
+import jobs
+import reminders
+import metrics
+import admission
+import serialization
+import response_encoding
+from token_cache import TokenCache
+from ids import IdGenerator
 from functools import wraps
 
+load_dotenv()
+
 # --- Firebase Admin Initialization ---
 # IMPORTANT: Create a 'serviceAccountKey.json' file in your project root
 # and add its path to your .env file as FIREBASE_SERVICE_ACCOUNT_KEY_PATH
-load_dotenv()
-try:
-    cred_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY_PATH")
-    cred_json_env = os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY_JSON")
-
-    if cred_json_env:
-        # Prefer JSON from env if provided (Render-friendly, no files committed)
-        try:
-            service_account_info = json.loads(cred_json_env)
-        except json.JSONDecodeError:
-            raise ValueError("FIREBASE_SERVICE_ACCOUNT_KEY_JSON is not valid JSON")
-        cred = credentials.Certificate(service_account_info)
-        firebase_admin.initialize_app(cred)
-        print("Firebase Admin SDK initialized from FIREBASE_SERVICE_ACCOUNT_KEY_JSON.")
-    elif cred_path:
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-        print("Firebase Admin SDK initialized from FIREBASE_SERVICE_ACCOUNT_KEY_PATH.")
-    else:
-        raise ValueError("Set FIREBASE_SERVICE_ACCOUNT_KEY_JSON or FIREBASE_SERVICE_ACCOUNT_KEY_PATH in environment")
-except Exception as e:
-    print(f"CRITICAL: Failed to initialize Firebase Admin SDK. Admin features will not work. Error: {e}")
+# The SDK is imported and initialized on the first admin request (or by create_app(warm=True))
+_firebase_lock = threading.Lock()
+_firebase_auth = None
+
+def firebase_auth():
+    """The firebase_admin.auth module, with the Admin SDK initialized."""
+    global _firebase_auth
+    if _firebase_auth is None:
+        with _firebase_lock:
+            if _firebase_auth is None:
+                import firebase_admin
+                from firebase_admin import credentials, auth
+                try:
+                    cred_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY_PATH")
+                    cred_json_env = os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY_JSON")
+
+                    if cred_json_env:
+                        # Prefer JSON from env if provided (Render-friendly, no files committed)
+                        try:
+                            service_account_info = json.loads(cred_json_env)
+                        except json.JSONDecodeError:
+                            raise ValueError("FIREBASE_SERVICE_ACCOUNT_KEY_JSON is not valid JSON")
+                        cred = credentials.Certificate(service_account_info)
+                        firebase_admin.initialize_app(cred)
+                        print("Firebase Admin SDK initialized from FIREBASE_SERVICE_ACCOUNT_KEY_JSON.")
+                    elif cred_path:
+                        cred = credentials.Certificate(cred_path)
+                        firebase_admin.initialize_app(cred)
+                        print("Firebase Admin SDK initialized from FIREBASE_SERVICE_ACCOUNT_KEY_PATH.")
+                    else:
+                        raise ValueError("Set FIREBASE_SERVICE_ACCOUNT_KEY_JSON or FIREBASE_SERVICE_ACCOUNT_KEY_PATH in environment")
+                except Exception as e:
+                    print(f"CRITICAL: Failed to initialize Firebase Admin SDK. Admin features will not work. Error: {e}")
+                _firebase_auth = auth
+    return _firebase_auth
 
 if os.getenv("CLOUDINARY_CLOUD_NAME"):
     print(".env file loaded successfully.")
-    services.configure_cloudinary()
 else:
     print("WARNING: .env file not loaded or variables are missing.")
 
 app = Flask(__name__)
+# X-Forwarded-For entries appended by our own proxies (Render's: 1) are trusted for
+# request.remote_addr; anything a client put in front of them is ignored
+PROXY_HOPS = int(os.getenv('PROXY_HOPS', '1'))
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
+# orjson-backed jsonify/request.json; gzip/brotli for large bodies (see _compress_response)
+app.json = response_encoding.FastJSONProvider(app)
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', str(response_encoding.GZIP_LEVEL)))
 
 # --- Data directory (supports Render Disk via DATA_DIR) ---
 BASE_DIR = os.getenv("DATA_DIR", os.path.dirname(__file__))
@@ -51,6 +92,177 @@ BASE_DIR = os.getenv("DATA_DIR", os.path.dirname(__file__))
 def _data_path(filename: str) -> str:
     return os.path.join(BASE_DIR, filename)
 
+# Set up once per process by create_app()
+# Books/borrowals: JSON snapshot + journal (default) or SQLite, see STORAGE_BACKEND
+# (every call timed as step 'storage.<method>' for /metrics)
+store = None
+# Full-text index for /search-books, kept current by store change events
+book_index = None
+# Counters, due-date index and newest borrowals for /api/admin/stats
+admin_stats = None
+# Materialized per-user dashboards, dropped when that user's loans change
+dashboards = None
+# Receipt PDF + barcode + confirmation email, and bulk imports, run off the request path
+background_jobs = None
+# Daily digest emails of loans due soon or overdue
+reminder_scheduler = None
+# Seconds spent in each startup phase ('import' is this module), see create_app()
+startup_timings = {}
+_init_lock = threading.Lock()
+
+# Borrow codes and book ids, unique across workers
+ids = IdGenerator(_data_path('ids.json'))
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '50'))
+SEARCH_MAX_PAGE_SIZE = 200
+# Stocktaking: most images accepted by one /api/admin/ocr-match-batch call
+OCR_BATCH_MAX_IMAGES = int(os.getenv('OCR_BATCH_MAX_IMAGES', '200'))
+# Admin listings: default/max page size, rows per chunk of a streamed full export
+ADMIN_PAGE_SIZE = int(os.getenv('ADMIN_PAGE_SIZE', '50'))
+ADMIN_MAX_PAGE_SIZE = 500
+ADMIN_EXPORT_CHUNK = 500
+# Bulk catalog import: largest upload, errors listed in the result, progress update interval (rows)
+IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', str(50 * 1024 * 1024)))
+IMPORT_MAX_ERRORS = 100
+IMPORT_PROGRESS_EVERY = 1000
+
+def _run_catalog_import(payload):
+    """Validate and dedupe an uploaded CSV/JSONL catalog, then add its new books in one store write.
+
+    Nothing is written if any row is invalid (or on a dry run). A retry after a
+    failed write is harmless: books added by the first attempt are duplicates.
+    """
+    import_id, path = payload['import_id'], payload['path']
+    result = {"phase": "reading", "rows": 0, "valid": 0, "duplicates": 0, "imported": 0,
+              "error_count": 0, "errors": [], "dry_run": payload['dry_run']}
+    def error(line, message):
+        result['error_count'] += 1
+        if len(result['errors']) < IMPORT_MAX_ERRORS:
+            result['errors'].append({"line": line, "error": message})
+
+    store.refresh()
+    existing = store.list_books()
+    seen_ids = {book['book_id'] for book in existing}
+    seen_keys = {catalog_io.dedupe_key(book) for book in existing}
+    books = []
+    try:
+        with open(path, 'rb') as f:
+            for line, row in catalog_io.read_rows(f, payload['format']):
+                result['rows'] += 1
+                if result['rows'] % IMPORT_PROGRESS_EVERY == 0:
+                    background_jobs.set_progress(import_id, result)
+                book, message = catalog_io.validate_book(row)
+                if message:
+                    error(line, message)
+                    continue
+                key = catalog_io.dedupe_key(book)
+                if book['book_id'] and book['book_id'] in seen_ids or key in seen_keys:
+                    result['duplicates'] += 1
+                    continue
+                seen_keys.add(key)
+                if book['book_id']:
+                    seen_ids.add(book['book_id'])
+                books.append(book)
+    except (UnicodeDecodeError, csv.Error) as e:
+        error(None, f"Không đọc được file (cần CSV/JSONL UTF-8): {e}")
+    result['valid'] = len(books)
+
+    if books and not result['error_count'] and not payload['dry_run']:
+        result['phase'] = 'writing'
+        background_jobs.set_progress(import_id, result)
+        new_ids = iter(ids.next_many('B', sum(1 for book in books if not book['book_id'])))
+        for book in books:
+            book['book_id'] = book['book_id'] or next(new_ids)
+        added = store.add_books(books)
+        result['imported'] = len(added)
+        result['duplicates'] += len(books) - len(added)
+    result['phase'] = 'done'
+    background_jobs.set_progress(import_id, result)
+    os.remove(path)
+
+def create_app(start_background=True, warm=False):
+    """Open the store and set up the indexes and job queue (once per process); returns `app`.
+
+    A gunicorn master that preloads the app passes start_background=False,
+    since threads do not survive fork, and warm=True, so that forked workers
+    inherit the loaded catalog, built indexes, parsed receipt fonts and an
+    initialized Firebase SDK. Each worker then calls start_background().
+    """
+    global store, book_index, admin_stats, dashboards, background_jobs, reminder_scheduler
+    with _init_lock:
+        if store is None:
+            last = time.perf_counter()
+            def phase(name):
+                nonlocal last
+                now = time.perf_counter()
+                startup_timings[name] = now - last
+                last = now
+
+            store = metrics.Timed(storage.open_store(BASE_DIR), 'storage')
+            store.refresh()
+            phase('store')
+            book_index = search_index.SearchIndex(store.list_books)
+            store.subscribe(book_index.on_change)
+            admin_stats = catalog_stats.CatalogStats(store.list_books, store.recent_borrowals)
+            store.subscribe(admin_stats.on_change)
+            dashboards = dashboard_views.DashboardViews(_build_dashboard_view, store.available_books)
+            store.subscribe(dashboards.on_change)
+            background_jobs = jobs.JobQueue(
+                _data_path('jobs.db'),
+                {'borrow_receipt': metrics.timer('job.borrow_receipt')(
+                     lambda payload: services.deliver_borrow_receipt(payload['recipients'], payload['details'])),
+                 'catalog_import': metrics.timer('job.catalog_import')(_run_catalog_import)},
+                workers=int(os.getenv('JOB_WORKERS', '2')),
+                max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+            )
+            reminder_scheduler = reminders.ReminderScheduler(
+                _data_path('reminders.db'), _due_loans, store.get_borrowals,
+                services.build_due_reminder_email, metrics.timer('smtp.send_many')(services.send_many),
+                days=int(os.getenv('REMINDER_DAYS', '3')),
+                hour=int(os.getenv('REMINDER_HOUR', '7')),
+                overdue_every=int(os.getenv('REMINDER_OVERDUE_EVERY', '7')),
+                dry_run=os.getenv('REMINDERS_DRY_RUN', '0') == '1'
+            )
+            phase('setup')
+            if warm:
+                book_index.warm_up()
+                admin_stats.warm_up()
+                phase('indexes')
+                firebase_auth()
+                phase('firebase')
+                services.warm_up()
+                phase('services')
+            print("Startup: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in startup_timings.items()))
+    if start_background:
+        start_background_tasks()
+    return app
+
+def start_background_tasks():
+    """Start this process's journal compactor and job workers (after create_app(); idempotent)."""
+    create_app(start_background=False)
+    store.start_compactor(
+        interval=int(os.getenv('JOURNAL_COMPACT_INTERVAL', '300')),
+        min_bytes=int(os.getenv('JOURNAL_COMPACT_BYTES', str(1024 * 1024))),
+        min_closed=int(os.getenv('HISTORY_ARCHIVE_MIN', '1000'))
+    )
+    background_jobs.start()
+    if os.getenv('REMINDERS_ENABLED', '1') == '1':
+        reminder_scheduler.start()
+
+def _due_loans(day):
+    """Lent copies due by `day`, from the stats' due-date index brought up to date first."""
+    store.refresh()
+    return admin_stats.due_until(day)
+
+def release_connections():
+    """Close the calling thread's SQLite connections; the next use reopens them.
+
+    For a preloading gunicorn master before it forks: a SQLite connection
+    must not be carried into a child process.
+    """
+    for holder in (store, background_jobs, reminder_scheduler, services.ocr_cache):
+        if holder is not None:
+            holder.close()
+
 # Cấu hình CORS bảo mật hơn (đã hỗ trợ frontend domain)
 ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000,http://127.0.0.1:3000').split(',')
 CORS(
@@ -58,96 +270,195 @@ CORS(
     supports_credentials=True,
     resources={r"/*": {"origins": ALLOWED_ORIGINS}},
     allow_headers=["Content-Type", "Authorization"],
+    expose_headers=["X-Total-Count", "ETag"],
     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
 )
 
 
 # --- Authentication Decorator ---
+# Cho phép cấu hình nhiều email admin qua biến môi trường ADMIN_EMAILS
+ADMIN_EMAILS = frozenset(e.strip().lower() for e in os.getenv('ADMIN_EMAILS', 'admin@libranct.us.to').split(',') if e.strip())
+# Verified ID tokens, so a page of admin calls pays for signature verification once
+verified_tokens = TokenCache(
+    max_size=int(os.getenv('TOKEN_CACHE_SIZE', '1024')),
+    max_age=int(os.getenv('TOKEN_CACHE_MAX_AGE', '300'))
+)
+
+def check_admin():
+    """None if the request carries an admin's ID token, else the error response to send."""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return jsonify({"status": "error", "message": "Missing or invalid Authorization header."}), 401
+    
+    id_token = auth_header.split('Bearer ')[1]
+    auth = firebase_auth()
+    try:
+        decoded_token = verified_tokens.get(id_token)
+        if decoded_token is None:
+            with metrics.timer('firebase.verify'):
+                decoded_token = auth.verify_id_token(id_token)
+            verified_tokens.put(id_token, decoded_token)
+        email = decoded_token.get('email')
+        
+        # --- The core security check ---
+        if not email or email.lower() not in ADMIN_EMAILS:
+            return jsonify({"status": "error", "message": "Admin privileges required."}), 403
+        
+    except auth.InvalidIdTokenError:
+        return jsonify({"status": "error", "message": "Invalid ID token."}), 403
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"Token verification failed: {str(e)}"}), 401
+    return None
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({"status": "error", "message": "Missing or invalid Authorization header."}), 401
-        
-        id_token = auth_header.split('Bearer ')[1]
-        try:
-            decoded_token = auth.verify_id_token(id_token)
-            email = decoded_token.get('email')
-            
-            # --- The core security check ---
-            # Cho phép cấu hình nhiều email admin qua biến môi trường ADMIN_EMAILS
-            admin_emails_env = os.getenv('ADMIN_EMAILS', 'admin@libranct.us.to')
-            admin_emails = {e.strip().lower() for e in admin_emails_env.split(',') if e.strip()}
-
-            if not email or email.lower() not in admin_emails:
-                return jsonify({"status": "error", "message": "Admin privileges required."}), 403
-            
-        except auth.InvalidIdTokenError:
-            return jsonify({"status": "error", "message": "Invalid ID token."}), 403
-        except Exception as e:
-            return jsonify({"status": "error", "message": f"Token verification failed: {str(e)}"}), 401
-        
+        error = check_admin()
+        if error is not None:
+            return error
         return f(*args, **kwargs)
     return decorated_function
 
-# --- Database Helper Functions ---
-def read_json_db(filepath):
-    try:
-        with open(_data_path(filepath), 'r', encoding='utf-8') as f:
-            content = f.read()
-            if not content: return []
-            return json.loads(content)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
-
-def write_json_db(filepath, data):
-    os.makedirs(os.path.dirname(_data_path(filepath)), exist_ok=True) if os.path.dirname(_data_path(filepath)) else None
-    with open(_data_path(filepath), 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+# --- Admission control ---
+# OCR.space/SMTP slots and circuit breakers are in services.py; these guard whole endpoints.
+# Token buckets per client address (per worker), refused with 429 + Retry-After
+ocr_rate = admission.RateLimiter('ocr-book-cover', float(os.getenv('OCR_RATE_PER_MINUTE', '20')) / 60,
+                                 int(os.getenv('OCR_RATE_BURST', '5')))
+borrow_rate = admission.RateLimiter('process-borrow-request', float(os.getenv('BORROW_RATE_PER_MINUTE', '10')) / 60,
+                                    int(os.getenv('BORROW_RATE_BURST', '5')))
+# Endpoints that hold a worker for long, limited across the workers on this host (503 + Retry-After when full)
+ocr_batch_slots = admission.Bulkhead('ocr-match-batch', int(os.getenv('OCR_BATCH_MAX_CONCURRENCY', '1')),
+                                     _data_path('admission'))
+label_slots = admission.Bulkhead('barcode-labels', int(os.getenv('LABELS_MAX_CONCURRENCY', '1')),
+                                 _data_path('admission'), max_wait=5)
+
+def _client_address():
+    """The client's address, as seen by the last PROXY_HOPS proxies (see ProxyFix above)."""
+    return request.remote_addr
+
+def admitted(limiter=None, key=_client_address, slots=None):
+    """Charge the caller's bucket in `limiter`, then run the view holding one of `slots`."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if limiter is not None:
+                limiter.take(key())
+            if slots is None:
+                return f(*args, **kwargs)
+            with slots.slot():
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+@app.errorhandler(admission.Rejected)
+def _admission_rejected(e):
+    if isinstance(e, admission.RateLimited):
+        message = f"Bạn gửi quá nhiều yêu cầu, vui lòng thử lại sau {e.retry_after} giây."
+    elif isinstance(e, admission.CircuitOpen):
+        message = f"Dịch vụ {e.guard.upper()} tạm thời không khả dụng, vui lòng thử lại sau {e.retry_after} giây."
+    else:
+        message = f"Máy chủ đang bận, vui lòng thử lại sau {e.retry_after} giây."
+    return jsonify({"status": "error", "message": message}), e.status, {'Retry-After': str(e.retry_after)}
+
+# --- Metrics and request logs ---
+# One JSON line per request on the 'libra' logger (LOG_LEVEL=WARNING turns them off);
+# start.py's logging setup is used when present, stderr otherwise
+if not metrics.log.handlers and not logging.getLogger().handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter('%(message)s'))
+    metrics.log.addHandler(_log_handler)
+metrics.log.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+# When set, /metrics wants "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+metrics.registry.gauge('libra_process_info', 'Worker process serving this scrape.', lambda: {(os.getpid(),): 1}, ('pid',))
+metrics.registry.gauge('libra_token_cache', 'Verified ID token cache.',
+                       lambda: {(k,): v for k, v in verified_tokens.stats().items()}, ('stat',))
+metrics.registry.gauge('libra_ocr_cache', 'OCR result cache.',
+                       lambda: {(k,): v for k, v in services.ocr_cache.stats().items()}, ('stat',))
+metrics.registry.gauge('libra_startup_seconds', 'Time spent in each startup phase of this process.',
+                       lambda: {(name,): round(seconds, 6) for name, seconds in startup_timings.items()}, ('phase',))
+metrics.registry.gauge('libra_jobs', 'Background jobs by kind and state.', lambda: background_jobs.counts() if background_jobs else {}, ('kind', 'state'))
+
+@app.before_request
+def _ensure_started():
+    # Entry points that import `app` without calling create_app() set up on the first request
+    if store is None:
+        create_app()
+
+@app.before_request
+def _start_request_timer():
+    metrics.begin_request()
+
+@app.after_request
+def _record_request(response):
+    seconds, steps = metrics.end_request()
+    if seconds is not None:
+        # Route template, not the path, so /borrow-status/<code> is one series
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        metrics.registry.observe('libra_http_request_duration_seconds', seconds, request.method, route)
+        metrics.registry.inc('libra_http_requests_total', request.method, route, str(response.status_code))
+        metrics.log_request(request.method, route, response.status_code, seconds, steps)
+    return response
+
+@app.after_request
+def _compress_response(response):
+    # Registered after _record_request, so it runs first and its time is counted
+    return response_encoding.compress(response, request.accept_encodings, COMPRESS_MIN_BYTES, COMPRESS_LEVEL)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"status": "error", "message": "Unauthorized."}), 401
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 # --- USER-FACING API ROUTES ---
 
+def _build_dashboard_view(email, today):
+    """One user's loans and due-soon list, plus the book_ids and borrow_codes of all their records."""
+    borrowed_books_list = []
+    due_soon_books_list = []
+    for borrow_record, _ in store.active_borrowals_for_email(email):
+        return_date_str = borrow_record.get('return_date')
+        borrowed_books_list.append({"book_title": borrow_record['book_title'], "return_date": return_date_str})
+        if return_date_str:
+            return_date = datetime.strptime(return_date_str, '%d/%m/%Y').date()
+            days_left = (return_date - today).days
+            if 0 <= days_left <= 3:
+                due_soon_books_list.append({"title": borrow_record['book_title'], "days_left": days_left})
+    due_soon_books_list.sort(key=lambda x: x['days_left'])
+    records = store.borrowals_for_email(email)
+    return {"borrowed_books": borrowed_books_list, "due_soon_books": due_soon_books_list,
+            "book_ids": {r['book_id'] for r in records}, "borrow_codes": {r['borrow_code'] for r in records}}
+
 @app.route('/dashboard-data/<email>', methods=['GET'])
 def get_dashboard_data(email):
     if not email:
         return jsonify({"status": "error", "message": "Email is required"}), 400
     try:
-        borrowers = read_json_db('borrowers.json')
-        user_borrows = [b for b in borrowers if b.get('original_email') == email]
-        books_db = read_json_db('database.json')
-        borrowed_books_list = []
-        due_soon_books_list = []
-        today = datetime.now().date()
-        for borrow_record in user_borrows:
-            book_info = next((book for book in books_db if book['book_id'] == borrow_record['book_id']), None)
-            if book_info and book_info.get('is_borrowed'):
-                return_date_str = book_info.get('return_date')
-                borrowed_books_list.append({"book_title": borrow_record['book_title'], "return_date": return_date_str})
-                if return_date_str:
-                    return_date = datetime.strptime(return_date_str, '%d/%m/%Y').date()
-                    days_left = (return_date - today).days
-                    if 0 <= days_left <= 3:
-                        due_soon_books_list.append({"title": borrow_record['book_title'], "days_left": days_left})
-        due_soon_books_list.sort(key=lambda x: x['days_left'])
-        borrowed_ids = {b['book_id'] for b in user_borrows}
-        recommendations_list = [book for book in books_db if book['book_id'] not in borrowed_ids and not book.get('is_borrowed')][:6]
-        return jsonify({
-            "status": "success", "borrowed_books": borrowed_books_list,
-            "due_soon_books": due_soon_books_list, "recommendations": recommendations_list
-        })
+        store.refresh()
+        return jsonify({"status": "success", **dashboards.get(email, datetime.now().date())})
     except Exception as e:
         print(f"Error fetching dashboard data for {email}: {e}")
         return jsonify({"status": "error", "message": f"Could not fetch dashboard information: {str(e)}"}), 500
 
 @app.route('/search-books', methods=['GET'])
 def search_books():
-    query = request.args.get('q', '').lower()
-    books_db = read_json_db('database.json')
-    results = [{"id": book["book_id"], "title": book["book_name"], "quantity": book["quantity"], "status": "Hết sách" if book["is_borrowed"] or book["quantity"] == 0 else "Có sẵn"} for book in books_db if query in book["book_name"].lower() or query in book["book_id"].lower()]
-    return jsonify(results)
+    query = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', SEARCH_PAGE_SIZE)), 0), SEARCH_MAX_PAGE_SIZE)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit và offset phải là số nguyên."}), 400
+    store.refresh()
+    total, book_ids = book_index.search(query, limit=limit, offset=offset)
+    results = [{"id": book["book_id"], "title": book["book_name"], "quantity": book["quantity"], "available": book["available_count"], "status": "Hết sách" if book["available_count"] == 0 else "Có sẵn"} for book in store.get_books(book_ids)]
+    response = jsonify(results)
+    response.headers['X-Total-Count'] = str(total)
+    return response
 
 @app.route('/ocr-book-cover', methods=['POST'])
+@admitted(ocr_rate)
 def ocr_book_cover():
     data = request.json
     if not data or 'image_data' not in data:
@@ -155,6 +466,8 @@ def ocr_book_cover():
     try:
         text = services.process_ocr_for_text(data['image_data'])
         return jsonify({"status": "success", "text": text})
+    except admission.Rejected:
+        raise
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -170,57 +483,57 @@ def get_cloudinary_signature():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/process-borrow-request', methods=['POST'])
+@admitted(borrow_rate)
 def process_borrow_request():
     data = request.json
     book_info, form_info, user_email = data.get('book'), data.get('form'), data.get('userEmail')
     try:
-        books_db = read_json_db('database.json')
-        book_to_update = next((book for book in books_db if book['book_id'] == book_info['id'] and not book.get('is_borrowed')), None)
-        if not book_to_update:
-            return jsonify({"status": "error", "message": "Sách không có sẵn hoặc đã được mượn."}), 409
-        
         duration_days = int(form_info.get('borrow_duration', 7))
         return_date = datetime.now() + timedelta(days=duration_days)
         if return_date.weekday() == 5: return_date -= timedelta(days=1)
         elif return_date.weekday() == 6: return_date += timedelta(days=1)
-        book_to_update['is_borrowed'] = True
-        book_to_update['return_date'] = return_date.strftime('%d/%m/%Y')
-        write_json_db('database.json', books_db)
-
-        borrow_code = f"M{datetime.now().strftime('%y%m%d%H%M%S')}"
-        borrowers_db = read_json_db('borrowers.json')
+        borrow_code = ids.next('M')
         new_borrower = {
             "borrow_code": borrow_code, "book_id": book_info['id'], "book_title": book_info['title'],
             "student_name": form_info.get('name'), "student_class": form_info.get('class'),
             "contact_email": form_info.get('email'), "original_email": user_email,
             "library_card_url": form_info.get('library_card_url'),
-            "borrow_date": datetime.now().strftime('%d/%m/%Y'), "return_date": book_to_update['return_date']
+            "borrow_date": datetime.now().strftime('%d/%m/%Y'), "return_date": return_date.strftime('%d/%m/%Y')
         }
-        borrowers_db.append(new_borrower)
-        write_json_db('borrowers.json', borrowers_db)
+        book_to_update = store.borrow(book_info['id'], new_borrower['return_date'], new_borrower)
+        if not book_to_update:
+            return jsonify({"status": "error", "message": "Sách không có sẵn hoặc đã được mượn."}), 409
         
-        email_details = {'borrow_code': borrow_code, 'book_title': book_info['title'], 'student_name': form_info.get('name'), 'student_class': form_info.get('class'), 'borrow_date': datetime.now().strftime('%d/%m/%Y'), 'return_date': book_to_update['return_date']}
-        barcode_buffer = services.generate_barcode_image(borrow_code)
-        pdf_base64 = services.generate_pdf_receipt(email_details, barcode_buffer)
-        recipients = [user_email, form_info.get('email')]
-        services.send_borrow_confirmation_email(list(set(recipients)), email_details, pdf_base64)
-        return jsonify({"status": "success", "message": "Borrow request processed and email sent successfully."})
+        email_details = {'borrow_code': borrow_code, 'book_title': book_info['title'], 'student_name': form_info.get('name'), 'student_class': form_info.get('class'), 'borrow_date': datetime.now().strftime('%d/%m/%Y'), 'return_date': new_borrower['return_date']}
+        recipients = sorted({r for r in (user_email, form_info.get('email')) if r})
+        background_jobs.enqueue('borrow_receipt', borrow_code, {'recipients': recipients, 'details': email_details})
+        return jsonify({"status": "success", "message": "Borrow request processed; confirmation email is being sent.", "borrow_code": borrow_code, "copy_id": new_borrower['copy_id']})
     except Exception as e:
         print(f"Lỗi trong quá trình xử lý mượn sách: {e}")
         return jsonify({"status": "error", "message": f"Server error: {e}"}), 500
 
+@app.route('/borrow-status/<borrow_code>', methods=['GET'])
+def get_borrow_status(borrow_code):
+    job = background_jobs.status(borrow_code)
+    if not job or job['kind'] != 'borrow_receipt':
+        return jsonify({"status": "error", "message": "Không tìm thấy mã mượn."}), 404
+    # Public route: whether sending failed, not why (the reason is in the log)
+    last_error = None
+    if job['last_error']:
+        last_error = "Không gửi được biên nhận." if job['state'] == 'failed' else "Gửi biên nhận chưa thành công, hệ thống sẽ thử lại."
+    return jsonify({"status": "success", "borrow_code": borrow_code, "receipt": {
+        "state": job['state'], "attempts": job['attempts'], "last_error": last_error,
+        "queued_at": job['created_at'], "updated_at": job['updated_at']
+    }})
+
 @app.route('/user-borrowed-books', methods=['GET'])
 def get_user_borrowed_books():
     user_email = request.args.get('email')
     if not user_email: return jsonify({"error": "Email is required"}), 400
     try:
-        borrowers, books_db = read_json_db('borrowers.json'), read_json_db('database.json')
-        user_borrow_records = [b for b in borrowers if b.get('original_email') == user_email]
         user_borrowed_list = []
-        for record in user_borrow_records:
-            book_info = next((book for book in books_db if book['book_id'] == record['book_id']), None)
-            if book_info and book_info.get('is_borrowed'):
-                user_borrowed_list.append({"id": record['book_id'], "title": record['book_title'], "return_date": record.get('return_date')})
+        for record, _ in store.active_borrowals_for_email(user_email):
+            user_borrowed_list.append({"id": record['book_id'], "title": record['book_title'], "borrow_code": record['borrow_code'], "return_date": record.get('return_date')})
         return jsonify(user_borrowed_list)
     except Exception as e:
         print(f"Error fetching user borrowed books: {e}")
@@ -229,20 +542,25 @@ def get_user_borrowed_books():
 @app.route('/process-return-request', methods=['POST'])
 def process_return_request():
     data = request.json
-    book_id = data.get('book_id')
-    if not book_id: return jsonify({"status": "error", "message": "Book ID is required."}), 400
+    book_id, borrow_code = data.get('book_id'), data.get('borrow_code')
+    if not book_id and not borrow_code: return jsonify({"status": "error", "message": "Book ID is required."}), 400
     try:
-        books_db = read_json_db('database.json')
-        book_to_return = next((book for book in books_db if book['book_id'] == book_id), None)
+        if borrow_code:
+            record = store.get_borrowal(borrow_code)
+            if not record:
+                return jsonify({"status": "error", "message": "Không tìm thấy mã mượn."}), 404
+            book_id = record['book_id']
+        book_to_return = store.get_book(book_id)
         if not book_to_return:
             return jsonify({"status": "error", "message": "Không tìm thấy sách với ID này."}), 404
-        if not book_to_return.get('is_borrowed'):
+        if not borrow_code and len(inventory.lent_copies(book_to_return)) > 1:
+            return jsonify({"status": "error", "message": "Sách này có nhiều bản đang được mượn, vui lòng nhập mã mượn."}), 409
+        returned = store.return_loan(book_id, borrow_code, datetime.now().strftime('%d/%m/%Y'))
+        if not returned:
             return jsonify({"status": "error", "message": "Sách này đã được trả."}), 409
-        book_to_return['is_borrowed'] = False
-        if 'return_date' in book_to_return:
-            del book_to_return['return_date']
-        write_json_db('database.json', books_db)
-        return jsonify({"status": "success", "message": "Sách đã được trả thành công."})
+        _, record = returned
+        return jsonify({"status": "success", "message": "Sách đã được trả thành công.",
+                        "borrow_code": record and record['borrow_code'], "copy_id": record and record.get('copy_id')})
     except Exception as e:
         print(f"Lỗi trong quá trình xử lý trả sách: {e}")
         return jsonify({"status": "error", "message": f"Server error: {e}"}), 500
@@ -253,46 +571,182 @@ def process_return_request():
 @app.route('/api/admin/stats', methods=['GET'])
 @admin_required
 def get_admin_stats():
-    books = read_json_db('database.json')
-    borrowals = read_json_db('borrowers.json')
-    total_books = len(books)
-    borrowed_count = sum(1 for book in books if book.get('is_borrowed'))
-    overdue_count = 0
-    today = datetime.now().date()
-    for book in books:
-        if book.get('is_borrowed') and 'return_date' in book:
-            try:
-                return_date = datetime.strptime(book['return_date'], '%d/%m/%Y').date()
-                if return_date < today:
-                    overdue_count += 1
-            except (ValueError, TypeError):
-                continue
-    recent_borrowals = sorted(borrowals, key=lambda x: x['borrow_code'], reverse=True)[:5]
-    stats = {
-        "total_books": total_books,
-        "available_books": total_books - borrowed_count,
-        "borrowed_books": borrowed_count,
-        "overdue_count": overdue_count,
-        "recent_borrowals": recent_borrowals
-    }
-    return jsonify(stats)
+    store.refresh()
+    return jsonify(admin_stats.snapshot(datetime.now().date(), recent=5))
+
+@app.route('/api/admin/reminders/run', methods=['POST'])
+@admin_required
+def run_reminders():
+    """Run the due-date reminders now (optionally as of "date" dd/mm/YYYY); "dry_run" returns the digests unsent."""
+    data = request.get_json(silent=True) or {}
+    try:
+        today = datetime.strptime(data['date'], '%d/%m/%Y').date() if data.get('date') else datetime.now().date()
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "Ngày không hợp lệ (dd/mm/YYYY)."}), 400
+    summary = reminder_scheduler.run(today, dry_run=data.get('dry_run'))
+    return jsonify({"status": "success", **summary})
+
+def _listing_etag(kind):
+    """ETag for a listing: the store's data version, today's date (overdue) and the query."""
+    query = '&'.join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    return f"{kind}-{store.version()}-{datetime.now():%Y%m%d}-{zlib.crc32(query.encode()):08x}"
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=') if key is not None else None
+
+def _decode_cursor(cursor):
+    return base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode() if cursor else None
+
+def _listing_response(kind, page, filters, columns):
+    """One page as {"items", "next_cursor"} when `limit` or `cursor` is given, else
+    every match streamed as a JSON array, or with ?format=csv|jsonl as CSV (`columns`)
+    or JSON lines. Answers 304 if the client's ETag is current."""
+    etag = _listing_etag(kind)
+    if request.if_none_match.contains_weak(etag):  # compressed responses carry W/"etag"
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    try:
+        cursor = _decode_cursor(request.args.get('cursor'))
+        limit = int(request.args.get('limit', ADMIN_PAGE_SIZE))
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({"status": "error", "message": "cursor hoặc limit không hợp lệ."}), 400
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json',) + catalog_io.FORMATS:
+        return jsonify({"status": "error", "message": "format phải là json, csv hoặc jsonl."}), 400
+    if fmt != 'json':
+        def export():
+            # BOM so spreadsheet apps read the Vietnamese text as UTF-8
+            yield '\ufeff' + catalog_io.to_csv([], columns) if fmt == 'csv' else ''
+            key = None
+            while True:
+                items, key = page(key, ADMIN_EXPORT_CHUNK, **filters)
+                if fmt == 'csv':
+                    yield catalog_io.to_csv(items, columns, header=False)
+                else:
+                    yield ''.join(serialization.dumps(item) + '\n' for item in items)
+                if key is None:
+                    break
+        response = Response(export(), mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+                            headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'})
+    elif 'limit' in request.args or 'cursor' in request.args:
+        items, next_key = page(cursor, min(max(limit, 1), ADMIN_MAX_PAGE_SIZE), **filters)
+        response = jsonify({"items": items, "next_cursor": _encode_cursor(next_key)})
+    else:
+        def export():
+            yield '['
+            key, first = None, True
+            while True:
+                items, key = page(key, ADMIN_EXPORT_CHUNK, **filters)
+                for item in items:
+                    yield ('' if first else ',') + app.json.dumps(item)
+                    first = False
+                if key is None:
+                    break
+            yield ']'
+        response = Response(export(), mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
 @app.route('/api/admin/all-books', methods=['GET'])
 @admin_required
 def get_all_books():
-    books = read_json_db('database.json')
-    return jsonify(books)
+    """Books by book_id; ?status=available|borrowed, ?limit/&cursor for pages, else a full export."""
+    status = request.args.get('status')
+    if status not in (None, 'available', 'borrowed'):
+        return jsonify({"status": "error", "message": "status phải là available hoặc borrowed."}), 400
+    return _listing_response('books', store.page_books, {'status': status}, catalog_io.BOOK_COLUMNS)
 
 @app.route('/api/admin/all-borrowals', methods=['GET'])
 @admin_required
 def get_all_borrowals():
-    borrowals = read_json_db('borrowers.json')
-    books = read_json_db('database.json')
-    books_dict = {book['book_id']: book for book in books}
-    for b in borrowals:
-        book_status = books_dict.get(b['book_id'], {})
-        b['is_returned'] = not book_status.get('is_borrowed', True)
-    return jsonify(borrowals)
+    """Borrow records, newest first; ?status=active|returned|overdue, ?class=, ?from=&to= (YYYY-MM-DD, borrow date)."""
+    status = request.args.get('status')
+    if status not in (None, 'active', 'returned', 'overdue'):
+        return jsonify({"status": "error", "message": "status phải là active, returned hoặc overdue."}), 400
+    try:
+        date_from, date_to = (datetime.strptime(request.args[k], '%Y-%m-%d').strftime('%Y-%m-%d') if request.args.get(k) else None
+                              for k in ('from', 'to'))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Ngày phải có dạng YYYY-MM-DD."}), 400
+    return _listing_response('borrowals', store.page_borrowals, {
+        'status': status, 'student_class': request.args.get('class') or None,
+        'date_from': date_from, 'date_to': date_to, 'today': datetime.now().date()}, catalog_io.BORROWAL_COLUMNS)
+
+def parse_ocr_batch(data):
+    """(images, limit, None) from an ocr-match-batch body, or (None, None, error response)."""
+    images = data.get('images') if data else None
+    if not isinstance(images, list) or not images:
+        return None, None, (jsonify({"status": "error", "message": "Cần có danh sách ảnh."}), 400)
+    if len(images) > OCR_BATCH_MAX_IMAGES:
+        return None, None, (jsonify({"status": "error", "message": f"Tối đa {OCR_BATCH_MAX_IMAGES} ảnh mỗi lần."}), 400)
+    try:
+        limit = min(max(int(data.get('limit', 5)), 1), 20)
+    except (TypeError, ValueError):
+        return None, None, (jsonify({"status": "error", "message": "limit phải là số nguyên."}), 400)
+    return images, limit, None
+
+def ocr_batch_response(ocr_results, limit):
+    """Ranked catalog candidates for each (text, error) of a batch scan."""
+    store.refresh()
+    results = []
+    for i, (text, error) in enumerate(ocr_results):
+        if error:
+            results.append({"index": i, "status": "error", "message": error})
+            continue
+        matches = book_index.match(text or '', limit=limit)
+        books = {b['book_id']: b for b in store.get_books(book_id for book_id, _ in matches)}
+        results.append({"index": i, "status": "success", "text": text, "matches": [
+            {"book_id": book_id, "title": books[book_id]['book_name'], "score": score}
+            for book_id, score in matches if book_id in books]})
+    return jsonify({"status": "success", "results": results})
+
+@app.route('/api/admin/ocr-match-batch', methods=['POST'])
+@admin_required
+@admitted(slots=ocr_batch_slots)
+def ocr_match_batch():
+    """OCR many cover/spine photos and return ranked catalog candidates for each."""
+    images, limit, error = parse_ocr_batch(request.json)
+    if error:
+        return error
+    return ocr_batch_response(services.process_ocr_batch(images), limit)
+
+def book_labels():
+    """(code, caption) shelf labels for every book, or those in ?ids=B0001,B0002."""
+    book_ids = [i for i in request.args.get('ids', '').split(',') if i]
+    books = store.get_books(book_ids) if book_ids else store.list_books()
+    return [(b['book_id'], b.get('book_name')) for b in books]
+
+def active_borrowal_labels():
+    """(code, caption) labels of the loans not yet returned."""
+    return [(r['borrow_code'], f"{r.get('student_name', '')} - {r.get('book_title', '')}") for r in store.active_borrowals()]
+
+def labels_response(pdf_bytes, filename):
+    if pdf_bytes is None:
+        return jsonify({"status": "error", "message": "Không thể tạo nhãn mã vạch."}), 500
+    return Response(pdf_bytes, mimetype='application/pdf',
+                    headers={'Content-Disposition': f'inline; filename={filename}'})
+
+def svgs_response(svgs):
+    if svgs is None:
+        return jsonify({"status": "error", "message": "Không thể tạo mã vạch."}), 500
+    return jsonify(svgs)
+
+@app.route('/api/admin/barcodes/books', methods=['GET'])
+@admin_required
+@admitted(slots=label_slots)
+def get_book_barcode_labels():
+    """Shelf labels for every book (or ?ids=B0001,B0002) as a printable PDF."""
+    return labels_response(services.generate_barcode_labels(book_labels()), 'nhan-sach.pdf')
+
+@app.route('/api/admin/barcodes/active-borrowals', methods=['GET'])
+@admin_required
+@admitted(slots=label_slots)
+def get_active_borrowal_barcodes():
+    """Borrow codes of all loans not yet returned, as a label PDF or ?format=svg JSON."""
+    if request.args.get('format') == 'svg':
+        return svgs_response(services.generate_barcode_svgs(r['borrow_code'] for r in store.active_borrowals()))
+    return labels_response(services.generate_barcode_labels(active_borrowal_labels()), 'ma-muon-dang-muon.pdf')
 
 @app.route('/api/admin/books/add', methods=['POST'])
 @admin_required
@@ -300,18 +754,61 @@ def add_book():
     data = request.json
     if not data or 'book_name' not in data or 'quantity' not in data:
         return jsonify({"status": "error", "message": "Thiếu thông tin sách."}), 400
-    books = read_json_db('database.json')
     new_book = {
-        "book_id": f"B{int(datetime.now().timestamp())}",
+        "book_id": ids.next('B'),
         "book_name": data['book_name'],
         "author": data.get('author', 'Chưa rõ'),
         "quantity": int(data['quantity']),
         "is_borrowed": False
     }
-    books.append(new_book)
-    write_json_db('database.json', books)
+    store.add_book(new_book)
     return jsonify({"status": "success", "message": "Sách đã được thêm thành công."})
 
+def too_large():
+    return jsonify({"status": "error", "message": f"File quá lớn (tối đa {IMPORT_MAX_BYTES // (1024 * 1024)} MB)."}), 413
+
+@app.route('/api/admin/books/import', methods=['POST'])
+@admin_required
+def import_books():
+    """Queue a bulk import of a CSV (header book_id,book_name,author,quantity) or JSONL catalog.
+
+    The file is sent as multipart `file` or as the raw body; ?format=csv|jsonl
+    overrides detection by extension or content type, ?dry_run=1 only validates.
+    """
+    if request.content_length and request.content_length > IMPORT_MAX_BYTES:
+        return too_large()
+    upload = request.files.get('file')
+    fmt = catalog_io.detect_format(request.args.get('format'), upload.filename if upload else None,
+                                   upload.content_type if upload else request.content_type)
+    if fmt is None:
+        return jsonify({"status": "error", "message": "format phải là csv hoặc jsonl."}), 400
+    import_id = ids.next('I')
+    path = _data_path(os.path.join('imports', f"{import_id}.{fmt}"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if upload:
+        upload.save(path)
+    else:
+        with open(path, 'wb') as f:
+            while chunk := request.stream.read(64 * 1024):
+                f.write(chunk)
+    if not os.path.getsize(path):
+        os.remove(path)
+        return jsonify({"status": "error", "message": "File rỗng."}), 400
+    background_jobs.enqueue('catalog_import', import_id, {
+        'import_id': import_id, 'path': path, 'format': fmt,
+        'dry_run': request.args.get('dry_run') in ('1', 'true')})
+    return jsonify({"status": "success", "import_id": import_id,
+                    "status_url": f"/api/admin/books/import/{import_id}"}), 202
+
+@app.route('/api/admin/books/import/<import_id>', methods=['GET'])
+@admin_required
+def get_import_status(import_id):
+    job = background_jobs.status(import_id)
+    if not job or job['kind'] != 'catalog_import':
+        return jsonify({"status": "error", "message": "Không tìm thấy lượt nhập."}), 404
+    return jsonify({"status": "success", "import_id": import_id, "state": job['state'],
+                    "attempts": job['attempts'], "last_error": job['last_error'], "progress": job['progress']})
+
 @app.route('/api/admin/books/update', methods=['POST'])
 @admin_required
 def update_book():
@@ -319,15 +816,23 @@ def update_book():
     book_id = data.get('book_id')
     if not book_id:
         return jsonify({"status": "error", "message": "Cần có ID sách."}), 400
-    books = read_json_db('database.json')
-    book_to_update = next((book for book in books if book['book_id'] == book_id), None)
-    if not book_to_update:
+    # Only the fields sent are written, so concurrent edits of other fields are kept;
+    # send the book's `rev` to refuse the edit if anything changed since it was read
+    fields = {k: data[k] for k in ('book_name', 'author') if k in data}
+    try:
+        if 'quantity' in data:
+            fields['quantity'] = int(data['quantity'])
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "Số lượng phải là số nguyên."}), 400
+    try:
+        updated = store.update_book(book_id, fields, rev=data.get('rev'))
+    except inventory.RevisionConflict:
+        return jsonify({"status": "error", "message": "Sách vừa được thay đổi, vui lòng tải lại."}), 409
+    except ValueError:
+        return jsonify({"status": "error", "message": "Số lượng không thể ít hơn số bản đang được mượn."}), 409
+    if not updated:
         return jsonify({"status": "error", "message": "Không tìm thấy sách."}), 404
-    book_to_update['book_name'] = data.get('book_name', book_to_update['book_name'])
-    book_to_update['author'] = data.get('author', book_to_update['author'])
-    book_to_update['quantity'] = int(data.get('quantity', book_to_update['quantity']))
-    write_json_db('database.json', books)
-    return jsonify({"status": "success", "message": "Sách đã được cập nhật."})
+    return jsonify({"status": "success", "message": "Sách đã được cập nhật.", "rev": updated['rev']})
 
 @app.route('/api/admin/books/delete', methods=['POST'])
 @admin_required
@@ -336,18 +841,22 @@ def delete_book():
     book_id = data.get('book_id')
     if not book_id:
         return jsonify({"status": "error", "message": "Cần có ID sách."}), 400
-    books = read_json_db('database.json')
-    book_to_delete = next((book for book in books if book['book_id'] == book_id), None)
-    if not book_to_delete:
-        return jsonify({"status": "error", "message": "Không tìm thấy sách."}), 404
-    if book_to_delete.get('is_borrowed'):
+    try:
+        deleted = store.delete_book(book_id, rev=data.get('rev'))
+    except inventory.RevisionConflict:
+        return jsonify({"status": "error", "message": "Sách vừa được thay đổi, vui lòng tải lại."}), 409
+    except ValueError:
         return jsonify({"status": "error", "message": "Không thể xóa sách đang được mượn."}), 409
-    books = [book for book in books if book['book_id'] != book_id]
-    write_json_db('database.json', books)
+    if not deleted:
+        return jsonify({"status": "error", "message": "Không tìm thấy sách."}), 404
     return jsonify({"status": "success", "message": "Sách đã được xóa."})
 
 
+startup_timings['import'] = time.perf_counter() - _IMPORT_STARTED
+
+
 if __name__ == '__main__':
+    create_app(warm=True)
     # Local/dev run: no SSL; Render terminates TLS at the edge
     HOST = os.getenv('HOST', '0.0.0.0')
     PORT = int(os.getenv('PORT', '5001'))
@@ -0,0 +1,307 @@
+"""ASGI entry point, an alternative to `gunicorn app:app`: `uvicorn asgi:app --no-proxy-headers --workers $WEB_CONCURRENCY`.
+
+A sync gunicorn worker is held for the whole of a request, including the
+seconds an OCR.space call takes, so a few slow scans use up every worker.
+Here the endpoints that mostly wait run as coroutines on one event loop per
+worker process:
+
+  /ocr-book-cover, /api/admin/ocr-match-batch   OCR.space awaited on a pooled
+                                                httpx.AsyncClient
+  /api/admin/barcodes/*                         label PDFs and SVGs rendered
+                                                in a process pool
+
+Admin token checks and store reads of these handlers run in threads. Every
+other route is the Flask app itself, called in a thread (at most
+ASGI_THREADS at once). Request bodies are spooled to a temp file, and
+refused with 413 past IMPORT_MAX_BYTES. The native handlers run under a Flask request context
+and reuse the app's helpers, before_request hooks, error handlers and
+after_request hooks (metrics, compression, CORS), so routes, status codes,
+headers and bodies are the same as under gunicorn.
+"""
+import os
+import sys
+import asyncio
+import tempfile
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import anyio
+from flask import request, jsonify
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import app as wsgi
+import services
+import metrics
+import admission
+
+# Threads running the Flask app and blocking helpers, per worker process
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', '40'))
+# Processes rendering barcode labels, per worker process
+ASGI_CPU_WORKERS = int(os.getenv('ASGI_CPU_WORKERS', str(min(os.cpu_count() or 1, 4))))
+# Bytes of a Flask response read in one go; the rest of a longer (streamed) body is read chunk by chunk
+PREFETCH_BYTES = 256 * 1024
+# Request bodies up to this size stay in memory, longer ones (catalog imports) go to a temp file
+SPOOL_BYTES = 1024 * 1024
+
+_threads = None
+_processes = None
+# Native handlers bypass app.wsgi_app, so they apply its X-Forwarded-For handling themselves
+_proxy_fix = ProxyFix(lambda environ, start_response: None, x_for=wsgi.PROXY_HOPS)
+
+
+async def in_thread(fn, *args):
+    """Run a blocking call in the thread pool, in a copy of the caller's context (Flask request, metrics)."""
+    global _threads
+    if _threads is None:
+        _threads = anyio.CapacityLimiter(ASGI_THREADS)
+    return await anyio.to_thread.run_sync(fn, *args, limiter=_threads)
+
+
+async def in_process(fn, *args):
+    """Run a CPU-bound call (a picklable module-level function) in the process pool."""
+    global _processes
+    if _processes is None:
+        # spawn: forking a process that has threads running is unsafe
+        _processes = ProcessPoolExecutor(ASGI_CPU_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return await asyncio.get_running_loop().run_in_executor(_processes, fn, *args)
+
+
+async def render(step, fn, *args):
+    """in_process() for the services renderers, which return None on failure."""
+    try:
+        with metrics.timer(step):
+            return await in_process(fn, *args)
+    except Exception as e:
+        print(f"Error rendering {step} in the process pool: {e}")
+        return None
+
+
+# --- Native handlers: called under the Flask request context, return what a Flask view would ---
+
+async def ocr_book_cover():
+    wsgi.ocr_rate.take(wsgi._client_address())
+    data = request.json
+    if not data or 'image_data' not in data:
+        return jsonify({"status": "error", "message": "No image data."}), 400
+    try:
+        text = await services.process_ocr_for_text_async(data['image_data'])
+        return jsonify({"status": "success", "text": text})
+    except admission.Rejected:
+        raise
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+async def ocr_match_batch():
+    error = await in_thread(wsgi.check_admin)
+    if error is not None:
+        return error
+    async with wsgi.ocr_batch_slots.async_slot():
+        images, limit, error = wsgi.parse_ocr_batch(request.json)
+        if error:
+            return error
+        results = await services.process_ocr_batch_async(images)
+        return await in_thread(wsgi.ocr_batch_response, results, limit)
+
+
+async def book_barcode_labels():
+    error = await in_thread(wsgi.check_admin)
+    if error is not None:
+        return error
+    async with wsgi.label_slots.async_slot():
+        labels = await in_thread(wsgi.book_labels)
+        return wsgi.labels_response(await render('pdf.labels', services.generate_barcode_labels, labels),
+                                    'nhan-sach.pdf')
+
+
+async def active_borrowal_barcodes():
+    error = await in_thread(wsgi.check_admin)
+    if error is not None:
+        return error
+    async with wsgi.label_slots.async_slot():
+        labels = await in_thread(wsgi.active_borrowal_labels)
+        if request.args.get('format') == 'svg':
+            return wsgi.svgs_response(await render('barcode.svg', services.generate_barcode_svgs,
+                                                   [code for code, _ in labels]))
+        return wsgi.labels_response(await render('pdf.labels', services.generate_barcode_labels, labels),
+                                    'ma-muon-dang-muon.pdf')
+
+
+NATIVE_ROUTES = {
+    ('POST', '/ocr-book-cover'): ocr_book_cover,
+    ('POST', '/api/admin/ocr-match-batch'): ocr_match_batch,
+    ('GET', '/api/admin/barcodes/books'): book_barcode_labels,
+    ('GET', '/api/admin/barcodes/active-borrowals'): active_borrowal_barcodes,
+}
+
+
+# --- ASGI <-> Flask ---
+
+def _environ(scope, body, length):
+    """WSGI environ of an ASGI HTTP request whose body is the `length` bytes of the file `body`."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        # The body is all there, chunked or not, as under gunicorn
+        'wsgi.input_terminated': True,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-length':
+            continue
+        key = 'CONTENT_TYPE' if name == 'content-type' else 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _run_wsgi(environ):
+    """Call the Flask app: (status, headers, first chunks of the body, rest of the body or None)."""
+    started = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = int(status.split(' ', 1)[0]), headers
+        return chunks.append
+
+    result = wsgi.app(environ, start_response)
+    body = iter(result)
+    size = 0
+    for chunk in body:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= PREFETCH_BYTES:
+            return started['status'], started['headers'], chunks, (body, result)
+    if hasattr(result, 'close'):
+        result.close()
+    return started['status'], started['headers'], chunks, None
+
+
+async def _native(environ, handler):
+    """Run a native handler the way Flask runs a view; returns the finished response."""
+    flask_app = wsgi.app
+    _proxy_fix(environ, None)
+    with flask_app.request_context(environ):
+        try:
+            rv = flask_app.preprocess_request()
+            if rv is None:
+                rv = await handler()
+        except Exception as e:
+            try:
+                rv = flask_app.handle_user_exception(e)
+            except Exception as e:
+                return flask_app.handle_exception(e)
+        return flask_app.finalize_request(rv)
+
+
+async def _start_response(send, status, headers):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+
+
+async def _too_large():
+    return wsgi.too_large()
+
+
+async def _receive_body(scope, receive, body):
+    """Write the request body to the file `body`; returns its length, None if the
+    client left, or -1 past IMPORT_MAX_BYTES (declared or sent) without reading the rest."""
+    declared = dict(scope['headers']).get(b'content-length')
+    if declared and declared.isdigit() and int(declared) > wsgi.IMPORT_MAX_BYTES:
+        return -1
+    length = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        length += len(chunk)
+        if length > wsgi.IMPORT_MAX_BYTES:
+            return -1
+        body.write(chunk)
+        if not message.get('more_body'):
+            body.seek(0)
+            return length
+
+
+async def _send_response(send, response):
+    await _start_response(send, response.status_code, response.headers.to_wsgi_list())
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+async def _http(scope, receive, send):
+    with tempfile.SpooledTemporaryFile(SPOOL_BYTES) as body:
+        length = await _receive_body(scope, receive, body)
+        if length is None:
+            return
+        if wsgi.store is None:
+            await in_thread(functools.partial(wsgi.create_app, warm=True))
+        environ = _environ(scope, body, max(length, 0))
+        if length < 0:
+            # Answered by the app, so hooks (CORS, metrics) run as for the import route's own 413
+            await _send_response(send, await _native(environ, _too_large))
+            return
+
+        handler = NATIVE_ROUTES.get((scope['method'], scope['path']))
+        if handler is not None:
+            await _send_response(send, await _native(environ, handler))
+            return
+        await _wsgi_response(send, environ)
+
+
+async def _wsgi_response(send, environ):
+    status, headers, chunks, rest = await in_thread(_run_wsgi, environ)
+    await _start_response(send, status, headers)
+    for chunk in chunks:
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    if rest is not None:
+        body, result = rest
+        try:
+            while (chunk := await in_thread(next, body, None)) is not None:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if hasattr(result, 'close'):
+                await in_thread(result.close)
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                # Each worker loads the catalog and builds its indexes before taking requests
+                await in_thread(functools.partial(wsgi.create_app, warm=True))
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await services.close_async_clients()
+            if _processes is not None:
+                _processes.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'http':
+        await _http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
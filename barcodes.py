@@ -0,0 +1,47 @@
+from xml.sax.saxutils import escape
+
+from barcode import Code128
+
+
+def code128_bars(code):
+    """Code128 bars of `code` as (start_module, width_in_modules) runs, plus the total module count."""
+    modules = Code128(code).build()[0]
+    bars, start = [], None
+    for i, module in enumerate(modules):
+        if module == '1' and start is None:
+            start = i
+        elif module != '1' and start is not None:
+            bars.append((start, i - start))
+            start = None
+    if start is not None:
+        bars.append((start, len(modules) - start))
+    return bars, len(modules)
+
+
+def draw_barcode(pdf, code, x, y, w, h):
+    """Draw `code` as filled vector rectangles into an fpdf2 document, `w` x `h` mm at (x, y)."""
+    bars, total = code128_bars(code)
+    module = w / total
+    pdf.set_fill_color(0, 0, 0)
+    for start, width in bars:
+        pdf.rect(x + start * module, y, width * module, h, style='F')
+
+
+def barcode_svg(code, module_width=0.2, height=15.0, quiet_zone=6.5, text=True, font_size=3.0):
+    """Standalone SVG (mm units) for `code`; each run of bars is one <rect>."""
+    bars, total = code128_bars(code)
+    width = total * module_width + 2 * quiet_zone
+    full_height = height + (font_size + 2 if text else 0) + 2
+    rects = ''.join(
+        f'<rect x="{quiet_zone + start * module_width:.3f}" y="1" width="{run * module_width:.3f}" height="{height}"/>'
+        for start, run in bars)
+    label = (f'<text x="{width / 2:.3f}" y="{height + 2 + font_size:.3f}" font-size="{font_size}" '
+             f'font-family="monospace" text-anchor="middle">{escape(code)}</text>') if text else ''
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.3f}mm" height="{full_height:.3f}mm" '
+            f'viewBox="0 0 {width:.3f} {full_height:.3f}"><rect width="100%" height="100%" fill="white"/>'
+            f'<g fill="black">{rects}</g>{label}</svg>')
+
+
+def barcode_svgs(codes, **options):
+    """{code: svg} for many codes at once (e.g. every book_id for shelf labels)."""
+    return {code: barcode_svg(code, **options) for code in dict.fromkeys(codes)}
@@ -0,0 +1 @@
+"""Benchmarks for LibraNCT. Run from the repository root, e.g. `python -m bench.bench_receipts`."""
@@ -0,0 +1,167 @@
+"""Throughput of `gunicorn app:app` (sync workers) against `uvicorn asgi:app` on I/O-bound routes.
+
+Both servers run as subprocesses with the same number of worker processes,
+each on its own copy of one synthetic catalog, and talk to the local OCR and
+SMTP stand-ins (bench.stubs), the OCR stand-in answering after --ocr-latency
+seconds. --concurrency keep-alive clients call each route for --duration
+seconds (bench.loadtest). The OCR cache is turned off so every scan reaches
+the stand-in, and rate limits and bulkheads are raised so they cap neither
+server. gunicorn uses the repository's gunicorn.conf.py.
+
+    python -m bench.async_mode [--books 5000] [--workers 2] [--concurrency 32] [--duration 10]
+        [--ocr-latency 0.3] [--routes ocr_book_cover,borrow] [--out async.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import synthetic, stubs, loadtest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES = 'ocr_book_cover,ocr_match_batch,barcodes_books,borrow,search,admin_stats'
+# Bulkheads out of the way (stubs.install lifts the rate limits): this compares the servers, not the guards
+SETTINGS = {
+    'OCR_CACHE_MAX_ENTRIES': '0',
+    'OCR_MAX_CONCURRENCY': '256', 'OCR_QUEUE_WAIT': '30',
+    'OCR_BATCH_MAX_CONCURRENCY': '256', 'LABELS_MAX_CONCURRENCY': '256',
+    'REMINDERS_ENABLED': '0', 'LOG_LEVEL': 'WARNING',
+}
+
+
+# --- server processes (factories are called in the server, so the stubs apply there) ---
+def wsgi_app():
+    """Factory for gunicorn, run in its preloading master like gunicorn.conf.py's wsgi_app."""
+    stubs.stub_firebase()
+    import app
+    return app.create_app(start_background=False, warm=True)
+
+
+def asgi_app():
+    """Factory for uvicorn, run in every worker."""
+    stubs.stub_firebase()
+    import asgi
+    return asgi.app
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, data_dir, port, workers):
+    if kind == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+                   '--workers', str(workers), '--bind', f"127.0.0.1:{port}", '--pythonpath', ROOT,
+                   'bench.async_mode:wsgi_app()']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', '--factory', 'bench.async_mode:asgi_app', '--app-dir', ROOT,
+                   '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port),
+                   '--no-proxy-headers', '--log-level', 'warning', '--no-access-log']
+    env = dict(os.environ, DATA_DIR=data_dir)
+    # Own process group, so stopping it also stops the workers and their process pools
+    return subprocess.Popen(command, cwd=ROOT, env=env, start_new_session=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_up(base_url, process, timeout=120):
+    import requests as http
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode}")
+        try:
+            if http.get(base_url + '/search-books?q=a', timeout=5).status_code == 200:
+                return
+        except http.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server not up after {timeout}s")
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def run(kind, source_dir, summary, args, wanted):
+    data_dir = tempfile.mkdtemp(prefix=f'libra-{kind}-')
+    shutil.copytree(source_dir, data_dir, dirs_exist_ok=True)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = start_server(kind, data_dir, port, args.workers)
+    results = {}
+    try:
+        wait_until_up(base_url, process)
+        workload = loadtest.Workload(summary, seed=args.seed)
+        for n, (name, builder) in enumerate(workload.routes()):
+            if name in wanted:
+                results[name] = loadtest.run_http(base_url, workload, builder, args.duration, args.concurrency, args.seed + n)
+    finally:
+        stop_server(process)
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+def print_comparison(results):
+    sync, async_ = results['gunicorn'], results['uvicorn']
+    print(f"\n{'route':18} {'gunicorn rps':>13} {'uvicorn rps':>12} {'x':>6} {'gunicorn p95':>13} {'uvicorn p95':>12}  errors")
+    for name in sync:
+        a, b = sync[name], async_.get(name)
+        if not b:
+            continue
+        ratio = b['throughput_rps'] / a['throughput_rps'] if a['throughput_rps'] else 0.0
+        print(f"{name:18} {a['throughput_rps']:13.1f} {b['throughput_rps']:12.1f} {ratio:6.2f} "
+              f"{a['p95_ms']:11.0f}ms {b['p95_ms']:10.0f}ms  {a['errors']}/{b['errors']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY', '2')),
+                        help='worker processes of each server')
+    parser.add_argument('--concurrency', type=int, default=32, help='parallel clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per route')
+    parser.add_argument('--ocr-latency', type=float, default=0.3, help='OCR stand-in latency (s)')
+    parser.add_argument('--routes', default=ROUTES, help='comma-separated bench.loadtest route names')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='write results JSON here')
+    args = parser.parse_args(argv)
+
+    source_dir = tempfile.mkdtemp(prefix='libra-async-')
+    try:
+        summary = synthetic.generate(source_dir, args.books, seed=args.seed)
+        stubs.install(source_dir, args.ocr_latency)
+        os.environ.update(SETTINGS, OCR_POOL_SIZE=str(args.concurrency))
+        wanted = set(args.routes.split(','))
+        results = {'meta': {'books': summary['books'], 'workers': args.workers, 'concurrency': args.concurrency,
+                            'duration': args.duration, 'ocr_latency': args.ocr_latency, 'cpus': os.cpu_count(),
+                            'commit': loadtest.git_commit()}}
+        for kind in ('gunicorn', 'uvicorn'):
+            results[kind] = run(kind, source_dir, summary, args, wanted)
+            loadtest.print_table(kind, results[kind])
+    finally:
+        shutil.rmtree(source_dir, ignore_errors=True)
+    print_comparison(results)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Batch OCR-to-catalog matching against the local OCR stand-in: throughput and top-1 accuracy.
+
+Each catalog title is "photographed" with OCR-style damage (lost diacritics,
+upper case, a dropped letter, publisher noise) and matched back to its book.
+
+    python -m bench.bench_ocr_match [--latency 0.3] [--concurrency 1,4,8]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.ocr_standin import start, make_image
+from search_index import SearchIndex, fold
+from ocr_cache import OCRCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def damage(title, rng):
+    text = fold(title) if rng.random() < 0.5 else title
+    text = text.upper() if rng.random() < 0.5 else text
+    if len(text) > 8:
+        i = rng.randrange(len(text))
+        text = text[:i] + text[i + 1:]
+    return f"{text}\n{rng.choice(['NXB Kim Đồng', 'NHÀ XUẤT BẢN TRẺ', 'Tái bản lần 3', ''])}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.3, help='simulated OCR service latency (s)')
+    parser.add_argument('--concurrency', default='1,4,8')
+    args = parser.parse_args(argv)
+
+    server, url = start(latency=args.latency)
+    os.environ['OCR_SPACE_URL'] = url
+    os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='libranct-bench-')
+    import services
+
+    with open(os.path.join(ROOT, 'database.json'), encoding='utf-8') as f:
+        books = json.load(f)
+    index = SearchIndex(lambda: books)
+    rng = random.Random(7)
+    images = [make_image(damage(book['book_name'], rng)) for book in books]
+    expected = [book['book_id'] for book in books]
+
+    def run(workers):
+        start_time = time.perf_counter()
+        results = services.process_ocr_batch(images)
+        elapsed = time.perf_counter() - start_time
+        top1 = [index.match(text or '', limit=1) for text, _ in results]
+        hits = sum(1 for match, book_id in zip(top1, expected) if match and match[0][0] == book_id)
+        return len(images) / elapsed, hits
+
+    for workers in [int(n) for n in args.concurrency.split(',')]:
+        services.ocr_executor = ThreadPoolExecutor(max_workers=workers)
+        services.ocr_cache = OCRCache(os.path.join(tempfile.mkdtemp(prefix='libranct-bench-'), 'ocr_cache.db'))
+        rate, hits = run(workers)
+        print(f"concurrency {workers:2d}: {rate:8.1f} images/s  top-1 {hits}/{len(images)}")
+    rate, hits = run(workers)
+    print(f"cached rerun:   {rate:8.1f} images/s  top-1 {hits}/{len(images)}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
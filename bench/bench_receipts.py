@@ -0,0 +1,89 @@
+"""Receipts/second: the original per-call receipt code vs receipts.ReceiptRenderer (PNG and vector barcode).
+
+    python -m bench.bench_receipts [--count 200]
+"""
+import os
+import sys
+import time
+import base64
+import argparse
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fpdf import FPDF
+from PIL import Image
+from barcode import Code128
+from barcode.writer import ImageWriter
+
+from receipts import ReceiptRenderer, FONT_DIR
+
+DETAILS = {
+    'borrow_code': 'M261017093015', 'book_title': 'Những gương mặt không thể nào quên',
+    'student_name': 'Nguyễn Thị Ánh Dương', 'student_class': '11A2',
+    'borrow_date': '17/10/2026', 'return_date': '24/10/2026',
+}
+
+
+def legacy_generate_pdf_receipt(details, barcode_buffer):
+    """services.generate_pdf_receipt as it was: fonts parsed per call, PIL round-trip, base64 output."""
+    barcode_buffer.seek(0)
+    img = Image.open(barcode_buffer)
+    clean_image_buffer = BytesIO()
+    img.save(clean_image_buffer, format="PNG")
+    clean_image_buffer.seek(0)
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.add_font('BeVietnamPro', '', os.path.join(FONT_DIR, 'BeVietnamPro-Regular.ttf'))
+    pdf.add_font('BeVietnamPro', 'B', os.path.join(FONT_DIR, 'BeVietnamPro-Bold.ttf'))
+    pdf.set_font('BeVietnamPro', 'B', 16)
+    pdf.cell(0, 10, 'PHIẾU MƯỢN SÁCH - Thư viện LibraNCT', 0, 1, 'C')
+    pdf.ln(10)
+    pdf.set_font('BeVietnamPro', '', 12)
+    pdf.cell(0, 8, f"Tên sách: {details['book_title']}", 0, 1)
+    pdf.cell(0, 8, f"Học sinh: {details['student_name']} - Lớp: {details['student_class']}", 0, 1)
+    pdf.cell(0, 8, f"Ngày mượn: {details['borrow_date']}", 0, 1)
+    pdf.set_font('BeVietnamPro', 'B', 12)
+    pdf.cell(0, 8, f"Hạn trả: {details['return_date']}", 0, 1)
+    pdf.ln(5)
+    pdf.image(clean_image_buffer, x=70, y=pdf.get_y(), w=70, type='PNG')
+    pdf.ln(25)
+    pdf.set_font('BeVietnamPro', '', 10)
+    pdf.cell(0, 8, 'Vui lòng đưa phiếu này cho thủ thư để nhận sách.', 0, 1, 'C')
+    pdf.cell(0, 8, 'Cảm ơn bạn đã sử dụng dịch vụ của LibraNCT!', 0, 1, 'C')
+    return base64.b64encode(pdf.output()).decode('utf-8')
+
+
+def measure(render, count):
+    render()  # warm-up (template and font cache for the new renderer)
+    start = time.perf_counter()
+    for _ in range(count):
+        size = len(render())
+    elapsed = time.perf_counter() - start
+    return count / elapsed, size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    def png_barcode():
+        barcode = BytesIO()
+        Code128(DETAILS['borrow_code'], writer=ImageWriter()).write(barcode)
+        return barcode
+    renderer = ReceiptRenderer()
+
+    # Each run includes making the barcode, as services.deliver_borrow_receipt does
+    before, before_size = measure(lambda: base64.b64decode(legacy_generate_pdf_receipt(DETAILS, png_barcode())), args.count)
+    png, png_size = measure(lambda: renderer.render(DETAILS, png_barcode()), args.count)
+    after, after_size = measure(lambda: renderer.render(DETAILS), args.count)
+    print(f"before:        {before:7.1f} receipts/s  {before_size:7d} bytes/receipt")
+    print(f"template+PNG:  {png:7.1f} receipts/s  {png_size:7d} bytes/receipt")
+    print(f"template+bars: {after:7.1f} receipts/s  {after_size:7d} bytes/receipt")
+    print(f"speed-up: {after / before:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
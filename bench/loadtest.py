@@ -0,0 +1,389 @@
+"""Load test and micro-benchmarks for every app.py route, on synthetic data and fully offline.
+
+Generates a catalog (bench.synthetic), starts the local stand-ins
+(bench.stubs), imports app and drives each route in turn:
+  client  sequential requests through the Flask test client (per-route cost)
+  http    a threaded HTTP server hit by --concurrency keep-alive clients for
+          --duration seconds per route (throughput and tail latency)
+Reports p50/p95/p99/max latency, throughput, status codes and peak RSS of
+this process per route, and saves everything as JSON; --compare checks a
+run against an earlier JSON file. Requests refused with 429 are counted as
+`rejected` and left out of the latency and throughput figures.
+
+    python -m bench.loadtest [--books 10000] [--backend sqlite] [--mode client,http]
+        [--requests 200] [--duration 5] [--concurrency 8] [--out results.json] [--compare old.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import synthetic, stubs
+from bench.ocr_standin import make_image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# --- measurement ---
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list (0 for an empty one)."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))]
+
+
+def current_rss():
+    """Resident set size of this process in bytes (peak so far where /proc is missing)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+class RssSampler:
+    """Highest RSS seen while the `with` block runs, sampled every `interval` seconds."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def summarize(latencies, statuses, elapsed, peak_rss):
+    """Figures for one route; `latencies` are those of the requests not rejected with 429."""
+    latencies = sorted(latencies)
+    ms = lambda s: round(s * 1000, 3)
+    return {
+        'requests': len(latencies),
+        'rejected': statuses.get('429', 0),
+        'errors': sum(n for code, n in statuses.items() if code == 'exception' or int(code) >= 500),
+        'statuses': dict(statuses),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]) if latencies else 0.0,
+        'peak_rss_mb': round(peak_rss / (1024 * 1024), 1),
+    }
+
+
+# --- workload ---
+class Workload:
+    """Request builders for every route, sharing state (loans made, books imported) between them.
+
+    A builder takes a per-thread Random and returns a request dict
+    {method, path, json | data, headers, content_type, after} or None when it
+    has nothing left to do; `after(status, body)` records what the response created.
+    """
+
+    def __init__(self, summary, seed=7):
+        self.book_ids = summary['book_ids']
+        self.emails = summary['emails']
+        self.words = sorted({w for t in summary['titles'] for w in t.split() if len(w) > 3})
+        self.open_codes = deque(summary['open_codes'])    # loans that can be returned
+        self.status_codes = deque(maxlen=1000)   # codes borrowed in this run, which have receipt jobs
+        self.imported_ids = deque()
+        self.import_ids = deque(maxlen=1000)
+        self._serial = 0
+        self._lock = threading.Lock()
+        rng = random.Random(seed)
+        self.images = [make_image(f"{rng.choice(summary['titles'])}\nNXB Giáo dục") for _ in range(20)]
+        self.admin = stubs.admin_headers()
+
+    def _next(self):
+        with self._lock:
+            self._serial += 1
+            return self._serial
+
+    def _borrowed(self, status, body):
+        if status == 200:
+            self.open_codes.append(body['borrow_code'])
+            self.status_codes.append(body['borrow_code'])
+
+    def _imported(self, status, body):
+        if status == 202:
+            self.import_ids.append(body['import_id'])
+
+    def routes(self):
+        """[(name, builder)] in the order they are run: creators before consumers."""
+        admin = self.admin
+        def pop(queue):
+            try:
+                return queue.popleft()
+            except IndexError:
+                return None
+        def import_csv(rng):
+            n = self._next()
+            ids = [f"BX{n:05d}{i:02d}" for i in range(20)]
+            self.imported_ids.extend(ids)
+            rows = ['book_id,book_name,author,quantity'] + [
+                f"{book_id},{rng.choice(self.words)} {rng.choice(self.words)} {book_id},Bench,2" for book_id in ids]
+            return {'method': 'POST', 'path': '/api/admin/books/import', 'data': '\n'.join(rows).encode(),
+                    'headers': admin, 'content_type': 'text/csv', 'after': self._imported}
+        return [
+            ('search', lambda rng: {'path': f"/search-books?q={rng.choice(self.words)}&limit=50"}),
+            ('search_typeahead', lambda rng: {'path': f"/search-books?q={rng.choice(self.words)[:3]}&limit=20"}),
+            ('dashboard', lambda rng: {'path': f"/dashboard-data/{rng.choice(self.emails)}"}),
+            ('user_borrowed_books', lambda rng: {'path': f"/user-borrowed-books?email={rng.choice(self.emails)}"}),
+            ('borrow', lambda rng: {'method': 'POST', 'path': '/process-borrow-request', 'after': self._borrowed, 'json': {
+                'book': {'id': rng.choice(self.book_ids), 'title': 'bench'},
+                'form': {'name': 'Bench', 'class': '10A1', 'borrow_duration': rng.choice((3, 7, 14))},
+                'userEmail': rng.choice(self.emails)}}),
+            ('borrow_status', lambda rng: {'path': f"/borrow-status/{rng.choice(self.status_codes)}"} if self.status_codes else None),
+            ('return', lambda rng: (lambda code: code and {'method': 'POST', 'path': '/process-return-request',
+                                                           'json': {'borrow_code': code}})(pop(self.open_codes))),
+            ('cloudinary_signature', lambda rng: {'path': '/generate-cloudinary-signature'}),
+            ('ocr_book_cover', lambda rng: {'method': 'POST', 'path': '/ocr-book-cover', 'json': {'image_data': rng.choice(self.images)}}),
+            ('admin_stats', lambda rng: {'path': '/api/admin/stats', 'headers': admin}),
+            ('admin_books_page', lambda rng: {'path': '/api/admin/all-books?limit=50&status=available', 'headers': admin}),
+            ('admin_borrowals_page', lambda rng: {'path': '/api/admin/all-borrowals?limit=50&status=active', 'headers': admin}),
+            ('admin_books_export', lambda rng: {'path': '/api/admin/all-books', 'headers': admin}),
+            ('admin_borrowals_csv', lambda rng: {'path': '/api/admin/all-borrowals?format=csv', 'headers': admin}),
+            ('ocr_match_batch', lambda rng: {'method': 'POST', 'path': '/api/admin/ocr-match-batch', 'headers': admin,
+                                             'json': {'images': rng.sample(self.images, 5)}}),
+            ('barcodes_books', lambda rng: {'path': f"/api/admin/barcodes/books?ids={','.join(rng.sample(self.book_ids, min(24, len(self.book_ids))))}",
+                                            'headers': admin}),
+            ('barcodes_active', lambda rng: {'path': '/api/admin/barcodes/active-borrowals?format=svg', 'headers': admin}),
+            ('books_add', lambda rng: {'method': 'POST', 'path': '/api/admin/books/add', 'headers': admin,
+                                       'json': {'book_name': f"{rng.choice(self.words)} bench", 'quantity': 2}}),
+            ('books_update', lambda rng: {'method': 'POST', 'path': '/api/admin/books/update', 'headers': admin,
+                                          'json': {'book_id': rng.choice(self.book_ids), 'author': f"Bench {rng.randrange(100)}"}}),
+            ('books_import', import_csv),
+            ('import_status', lambda rng: {'path': f"/api/admin/books/import/{rng.choice(self.import_ids)}", 'headers': admin}
+                              if self.import_ids else None),
+            ('books_delete', lambda rng: (lambda book_id: book_id and {'method': 'POST', 'path': '/api/admin/books/delete',
+                                                                       'headers': admin, 'json': {'book_id': book_id}})(pop(self.imported_ids))),
+        ]
+
+
+# --- drivers ---
+def run_client(app, workload, builder, requests, seed):
+    """`requests` sequential calls through the Flask test client."""
+    client, rng = app.test_client(), random.Random(seed)
+    latencies, statuses = [], Counter()
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        for _ in range(requests):
+            req = builder(rng)
+            if req is None:
+                break
+            t = time.perf_counter()
+            response = client.open(req['path'], method=req.get('method', 'GET'), json=req.get('json'),
+                                   data=req.get('data'), headers=req.get('headers'), content_type=req.get('content_type'))
+            body = response.get_data()
+            if response.status_code != 429:
+                latencies.append(time.perf_counter() - t)
+            statuses[str(response.status_code)] += 1
+            if req.get('after'):
+                req['after'](response.status_code, json.loads(body))
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, statuses, elapsed, rss.peak)
+
+
+def run_http(base_url, workload, builder, duration, concurrency, seed):
+    """`concurrency` keep-alive clients calling one route for `duration` seconds."""
+    import requests as http
+    latencies, statuses, lock = [], Counter(), threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(n):
+        session, rng = http.Session(), random.Random(seed + n)
+        mine, codes = [], Counter()
+        while time.perf_counter() < deadline:
+            req = builder(rng)
+            if req is None:
+                break
+            headers = dict(req.get('headers') or {})
+            if req.get('content_type'):
+                headers['Content-Type'] = req['content_type']
+            t = time.perf_counter()
+            try:
+                response = session.request(req.get('method', 'GET'), base_url + req['path'], json=req.get('json'),
+                                           data=req.get('data'), headers=headers, timeout=60)
+                body = response.content
+            except http.RequestException:
+                codes['exception'] += 1
+                continue
+            if response.status_code != 429:
+                mine.append(time.perf_counter() - t)
+            codes[str(response.status_code)] += 1
+            if req.get('after'):
+                req['after'](response.status_code, json.loads(body))
+        with lock:
+            latencies.extend(mine)
+            statuses.update(codes)
+
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(client, range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, statuses, elapsed, rss.peak)
+
+
+def serve(app):
+    """Threaded WSGI server on a free local port. Returns (server, base URL)."""
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-http', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def wait_for_imports(workload, app, timeout=60):
+    """Let queued bulk imports finish so the delete route has books to remove."""
+    client, deadline = app.test_client(), time.time() + timeout
+    for import_id in list(workload.import_ids):
+        while time.time() < deadline:
+            job = client.get(f"/api/admin/books/import/{import_id}", headers=workload.admin).get_json()
+            if job.get('state') in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+
+
+# --- reporting ---
+def print_table(mode, results):
+    print(f"\n[{mode}]")
+    print(f"{'route':24} {'reqs':>6} {'429s':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'rss MB':>7}  statuses")
+    for name, r in results.items():
+        print(f"{name:24} {r['requests']:6d} {r.get('rejected', 0):6d} {r['throughput_rps']:9.1f} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} "
+              f"{r['p99_ms']:9.2f} {r['max_ms']:9.2f} {r['peak_rss_mb']:7.1f}  {r['statuses']}")
+
+
+def compare(current, baseline, tolerance):
+    """Print p95/throughput changes per route; returns the routes that regressed beyond `tolerance`."""
+    regressed = []
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} ({baseline['meta'].get('timestamp')}):")
+    for mode in ('client', 'http'):
+        for name, now in current.get(mode, {}).items():
+            before = baseline.get(mode, {}).get(name)
+            if not before or not before['requests'] or not now['requests']:
+                continue
+            p95 = now['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+            rps = now['throughput_rps'] / before['throughput_rps'] - 1 if before['throughput_rps'] else 0.0
+            flag = p95 > tolerance or rps < -tolerance
+            if flag:
+                regressed.append(f"{mode}/{name}")
+            print(f"  {mode:6} {name:24} p95 {p95:+7.1%}  throughput {rps:+7.1%}{'  REGRESSION' if flag else ''}")
+    return regressed
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--borrowals', type=int, help='default: half the number of books')
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--data-dir', help='generate into (and keep) this directory instead of a temp one')
+    parser.add_argument('--mode', default='client,http', help='comma-separated: client, http')
+    parser.add_argument('--routes', help='comma-separated subset of routes to run')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route in client mode')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per route in http mode')
+    parser.add_argument('--concurrency', type=int, default=8, help='parallel clients in http mode')
+    parser.add_argument('--ocr-latency', type=float, default=0.05, help='OCR stand-in latency (s)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='write results JSON here')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95/throughput change before flagging')
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='libra-bench-')
+    started = time.perf_counter()
+    summary = synthetic.generate(data_dir, args.books, args.borrowals, seed=args.seed)
+    os.environ['STORAGE_BACKEND'] = args.backend
+    if args.backend == 'sqlite':
+        import storage
+        storage.migrate_json_to_sqlite(data_dir)
+    print(f"Generated {summary['books']} books / {summary['borrowals']} borrow records in {data_dir} "
+          f"({time.perf_counter() - started:.1f}s)")
+    stubs.install(data_dir, args.ocr_latency)
+
+    rss_before = current_rss()
+    started = time.perf_counter()
+    import app as appmod
+    application = appmod.create_app()
+    appmod.store.refresh()
+    load_seconds = time.perf_counter() - started
+    print(f"app import + data load: {load_seconds:.2f}s, RSS {rss_before / 2**20:.0f} -> {current_rss() / 2**20:.0f} MB")
+
+    wanted = set(args.routes.split(',')) if args.routes else None
+    results = {'meta': {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(), 'python': platform.python_version(),
+        'platform': platform.platform(), 'cpus': os.cpu_count(), 'backend': args.backend,
+        'books': summary['books'], 'copies': summary['copies'], 'borrowals': summary['borrowals'],
+        'requests': args.requests, 'duration': args.duration, 'concurrency': args.concurrency,
+        'ocr_latency': args.ocr_latency, 'load_seconds': round(load_seconds, 3),
+    }}
+    modes = [m.strip() for m in args.mode.split(',') if m.strip()]
+    workload = Workload(summary, seed=args.seed)
+    for mode in modes:
+        server, base_url = serve(application) if mode == 'http' else (None, None)
+        results[mode] = {}
+        for n, (name, builder) in enumerate(workload.routes()):
+            if wanted and name not in wanted:
+                continue
+            if name == 'books_delete':
+                wait_for_imports(workload, application)
+            if mode == 'client':
+                results[mode][name] = run_client(application, workload, builder, args.requests, args.seed + n)
+            else:
+                results[mode][name] = run_http(base_url, workload, builder, args.duration, args.concurrency, args.seed + n)
+        if server:
+            server.shutdown()
+        print_table(mode, results[mode])
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.out}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressed = compare(results, json.load(f), args.tolerance)
+        if regressed:
+            print(f"{len(regressed)} routes regressed by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
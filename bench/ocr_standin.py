@@ -0,0 +1,78 @@
+"""Local stand-in for the OCR.space parse endpoint, for benchmarks and offline runs.
+
+The "recognized" text of an image is whatever its PNG `ParsedText` text
+chunk holds (see make_image), returned after an optional fixed latency.
+
+    python -m bench.ocr_standin [--port 8089] [--latency 0.3]
+    OCR_SPACE_URL=http://127.0.0.1:8089/parse/image python app.py
+"""
+import io
+import json
+import time
+import base64
+import argparse
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, PngImagePlugin
+
+
+def make_image(text, size=(320, 480)):
+    """Base64 PNG whose stand-in OCR result is `text`."""
+    info = PngImagePlugin.PngInfo()
+    info.add_text('ParsedText', text)
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, format='PNG', pnginfo=info)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+
+    def do_POST(self):
+        self.server.requests += 1
+        form = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('ascii'))
+        image = form.get('base64image', [''])[0].partition(',')[2]
+        try:
+            text = Image.open(io.BytesIO(base64.b64decode(image))).info.get('ParsedText', '')
+            result = {'IsErroredOnProcessing': False, 'ParsedResults': [{'ParsedText': text}]}
+        except Exception as e:
+            result = {'IsErroredOnProcessing': True, 'ErrorMessage': [str(e)], 'ParsedResults': None}
+        time.sleep(self.latency)
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start(port=0, latency=0.0):
+    """Serve in a daemon thread. Returns (server, parse URL); `server.requests` counts the calls."""
+    handler = type('Handler', (_Handler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, name='ocr-standin', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/parse/image"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    args = parser.parse_args(argv)
+    server, url = start(args.port, args.latency)
+    print(f"OCR stand-in on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
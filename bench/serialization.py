@@ -0,0 +1,108 @@
+"""Bytes and milliseconds: pretty vs compact snapshots, stdlib vs fast JSON responses, gzip/brotli.
+
+On a synthetic catalog (bench.synthetic):
+  snapshot  database.json/borrowers.json written the old way (json, indent=4)
+            and by write_json_db, then read back by read_json_db
+  response  the /api/admin/all-books body from Flask's default provider and
+            from FastJSONProvider, then compressed as response_encoding does
+
+    python -m bench.serialization [--books 100000] [--repeat 3] [--out serialization.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from bench import synthetic
+import serialization
+import response_encoding
+from catalog_store import read_json_db, write_json_db
+
+
+def best_ms(fn, repeat):
+    """(fastest run in ms, last result)."""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def write_pretty(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def measure(data_dir, repeat):
+    results = {'encoder': 'orjson' if serialization.orjson else 'json',
+               'brotli': response_encoding.brotli is not None, 'snapshot': {}, 'response': {}}
+    for name in ('database.json', 'borrowers.json'):
+        data = read_json_db(os.path.join(data_dir, name))
+        pretty, compact = os.path.join(data_dir, 'pretty-' + name), os.path.join(data_dir, 'compact-' + name)
+        pretty_write, _ = best_ms(lambda: write_pretty(pretty, data), repeat)
+        compact_write, _ = best_ms(lambda: write_json_db(compact, data), repeat)
+        pretty_read, _ = best_ms(lambda: read_json_db(pretty), repeat)
+        compact_read, _ = best_ms(lambda: read_json_db(compact), repeat)
+        results['snapshot'][name] = row = {
+            'records': len(data),
+            'pretty_bytes': os.path.getsize(pretty), 'compact_bytes': os.path.getsize(compact),
+            'pretty_write_ms': pretty_write, 'compact_write_ms': compact_write,
+            'pretty_read_ms': pretty_read, 'compact_read_ms': compact_read}
+        print(f"{name}: {row['records']} records, {row['pretty_bytes'] / 2**20:.1f} MB pretty -> "
+              f"{row['compact_bytes'] / 2**20:.1f} MB compact; write {pretty_write:.0f} -> {compact_write:.0f} ms; "
+              f"read {pretty_read:.0f} (legacy file) / {compact_read:.0f} ms")
+
+    books = read_json_db(os.path.join(data_dir, 'database.json'))
+    app = Flask(__name__)
+    stdlib_ms, stdlib_body = best_ms(lambda: DefaultJSONProvider(app).dumps(books), repeat)
+    fast_ms, fast_body = best_ms(lambda: response_encoding.FastJSONProvider(app).dumps(books), repeat)
+    fast_body = fast_body.encode('utf-8')
+    row = results['response']['all-books'] = {
+        'stdlib_ms': stdlib_ms, 'stdlib_bytes': len(stdlib_body.encode('utf-8')),
+        'fast_ms': fast_ms, 'fast_bytes': len(fast_body)}
+    print(f"all-books body ({len(books)} books): stdlib {stdlib_ms:.0f} ms / {row['stdlib_bytes'] / 2**20:.1f} MB, "
+          f"fast {fast_ms:.0f} ms / {row['fast_bytes'] / 2**20:.1f} MB")
+    for encoding, level in (('gzip', {'gzip': response_encoding.GZIP_LEVEL}), ('br', {'br': response_encoding.BROTLI_QUALITY})):
+        if encoding == 'br' and not response_encoding.brotli:
+            continue
+        def encode():
+            process, finish = response_encoding._compressor(encoding, level)
+            return process(fast_body) + finish()
+        ms, compressed = best_ms(encode, repeat)
+        row[f'{encoding}_ms'], row[f'{encoding}_bytes'] = ms, len(compressed)
+        print(f"  {encoding}: {len(compressed) / 2**20:.2f} MB ({len(compressed) / len(fast_body):.0%}) in {ms:.0f} ms")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', help='write results JSON here')
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix='libra-serialization-')
+    try:
+        synthetic.generate(data_dir, args.books)
+        results = measure(data_dir, args.repeat)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
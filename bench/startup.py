@@ -0,0 +1,115 @@
+"""Startup time report: `import app`, each create_app() phase and the costliest imports, in fresh processes.
+
+Every run is a new interpreter (as a gunicorn worker boot or a cold start
+would be) on a synthetic catalog. Prints the median per phase, cold
+(create_app()) and warm (create_app(warm=True), what a preloading master
+does), plus the modules app.py imports ranked by cumulative import time
+from `python -X importtime`.
+
+    python -m bench.startup [--books 10000] [--backend sqlite] [--runs 5] [--top 15] [--out startup.json]
+"""
+import os
+import sys
+import json
+import argparse
+import shutil
+import tempfile
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import sys, json, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app(start_background=False, warm={warm})
+print('STARTUP ' + json.dumps(dict(app.startup_timings, import_total=imported - started,
+                                   total=time.perf_counter() - started)))
+"""
+
+
+def run_once(data_dir, backend, warm):
+    """({phase: seconds}, [(module, cumulative seconds)] for app's direct imports) from one fresh process."""
+    env = dict(os.environ, DATA_DIR=data_dir, STORAGE_BACKEND=backend)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD.format(root=ROOT, warm=warm)],
+                          env=env, cwd=data_dir, capture_output=True, text=True)
+    timings = None
+    for line in proc.stdout.splitlines():
+        if line.startswith('STARTUP '):
+            timings = json.loads(line[len('STARTUP '):])
+    if timings is None:
+        raise RuntimeError(f"startup run failed:\n{proc.stderr[-2000:]}")
+    # importtime lines: "import time: self | cumulative | <2 spaces per depth>name", children before parents
+    imports, pending = [], []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        if depth == 1:
+            pending.append((name.strip(), int(cumulative) / 1e6))
+        elif depth == 0:
+            if name.strip() == 'app':
+                imports = pending
+            pending = []
+    return timings, imports
+
+
+def report(runs):
+    phases = {}
+    for timings, _ in runs:
+        for name, seconds in timings.items():
+            phases.setdefault(name, []).append(seconds)
+    return {name: statistics.median(values) for name, values in phases.items()}
+
+
+def measure(data_dir, args):
+    results = {'meta': {'books': args.books, 'backend': args.backend, 'runs': args.runs}}
+    for label, warm in (('cold', False), ('warm', True)):
+        runs = [run_once(data_dir, args.backend, warm) for _ in range(args.runs)]
+        results[label] = report(runs)
+        print(f"{label} (median of {args.runs}): " +
+              ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in results[label].items()))
+        if label == 'cold':
+            imports = sorted(runs[-1][1], key=lambda item: -item[1])[:args.top]
+            results['imports'] = imports
+            print("Slowest imports of app.py (cumulative):")
+            for name, seconds in imports:
+                print(f"  {seconds * 1000:8.1f} ms  {name}")
+    return results
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='imports to list')
+    parser.add_argument('--out', help='write results JSON here')
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix='libra-startup-')
+    synthetic.generate(data_dir, args.books)
+    if args.backend == 'sqlite':
+        import storage
+        storage.migrate_json_to_sqlite(data_dir)
+
+    try:
+        results = measure(data_dir, args)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
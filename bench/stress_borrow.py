@@ -0,0 +1,139 @@
+"""Concurrent borrow/return/edit stress test across worker processes: proves no lost updates.
+
+Several processes share one data directory, as gunicorn workers do, and
+hammer a few multi-copy books with borrows, returns and rev-checked admin
+edits. Afterwards every book must account for exactly the writes that
+reported success: its rev, its lent copies and the open borrow records
+all have to agree, and no borrow code may have been issued twice.
+
+    python -m bench.stress_borrow [--backend json|sqlite] [--workers 8] [--ops 200]
+"""
+import os
+import sys
+import random
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+import inventory
+from ids import IdGenerator
+
+
+def worker(data_dir, backend, book_ids, ops, seed, results):
+    store = storage.open_store(data_dir, backend)
+    ids = IdGenerator(os.path.join(data_dir, 'ids.json'))
+    rng = random.Random(seed)
+    writes, codes, mine = Counter(), [], []
+    borrows = returns = refused = conflicts = 0
+    for _ in range(ops):
+        book_id = rng.choice(book_ids)
+        action = rng.random()
+        if action < 0.5:
+            code = ids.next('M')
+            codes.append(code)
+            due = (datetime.now() + timedelta(days=rng.randint(1, 14))).strftime('%d/%m/%Y')
+            record = {"borrow_code": code, "book_id": book_id, "book_title": book_id,
+                      "original_email": f"w{seed}@stress", "borrow_date": datetime.now().strftime('%d/%m/%Y'),
+                      "return_date": due}
+            if store.borrow(book_id, due, record):
+                borrows += 1
+                writes[book_id] += 1
+                mine.append((book_id, code))
+            else:
+                refused += 1
+        elif action < 0.8 and mine:
+            book_id, code = mine.pop(rng.randrange(len(mine)))
+            if store.return_loan(book_id, code, datetime.now().strftime('%d/%m/%Y')):
+                returns += 1
+                writes[book_id] += 1
+        else:
+            book = store.get_book(book_id)
+            try:
+                store.update_book(book_id, {'author': f"w{seed}"}, rev=book['rev'])
+                writes[book_id] += 1
+            except inventory.RevisionConflict:
+                conflicts += 1
+    results.put({'writes': dict(writes), 'codes': codes, 'open': mine, 'borrows': borrows,
+                 'returns': returns, 'refused': refused, 'conflicts': conflicts})
+
+
+def check(store, book_ids, initial_revs, results):
+    """List of invariant violations (empty when everything adds up)."""
+    problems = []
+    codes = [code for r in results for code in r['codes']]
+    if len(codes) != len(set(codes)):
+        problems.append(f"{len(codes) - len(set(codes))} duplicate borrow codes")
+    writes = Counter()
+    for r in results:
+        writes.update(r['writes'])
+    open_loans = {code for r in results for _, code in r['open']}
+    records = {r['borrow_code']: r for r in store.list_borrowals()}
+    if len(records) != sum(r['borrows'] for r in results):
+        problems.append(f"{len(records)} borrow records for {sum(r['borrows'] for r in results)} successful borrows")
+    for book_id in book_ids:
+        book = store.get_book(book_id)
+        if book['rev'] != initial_revs[book_id] + writes[book_id]:
+            problems.append(f"{book_id}: rev {book['rev']}, expected {initial_revs[book_id] + writes[book_id]}")
+        lent = {c['borrow_code'] for c in inventory.lent_copies(book)}
+        expected = {code for code in open_loans if records[code]['book_id'] == book_id}
+        if lent != expected:
+            problems.append(f"{book_id}: lent copies {sorted(lent)} != open loans {sorted(expected)}")
+        still_open = {code for code, r in records.items() if r['book_id'] == book_id and not r.get('returned_date')}
+        if still_open != expected:
+            problems.append(f"{book_id}: {len(still_open)} open borrow records, expected {len(expected)}")
+    return problems
+
+
+def run(backend='json', workers=8, ops=200, books=3, copies=4):
+    """Run the stress test in a temp data directory. Returns (problems, per-worker results, seconds)."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = storage.open_store(data_dir, backend)
+        book_ids = [f"S{n:03d}" for n in range(books)]
+        for book_id in book_ids:
+            store.add_book({"book_id": book_id, "book_name": f"Stress {book_id}", "author": "-", "quantity": copies})
+        initial_revs = {book_id: store.get_book(book_id)['rev'] for book_id in book_ids}
+
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=worker, args=(data_dir, backend, book_ids, ops, n, results))
+                 for n in range(workers)]
+        start = datetime.now()
+        for p in procs:
+            p.start()
+        collected = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        elapsed = (datetime.now() - start).total_seconds()
+
+        store = storage.open_store(data_dir, backend)
+        problems = check(store, book_ids, initial_revs, collected)
+        store.close()
+        return problems, collected, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=storage.BACKENDS, default='json')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200, help='operations per worker')
+    parser.add_argument('--books', type=int, default=3)
+    parser.add_argument('--copies', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    problems, collected, elapsed = run(args.backend, args.workers, args.ops, args.books, args.copies)
+    total = lambda key: sum(r[key] for r in collected)
+    print(f"{args.backend}: {args.workers} workers x {args.ops} ops in {elapsed:.2f}s — "
+          f"{total('borrows')} borrows, {total('returns')} returns, {total('refused')} refused (no copy free), "
+          f"{total('conflicts')} stale edits refused")
+    for problem in problems:
+        print(f"  LOST UPDATE: {problem}")
+    print("OK: no lost updates" if not problems else f"FAILED: {len(problems)} problems")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
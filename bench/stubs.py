@@ -0,0 +1,99 @@
+"""Local stand-ins for the services app.py talks to, so benchmarks run offline.
+
+Call `install(data_dir)` before importing app: it points DATA_DIR at the
+benchmark data, starts a fake SMTP server and the OCR stand-in, sets
+dummy Cloudinary credentials (signing is local) and replaces Firebase
+token verification with `token_for(email)` tokens.
+"""
+import os
+import sys
+import time
+import threading
+import socketserver
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import ocr_standin
+
+ADMIN_EMAIL = 'admin@bench.local'
+_TOKEN_PREFIX = 'bench:'
+
+
+def token_for(email):
+    return _TOKEN_PREFIX + email
+
+
+def admin_headers():
+    return {'Authorization': f"Bearer {token_for(ADMIN_EMAIL)}"}
+
+
+def _verify_id_token(token, *args, **kwargs):
+    from firebase_admin import auth
+    if not token.startswith(_TOKEN_PREFIX):
+        raise auth.InvalidIdTokenError("not a benchmark token")
+    return {'email': token[len(_TOKEN_PREFIX):], 'exp': time.time() + 3600}
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: accepts every command and message."""
+
+    def handle(self):
+        reply = lambda line: self.wfile.write((line + '\r\n').encode())
+        reply('220 bench smtp')
+        in_data = False
+        for raw in self.rfile:
+            line = raw.decode(errors='replace').rstrip('\r\n')
+            if in_data:
+                if line == '.':
+                    in_data = False
+                    self.server.messages += 1
+                    reply('250 queued')
+                continue
+            command = line[:4].upper()
+            if command in ('EHLO', 'HELO'):
+                reply('250-bench')
+                reply('250 AUTH PLAIN LOGIN')
+            elif command == 'AUTH':
+                reply('235 ok')
+            elif command == 'DATA':
+                in_data = True
+                reply('354 end with .')
+            elif command == 'QUIT':
+                reply('221 bye')
+                return
+            else:
+                reply('250 ok')
+
+
+def start_smtp(port=0):
+    """Fake SMTP server in a daemon thread. Returns the server (`.messages` counts mails received)."""
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', port), _SMTPHandler)
+    server.daemon_threads = True
+    server.messages = 0
+    threading.Thread(target=server.serve_forever, name='bench-smtp', daemon=True).start()
+    return server
+
+
+def stub_firebase():
+    """Accept `token_for(email)` tokens in this process (for server processes started by a benchmark)."""
+    from firebase_admin import auth
+    auth.verify_id_token = _verify_id_token
+
+
+def install(data_dir, ocr_latency=0.05):
+    """Configure the environment for an offline app import. Returns {'smtp': server, 'ocr': server}."""
+    smtp = start_smtp()
+    ocr, ocr_url = ocr_standin.start(0, ocr_latency)
+    os.environ.update({
+        'DATA_DIR': data_dir,
+        'ADMIN_EMAILS': ADMIN_EMAIL,
+        'SMTP_HOST': '127.0.0.1', 'SMTP_PORT': str(smtp.server_address[1]), 'SMTP_SECURITY': 'none',
+        'EMAIL_ADDRESS': 'library@bench.local', 'EMAIL_PASSWORD': 'bench',
+        'OCR_SPACE_URL': ocr_url, 'OCR_SPACE_API_KEY': 'bench',
+        'CLOUDINARY_CLOUD_NAME': 'bench', 'CLOUDINARY_API_KEY': 'bench', 'CLOUDINARY_API_SECRET': 'bench',
+        # Every benchmark client comes from 127.0.0.1, so per-client rate limits would turn most requests into 429s
+        'OCR_RATE_PER_MINUTE': '1000000', 'OCR_RATE_BURST': '1000000',
+        'BORROW_RATE_PER_MINUTE': '1000000', 'BORROW_RATE_BURST': '1000000',
+    })
+    stub_firebase()
+    return {'smtp': smtp, 'ocr': ocr}
@@ -0,0 +1,140 @@
+"""Synthetic catalog: database.json + borrowers.json at any scale, with Vietnamese titles and names.
+
+Books get 1-5 copies; borrow records are spread over the last `--days`
+days, some still out (their copy marked lent, a share of them overdue),
+the rest returned. Files are streamed, so a million records never sit in
+memory at once.
+
+    python -m bench.synthetic --out /tmp/lib --books 100000 [--borrowals 50000] [--sqlite]
+"""
+import os
+import sys
+import json
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inventory
+
+TOPICS = ['Lịch sử', 'Địa lý', 'Toán học', 'Vật lý', 'Hóa học', 'Sinh học', 'Văn học', 'Tiếng Anh',
+          'Tin học', 'Giáo dục công dân', 'Âm nhạc', 'Mỹ thuật', 'Kỹ năng sống', 'Khoa học']
+KINDS = ['Tài liệu chuyên', 'Tuyển tập', 'Sổ tay', 'Bài tập', 'Chuyên đề', 'Hướng dẫn ôn tập',
+         'Truyện', 'Tiểu thuyết', 'Bách khoa', 'Cẩm nang', 'Những câu chuyện về']
+SUBJECTS = ['Việt Nam', 'thế giới', 'tuổi học trò', 'quê hương', 'Hà Nội', 'sông Hồng', 'biển đảo',
+            'mùa thu', 'tuổi trẻ', 'đất nước', 'những người thầy', 'thiên nhiên', 'Đà Nẵng', 'Huế']
+SURNAMES = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng', 'Bùi', 'Đỗ', 'Hồ', 'Ngô']
+MIDDLE = ['Văn', 'Thị', 'Minh', 'Ngọc', 'Đức', 'Thu', 'Hữu', 'Thanh', 'Quang', 'Bảo', 'Gia', 'Khánh']
+GIVEN = ['An', 'Bình', 'Châu', 'Dũng', 'Giang', 'Hà', 'Hải', 'Hạnh', 'Hùng', 'Khoa', 'Lan', 'Linh',
+         'Long', 'Mai', 'Nam', 'Ngân', 'Phúc', 'Quân', 'Sơn', 'Tâm', 'Thảo', 'Trang', 'Tú', 'Vy', 'Yến']
+CLASSES = [f"{grade}A{n}" for grade in (10, 11, 12) for n in range(1, 11)]
+
+
+def person(rng):
+    return f"{rng.choice(SURNAMES)} {rng.choice(MIDDLE)} {rng.choice(GIVEN)}"
+
+
+def title(rng, n):
+    title = f"{rng.choice(KINDS)} {rng.choice(TOPICS).lower()} {rng.choice(SUBJECTS)}"
+    return f"{title} | Tập {n % 7 + 1}" if rng.random() < 0.3 else title
+
+
+class _ArrayWriter:
+    """Writes a JSON array one element at a time."""
+
+    def __init__(self, path):
+        self.f = open(path, 'w', encoding='utf-8')
+        self.f.write('[')
+        self.first = True
+
+    def add(self, item):
+        self.f.write(('\n' if self.first else ',\n') + json.dumps(item, ensure_ascii=False))
+        self.first = False
+
+    def close(self):
+        self.f.write('\n]\n')
+        self.f.close()
+
+
+def generate(out_dir, books=1000, borrowals=None, users=None, days=120, active_share=0.3,
+             overdue_share=0.25, seed=42, now=None):
+    """Write database.json and borrowers.json under `out_dir`.
+
+    Returns a summary: counts, the emails used and a sample of book_ids,
+    open borrow codes and titles for load generators to pick from.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    borrowals = books // 2 if borrowals is None else borrowals
+    users = users or max(borrowals // 5, 10)
+    emails = [f"hs{n:06d}@school.edu.vn" for n in range(users)]
+    per_book = borrowals / books if books else 0
+    step = max(days * 86400 / max(borrowals, 1), 1.0)
+    os.makedirs(out_dir, exist_ok=True)
+    book_out = _ArrayWriter(os.path.join(out_dir, 'database.json'))
+    record_out = _ArrayWriter(os.path.join(out_dir, 'borrowers.json'))
+    summary = {'books': 0, 'copies': 0, 'borrowals': 0, 'active': 0, 'emails': emails[:1000],
+               'book_ids': [], 'open_codes': [], 'titles': []}
+    seq = 0
+    for n in range(books):
+        book = inventory.normalize({'book_id': f"B{n + 1:07d}", 'book_name': title(rng, n),
+                                    'author': person(rng) if rng.random() < 0.8 else 'Chưa rõ',
+                                    'quantity': rng.choice((1, 1, 1, 2, 2, 3, 5))})
+        count = int(per_book) + (1 if rng.random() < per_book - int(per_book) else 0)
+        if n == books - 1:
+            count = max(borrowals - summary['borrowals'], 0)
+        for _ in range(min(count, borrowals - summary['borrowals'])):
+            borrowed_at = now - timedelta(seconds=(borrowals - seq) * step)
+            seq += 1
+            due = borrowed_at + timedelta(days=rng.choice((3, 7, 7, 14)))
+            record = {
+                'borrow_code': f"M{borrowed_at:%y%m%d%H%M%S}{seq % 1000:03d}", 'book_id': book['book_id'],
+                'book_title': book['book_name'], 'student_name': person(rng), 'student_class': rng.choice(CLASSES),
+                'contact_email': None, 'original_email': rng.choice(emails), 'library_card_url': None,
+                'borrow_date': f"{borrowed_at:%d/%m/%Y}", 'return_date': f"{due:%d/%m/%Y}"
+            }
+            lend = rng.random() < (active_share if due >= now else active_share * overdue_share)
+            lent_book, copy_ = inventory.allocate(book, record['borrow_code'], record['return_date']) if lend else (None, None)
+            if lent_book:
+                book = lent_book
+                record['copy_id'] = copy_['copy_id']
+                summary['active'] += 1
+                if len(summary['open_codes']) < 1000:
+                    summary['open_codes'].append(record['borrow_code'])
+            else:
+                record['returned_date'] = f"{min(due, now):%d/%m/%Y}"
+            record_out.add(record)
+            summary['borrowals'] += 1
+        book_out.add(book)
+        summary['books'] += 1
+        summary['copies'] += book['quantity']
+        if len(summary['book_ids']) < 1000:
+            summary['book_ids'].append(book['book_id'])
+            summary['titles'].append(book['book_name'])
+    book_out.close()
+    record_out.close()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', required=True, help='directory to write database.json/borrowers.json into')
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--borrowals', type=int, help='default: half the number of books')
+    parser.add_argument('--users', type=int, help='distinct borrower emails (default: borrowals / 5)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sqlite', action='store_true', help='also migrate the files into library.db')
+    args = parser.parse_args(argv)
+
+    summary = generate(args.out, args.books, args.borrowals, args.users, seed=args.seed)
+    print(f"{summary['books']} books ({summary['copies']} copies), {summary['borrowals']} borrow records "
+          f"({summary['active']} open) in {args.out}")
+    if args.sqlite:
+        import storage
+        n_books, n_borrowals, path = storage.migrate_json_to_sqlite(args.out)
+        print(f"Migrated {n_books} books and {n_borrowals} borrow records into {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+import os
+import re
+import gzip
+import bisect
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+import serialization
+
+
+_CODE_MONTH = re.compile(r'^M(\d{2})(\d{2})\d')
+
+
+def month_of(record):
+    """Partition key 'YYYY-mm' of a borrow record: its borrow_date, else the
+    yymm stamped in its borrow_code, else '0000-00'."""
+    try:
+        return datetime.strptime(record.get('borrow_date') or '', '%d/%m/%Y').strftime('%Y-%m')
+    except (ValueError, TypeError):
+        match = _CODE_MONTH.match(record.get('borrow_code') or '')
+        return f"20{match.group(1)}-{match.group(2)}" if match else '0000-00'
+
+
+def _borrowed_on(record):
+    try:
+        return datetime.strptime(record.get('borrow_date') or '', '%d/%m/%Y').strftime('%Y-%m-%d')
+    except (ValueError, TypeError):
+        return None
+
+
+def _summary(records):
+    """Manifest entry of one partition (records sorted by borrow_code)."""
+    dates = [d for d in map(_borrowed_on, records) if d]
+    return {'count': len(records), 'first': records[0]['borrow_code'], 'last': records[-1]['borrow_code'],
+            'from': min(dates) if dates else None, 'to': max(dates) if dates else None,
+            'emails': sorted({r['original_email'] for r in records if r.get('original_email')}),
+            'classes': sorted({r['student_class'] for r in records if r.get('student_class')})}
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class HistoryArchive:
+    """Closed borrow records in monthly partitions, one gzip file per month.
+
+    `directory` holds YYYY-mm.json.gz (the month's records sorted by
+    borrow_code) and manifest.json, which keeps per partition its count,
+    first/last borrow_code, borrow date range, and the borrower emails and
+    classes in it. Queries read the manifest to pick the partitions they
+    need, and only those are decompressed, the last `cache_size` of them
+    kept in memory. Partitions are written only by `add()`, which the
+    catalog store calls from compaction under its journal lock; files are
+    replaced atomically, partitions before the manifest.
+    """
+
+    def __init__(self, directory, cache_size=6):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        self._manifest = {}           # month -> summary, see _summary()
+        self._stamp = None
+        self._cache = OrderedDict()   # month -> (file stamp, records, codes)
+
+    def _path(self, month):
+        return os.path.join(self.directory, f"{month}.json.gz")
+
+    def refresh(self):
+        """Reload the manifest if another process rewrote it (one stat() otherwise)."""
+        with self._lock:
+            try:
+                st = os.stat(self.manifest_path)
+                stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                stamp = None
+            if stamp == self._stamp:
+                return
+            try:
+                with open(self.manifest_path, 'rb') as f:
+                    self._manifest = serialization.loads(f.read())
+            except FileNotFoundError:
+                self._manifest = {}
+            self._stamp = stamp
+
+    def months(self):
+        with self._lock:
+            return sorted(self._manifest)
+
+    def count(self):
+        with self._lock:
+            return sum(part['count'] for part in self._manifest.values())
+
+    def _load(self, month):
+        """(records, borrow_codes) of a partition, sorted by borrow_code."""
+        with self._lock:
+            try:
+                st = os.stat(self._path(month))
+                stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                return [], []
+            cached = self._cache.get(month)
+            if cached and cached[0] == stamp:
+                self._cache.move_to_end(month)
+                return cached[1], cached[2]
+            with open(self._path(month), 'rb') as f:
+                records = serialization.loads(gzip.decompress(f.read()))
+            codes = [r['borrow_code'] for r in records]
+            self._cache[month] = (stamp, records, codes)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return records, codes
+
+    # --- reading ---
+    def records(self):
+        """Every archived record, oldest partition first."""
+        with self._lock:
+            return [r for month in sorted(self._manifest) for r in self._load(month)[0]]
+
+    def find(self, borrow_codes):
+        """{borrow_code: record} for the archived codes among `borrow_codes`."""
+        found = {}
+        with self._lock:
+            parts = [(month, part) for month, part in self._manifest.items()]
+            for code in borrow_codes:
+                for month, part in parts:
+                    if part['first'] <= code <= part['last']:
+                        records, codes = self._load(month)
+                        i = bisect.bisect_left(codes, code)
+                        if i < len(codes) and codes[i] == code:
+                            found[code] = records[i]
+                            break
+        return found
+
+    def for_email(self, email):
+        """Archived records of one borrower, oldest first, from the partitions listing `email`."""
+        with self._lock:
+            return [r for month in sorted(self._manifest) if email in self._manifest[month]['emails']
+                    for r in self._load(month)[0] if r.get('original_email') == email]
+
+    def newest_first(self, before=None, date_from=None, date_to=None, student_class=None):
+        """Archived records with borrow_code below `before`, newest first.
+
+        Partitions whose manifest entry rules out the borrow date range
+        ('YYYY-mm-dd' bounds) or the class are skipped, and the rest are
+        opened one at a time, only once the iteration reaches their codes.
+        Records still have to be filtered by the caller.
+        """
+        with self._lock:
+            parts = sorted(
+                (part['last'], month) for month, part in self._manifest.items()
+                if (before is None or part['first'] < before)
+                and not (date_from and (part['to'] or '') < date_from)
+                and not (date_to and (not part['from'] or part['from'] > date_to))
+                and (student_class is None or student_class in part['classes']))
+        parts.reverse()
+        open_parts, k = [], 0   # open_parts: [next record, iterator over the rest] per partition read
+        while True:
+            top = max(open_parts, key=lambda p: p[0]['borrow_code']) if open_parts else None
+            if k < len(parts) and (top is None or parts[k][0] >= top[0]['borrow_code']):
+                records, codes = self._load(parts[k][1])
+                end = bisect.bisect_left(codes, before) if before is not None else len(codes)
+                rest = (records[i] for i in range(end - 1, -1, -1))
+                first = next(rest, None)
+                if first is not None:
+                    open_parts.append([first, rest])
+                k += 1
+                continue
+            if top is None:
+                return
+            yield top[0]
+            top[0] = next(top[1], None)
+            if top[0] is None:
+                open_parts.remove(top)
+
+    # --- writing ---
+    def add(self, records):
+        """Upsert closed records into their monthly partitions. Returns the months written."""
+        by_month = {}
+        for record in records:
+            by_month.setdefault(month_of(record), {})[record['borrow_code']] = record
+        if not by_month:
+            return []
+        with self._lock:
+            self.refresh()
+            os.makedirs(self.directory, exist_ok=True)
+            manifest = dict(self._manifest)
+            for month, new in by_month.items():
+                merged = {r['borrow_code']: r for r in self._load(month)[0]}
+                merged.update(new)
+                rows = [merged[code] for code in sorted(merged)]
+                _write_atomic(self._path(month), gzip.compress(serialization.dumpb(rows), compresslevel=6))
+                manifest[month] = _summary(rows)
+            _write_atomic(self.manifest_path, serialization.dumpb(dict(sorted(manifest.items()))))
+            self.refresh()
+            return sorted(by_month)
@@ -0,0 +1,89 @@
+import io
+import re
+import csv
+
+import serialization
+from search_index import fold
+
+
+# Columns of the CSV exports; JSONL exports carry the full records
+BOOK_COLUMNS = ('book_id', 'book_name', 'author', 'quantity', 'available_count')
+BORROWAL_COLUMNS = ('borrow_code', 'book_id', 'copy_id', 'book_title', 'student_name', 'student_class',
+                    'contact_email', 'original_email', 'borrow_date', 'return_date', 'returned_date', 'is_returned')
+
+FORMATS = ('csv', 'jsonl')
+MAX_QUANTITY = 1000
+_BOOK_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,40}$')
+
+
+def detect_format(fmt=None, filename=None, content_type=None):
+    """'csv' or 'jsonl' from an explicit format, a file extension or a content type; None if unknown."""
+    if fmt:
+        fmt = fmt.lower()
+        return 'jsonl' if fmt == 'ndjson' else fmt if fmt in FORMATS else None
+    ext = (filename or '').rsplit('.', 1)[-1].lower() if '.' in (filename or '') else ''
+    if ext in ('jsonl', 'ndjson') or 'ndjson' in (content_type or '') or 'jsonl' in (content_type or ''):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(f, fmt):
+    """(line number, dict) for each row of a binary CSV (header line first) or JSONL file.
+
+    A JSONL line that is not an object is yielded as None, for the caller to report.
+    """
+    text = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {k.strip().lower(): (v or '').strip() for k, v in row.items() if k}
+        return
+    for n, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = serialization.loads(line)
+        except ValueError:
+            row = None
+        yield n, row if isinstance(row, dict) else None
+
+
+def validate_book(row):
+    """(book, None) for a valid import row, or (None, error message).
+
+    book_name (or title) is required; book_id is optional and generated when
+    missing; quantity defaults to 1; author to 'Chưa rõ'.
+    """
+    if row is None:
+        return None, "dòng không phải JSON object"
+    name = str(row.get('book_name') or row.get('title') or '').strip()
+    if not name:
+        return None, "thiếu book_name"
+    book_id = str(row.get('book_id') or '').strip()
+    if book_id and not _BOOK_ID_RE.match(book_id):
+        return None, f"book_id không hợp lệ: {book_id!r}"
+    quantity = row.get('quantity')
+    try:
+        quantity = 1 if quantity in (None, '') else int(quantity)
+    except (TypeError, ValueError):
+        return None, f"quantity không phải số nguyên: {quantity!r}"
+    if not 0 <= quantity <= MAX_QUANTITY:
+        return None, f"quantity phải từ 0 đến {MAX_QUANTITY}"
+    author = str(row.get('author') or '').strip() or 'Chưa rõ'
+    return {'book_id': book_id or None, 'book_name': name, 'author': author, 'quantity': quantity}, None
+
+
+def dedupe_key(book):
+    """Books with the same title and author, ignoring case and diacritics, count as one."""
+    return f"{' '.join(fold(book['book_name']).split())}|{' '.join(fold(book.get('author')).split())}"
+
+
+def to_csv(items, columns, header=True):
+    """CSV text for `items` (dicts) restricted to `columns`."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(columns)
+    for item in items:
+        writer.writerow(['' if item.get(c) is None else item.get(c) for c in columns])
+    return out.getvalue()
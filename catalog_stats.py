@@ -0,0 +1,139 @@
+import bisect
+import threading
+from datetime import datetime
+
+import inventory
+
+
+def _due_key(copy_):
+    """Sortable 'YYYY-mm-dd' of a lent copy's return_date, None if missing or malformed."""
+    try:
+        return datetime.strptime(copy_.get('return_date') or '', '%d/%m/%Y').strftime('%Y-%m-%d')
+    except (ValueError, TypeError):
+        return None
+
+
+class CatalogStats:
+    """Admin dashboard figures kept current from store change events.
+
+    Holds copy counters, a due-date ordered list of lent copies (so the
+    overdue count is one bisect against today) and the `keep_recent` newest
+    borrow records by borrow_code. Like SearchIndex it rebuilds lazily from
+    `load_books`/`load_recent` after a reset and applies single changes
+    incrementally in between.
+    """
+
+    def __init__(self, load_books, load_recent, keep_recent=50):
+        self._load_books = load_books
+        self._load_recent = load_recent
+        self.keep_recent = keep_recent
+        self._lock = threading.RLock()
+        self._stale = True
+        self._pending = None    # change entries seen while a rebuild is loading
+        self._books = {}        # book_id -> (copies, lent, [(due key, book_id, copy_id, borrow_code)])
+        self._total = 0
+        self._borrowed = 0
+        self._due = []          # sorted [(due key, book_id, copy_id, borrow_code)] of lent copies
+        self._recent = []       # borrow_codes ascending, at most keep_recent
+        self._records = {}      # borrow_code -> record, for codes in _recent
+
+    # --- maintenance ---
+    def on_change(self, entry):
+        """Store listener: apply a change entry, or reset on None (full reload)."""
+        with self._lock:
+            if entry is None:
+                self._stale = True
+            elif self._pending is not None:
+                self._pending.append(entry)
+            elif not self._stale:
+                self._apply(entry)
+
+    def _apply(self, entry):
+        for book in entry.get('books', []):
+            self._put_book(book)
+        for book_id in entry.get('deleted', []):
+            self._remove_book(book_id)
+        for record in entry.get('borrowals', []):
+            self._put_borrowal(record)
+
+    def warm_up(self):
+        """Build now instead of on the first query."""
+        self._ensure_built()
+
+    def _ensure_built(self):
+        """Rebuild from the store if reset, loading outside our lock (see SearchIndex._ensure_built)."""
+        with self._lock:
+            if not self._stale or self._pending is not None:
+                return
+            self._stale = False
+            self._pending = []
+        try:
+            books = self._load_books()
+            recent = self._load_recent(self.keep_recent)
+        except BaseException:
+            with self._lock:
+                self._stale, self._pending = True, None
+            raise
+        with self._lock:
+            self._books, self._total, self._borrowed, self._due, self._recent, self._records = {}, 0, 0, [], [], {}
+            for book in books:
+                self._put_book(book)
+            for record in recent:
+                self._put_borrowal(record)
+            pending, self._pending = self._pending, None
+            for entry in pending:
+                self._apply(entry)
+
+    def _put_book(self, book):
+        self._remove_book(book['book_id'])
+        lent = inventory.lent_copies(book)
+        due = [(key, book['book_id'], c['copy_id'], c.get('borrow_code'))
+               for c in lent for key in [_due_key(c)] if key is not None]
+        self._books[book['book_id']] = (len(book.get('copies', [])), len(lent), due)
+        self._total += len(book.get('copies', []))
+        self._borrowed += len(lent)
+        for item in due:
+            bisect.insort(self._due, item)
+
+    def _remove_book(self, book_id):
+        old = self._books.pop(book_id, None)
+        if old is None:
+            return
+        copies, lent, due = old
+        self._total -= copies
+        self._borrowed -= lent
+        for item in due:
+            i = bisect.bisect_left(self._due, item)
+            if i < len(self._due) and self._due[i] == item:
+                self._due.pop(i)
+
+    def _put_borrowal(self, record):
+        code = record['borrow_code']
+        if code in self._records:
+            self._records[code] = record
+            return
+        if len(self._recent) >= self.keep_recent and code < self._recent[0]:
+            return
+        bisect.insort(self._recent, code)
+        self._records[code] = record
+        while len(self._recent) > self.keep_recent:
+            del self._records[self._recent.pop(0)]
+
+    # --- querying ---
+    def snapshot(self, today, recent=5):
+        """Copy counters, overdue count as of `today` (a date) and the `recent` newest borrow records."""
+        self._ensure_built()
+        with self._lock:
+            return {
+                "total_books": self._total,
+                "available_books": self._total - self._borrowed,
+                "borrowed_books": self._borrowed,
+                "overdue_count": bisect.bisect_left(self._due, (today.strftime('%Y-%m-%d'),)),
+                "recent_borrowals": [self._records[code] for code in reversed(self._recent[-recent:])]
+            }
+
+    def due_until(self, day):
+        """Lent copies due on or before `day` (a date), earliest first: [(due 'YYYY-mm-dd', book_id, copy_id, borrow_code)]."""
+        self._ensure_built()
+        with self._lock:
+            return self._due[:bisect.bisect_right(self._due, (day.strftime('%Y-%m-%d'), '\uffff'))]
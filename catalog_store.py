@@ -0,0 +1,541 @@
+import os
+import json
+import zlib
+import heapq
+import bisect
+import threading
+import time
+from datetime import datetime
+from contextlib import contextmanager, nullcontext
+
+import inventory
+import serialization
+from borrow_history import HistoryArchive
+from journal import Journal, file_lock
+
+
+# --- JSON file helpers ---
+def read_json_db(path):
+    """Parsed contents of `path` (compact or legacy pretty-printed), [] if missing or unreadable."""
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+            if not content.strip(): return []
+            return serialization.loads(content)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+def write_json_db(path, data):
+    """Write `data` as compact JSON to a temp file and atomically swap it in, so a crash never truncates `path`."""
+    os.makedirs(os.path.dirname(path), exist_ok=True) if os.path.dirname(path) else None
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(serialization.dumpb(data))
+        f.write(b'\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _file_stamp(path):
+    """(mtime, size) of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _iso_date(value):
+    """'dd/mm/YYYY' -> 'YYYY-mm-dd' (sortable), None if missing or malformed."""
+    try:
+        return datetime.strptime(value, '%d/%m/%Y').strftime('%Y-%m-%d')
+    except (ValueError, TypeError):
+        return None
+
+
+class CatalogStore:
+    """Books and borrow records kept in memory with hash indexes.
+
+    State on disk is a snapshot (database.json + borrowers.json) plus an
+    append-only journal of mutations. Each mutation is one journal line, so
+    writes cost O(1) in catalog size; `compact()` folds the journal back into
+    the snapshot. Every public method first catches up with the files, which
+    is a couple of stat() calls unless another worker wrote something.
+    Returned dicts are the live records and must be treated as read-only.
+
+    Books are held normalized to copy-level inventory (see inventory.py);
+    snapshots and journal entries written before copies existed are
+    converted as they are loaded.
+
+    Closed loans do not stay in borrowers.json: compaction moves them into
+    monthly gzip partitions under history/ (see borrow_history.py), so the
+    snapshot holds open loans plus those closed since the last compaction.
+    Lookups of open loans never read the archive; listings, history and
+    lookups by code read only the partitions the manifest says can match.
+    A record found in both places (a crash between writing the archive and
+    the snapshot) is taken from the snapshot.
+
+    Journal entries are idempotent upserts, so replaying an entry that was
+    already folded into the snapshot is harmless:
+        {"op": "borrow", "books": [<book>], "deleted": [<book_id>], "borrowals": [<record>]}
+    Listeners registered with `subscribe()` receive every entry applied,
+    whether written here or replayed from another worker, and None after
+    a full reload.
+    """
+
+    def __init__(self, books_path, borrowers_path, journal_path=None, history_dir=None):
+        self.books_path = books_path
+        self.borrowers_path = borrowers_path
+        self.journal = Journal(journal_path or os.path.join(os.path.dirname(books_path), 'catalog.journal'))
+        self.history = HistoryArchive(history_dir or os.path.join(os.path.dirname(books_path), 'history'))
+        self._lock = threading.RLock()
+        self._books = {}              # book_id -> book (insertion ordered)
+        self._borrowals = []          # borrow records not archived yet, in file order
+        self._by_email = {}           # original_email -> [records]
+        self._by_code = {}            # borrow_code -> record
+        self._sorted_ids = None       # sorted book_ids / borrow_codes for keyset paging,
+        self._sorted_codes = None     # rebuilt on demand after a change
+        self._snapshot_stamp = object()  # never equal to a real stamp
+        self._journal_ino = None
+        self._journal_offset = 0
+        self._file_locked = False     # journal lock held by this process
+        self._compactor = None
+        self._listeners = []
+
+    # --- loading ---
+    def refresh(self):
+        """Catch up with the snapshot and journal on disk."""
+        with self._lock:
+            self.history.refresh()
+            stamp = (_file_stamp(self.books_path), _file_stamp(self.borrowers_path))
+            journal_id = self.journal.identity()
+            journal_ino = journal_id[0] if journal_id else None
+            if stamp != self._snapshot_stamp or journal_ino != self._journal_ino:
+                self._reload()
+            elif journal_id and journal_id[1] > self._journal_offset:
+                self._replay()
+
+    def _reload(self):
+        """Load the snapshot from scratch and replay the whole journal."""
+        with nullcontext() if self._file_locked else file_lock(self.journal.lock_path, shared=True):
+            self._snapshot_stamp = (_file_stamp(self.books_path), _file_stamp(self.borrowers_path))
+            self._load_books(read_json_db(self.books_path))
+            self._load_borrowals(read_json_db(self.borrowers_path))
+            journal_id = self.journal.identity()
+            self._journal_ino = journal_id[0] if journal_id else None
+            self._journal_offset = 0
+            self._replay(notify=False)
+        self._notify(None)
+
+    def _replay(self, notify=True):
+        entries, self._journal_offset = self.journal.read_from(self._journal_offset)
+        for entry in entries:
+            self._apply(entry, notify)
+
+    def _load_books(self, books):
+        self._books = {book['book_id']: inventory.normalize(book) for book in books}
+        self._sorted_ids = None
+
+    def _load_borrowals(self, borrowals):
+        self._sorted_codes = None
+        self._borrowals = []
+        self._by_email = {}
+        self._by_code = {}
+        for record in borrowals:
+            self._put_borrowal(record)
+
+    def _put_borrowal(self, record):
+        existing = self._by_code.get(record.get('borrow_code'))
+        if existing is not None:
+            existing.clear()
+            existing.update(record)
+            return
+        self._borrowals.append(record)
+        self._sorted_codes = None
+        self._by_email.setdefault(record.get('original_email'), []).append(record)
+        if record.get('borrow_code'):
+            self._by_code[record['borrow_code']] = record
+
+    def _apply(self, entry, notify=True):
+        for book in entry.get('books', []):
+            if book['book_id'] not in self._books:
+                self._sorted_ids = None
+            self._books[book['book_id']] = book if 'copies' in book else inventory.normalize(book)
+        for book_id in entry.get('deleted', []):
+            if self._books.pop(book_id, None) is not None:
+                self._sorted_ids = None
+        for record in entry.get('borrowals', []):
+            self._put_borrowal(record)
+        if notify:
+            self._notify(entry)
+
+    def subscribe(self, listener):
+        """Call `listener(entry)` for every change applied, `listener(None)` after a reload."""
+        self._listeners.append(listener)
+
+    def _notify(self, entry):
+        for listener in self._listeners:
+            try:
+                listener(entry)
+            except Exception as e:
+                print(f"Catalog listener {listener} failed: {e}")
+
+    def _commit(self, entry):
+        """Apply `entry` in memory and append it to the journal.
+
+        Callers hold `_mutation()`, so the journal offset is current and the
+        books in `entry` were built from the latest revisions.
+        """
+        for book in entry.get('books', []):
+            inventory.next_rev(book)
+        entry['ts'] = time.time()
+        self._journal_offset = self.journal.append(entry, self._journal_offset)
+        if self._journal_ino is None:
+            self._journal_ino = self.journal.identity()[0]
+        self._apply(entry)
+
+    @contextmanager
+    def _mutation(self):
+        """Process + journal file lock held around a read-check-write cycle."""
+        with self._lock:
+            if self._file_locked:
+                yield
+                return
+            with file_lock(self.journal.lock_path):
+                self._file_locked = True
+                try:
+                    self.refresh()
+                    yield
+                finally:
+                    self._file_locked = False
+
+    def close(self):
+        """Nothing to close: files are opened per operation. Same API as SqliteStore."""
+
+    # --- compaction ---
+    def _closed_borrowals(self):
+        """Records in the snapshot whose loan is over (a deleted book had no copy out)."""
+        return [r for r in self._borrowals if r.get('borrow_code') and (
+            r['book_id'] not in self._books or not inventory.loan_is_active(r, self._books[r['book_id']]))]
+
+    def compact(self):
+        """Fold the journal into an atomically replaced snapshot and empty the journal,
+        moving closed loans from the snapshot into the history archive first."""
+        with self._mutation():
+            closed = self._closed_borrowals()
+            if not self._journal_offset and not closed:
+                return False
+            if closed:
+                self.history.add([r if inventory.is_returned(r) else {**r, 'returned': True} for r in closed])
+                closed_codes = {r['borrow_code'] for r in closed}
+                self._load_borrowals([r for r in self._borrowals if r.get('borrow_code') not in closed_codes])
+            write_json_db(self.books_path, list(self._books.values()))
+            write_json_db(self.borrowers_path, self._borrowals)
+            self.journal.reset()
+            self._snapshot_stamp = (_file_stamp(self.books_path), _file_stamp(self.borrowers_path))
+            self._journal_ino = self.journal.identity()[0]
+            self._journal_offset = 0
+            return True
+
+    def start_compactor(self, interval=300, min_bytes=1024 * 1024, min_closed=1000):
+        """Compact in a daemon thread whenever the journal has grown past `min_bytes`
+        or the snapshot holds `min_closed` closed loans to archive (a legacy borrowers.json)."""
+        if self._compactor:
+            return
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    journal_id = self.journal.identity()
+                    if journal_id and journal_id[1] >= min_bytes:
+                        self.compact()
+                    else:
+                        with self._lock:
+                            self.refresh()
+                            archivable = len(self._closed_borrowals()) >= min_closed
+                        if archivable:
+                            self.compact()
+                except Exception as e:
+                    print(f"Journal compaction failed: {e}")
+        self._compactor = threading.Thread(target=run, name='catalog-compactor', daemon=True)
+        self._compactor.start()
+
+    def version(self):
+        """Opaque string that changes with the data on disk; the same in every worker."""
+        with self._lock:
+            self.refresh()
+            files = zlib.crc32(repr((self._snapshot_stamp, self._journal_ino)).encode())
+            return f"{files:08x}-{self._journal_offset}"
+
+    # --- lookups ---
+    def get_book(self, book_id):
+        with self._lock:
+            self.refresh()
+            return self._books.get(book_id)
+
+    def get_books(self, book_ids):
+        """Books for `book_ids` in the given order, skipping unknown ids."""
+        with self._lock:
+            self.refresh()
+            return [self._books[b] for b in book_ids if b in self._books]
+
+    def list_books(self):
+        with self._lock:
+            self.refresh()
+            return list(self._books.values())
+
+    def list_borrowals(self):
+        """Every borrow record, archived ones first."""
+        with self._lock:
+            self.refresh()
+            return [r for r in self.history.records() if r['borrow_code'] not in self._by_code] + self._borrowals
+
+    def get_borrowal(self, borrow_code):
+        with self._lock:
+            self.refresh()
+            record = self._by_code.get(borrow_code)
+            return record if record is not None else self.history.find([borrow_code]).get(borrow_code)
+
+    def get_borrowals(self, borrow_codes):
+        """{borrow_code: record} for the known codes among `borrow_codes`."""
+        with self._lock:
+            self.refresh()
+            found, missing = {}, []
+            for code in borrow_codes:
+                if code in self._by_code:
+                    found[code] = self._by_code[code]
+                else:
+                    missing.append(code)
+            if missing:
+                found.update(self.history.find(missing))
+            return found
+
+    def borrowals_for_email(self, email):
+        """One borrower's records, archived ones first."""
+        with self._lock:
+            self.refresh()
+            return ([r for r in self.history.for_email(email) if r['borrow_code'] not in self._by_code]
+                    + self._by_email.get(email, []))
+
+    def active_borrowals_for_email(self, email):
+        """(record, book) pairs for this user's loans whose book is still out."""
+        with self._lock:
+            self.refresh()
+            pairs = []
+            for record in self._by_email.get(email, []):
+                book = self._books.get(record['book_id'])
+                if book and inventory.loan_is_active(record, book):
+                    pairs.append((record, book))
+            return pairs
+
+    def list_borrowals_with_status(self):
+        """Copies of all borrow records with an `is_returned` flag."""
+        with self._lock:
+            self.refresh()
+            return ([{**r, 'is_returned': True} for r in self.history.records() if r['borrow_code'] not in self._by_code]
+                    + [{**b, 'is_returned': not inventory.loan_is_active(b, self._books.get(b['book_id']))}
+                       for b in self._borrowals])
+
+    def active_borrowals(self):
+        """Borrow records of loans still open, oldest first (never reads the archive)."""
+        with self._lock:
+            self.refresh()
+            return [r for r in self._borrowals if inventory.loan_is_active(r, self._books.get(r['book_id']))]
+
+    def _newest_first(self, before=None, archived=True, **partition_filters):
+        """(borrow_code, record, archived?) for snapshot and, if `archived`, archive
+        records below the `before` cursor, newest first."""
+        if self._sorted_codes is None:
+            self._sorted_codes = sorted(self._by_code)
+        codes = self._sorted_codes
+        end = bisect.bisect_left(codes, before) if before is not None else len(codes)
+        hot = ((codes[i], self._by_code[codes[i]], False) for i in range(end - 1, -1, -1))
+        if not archived:
+            return hot
+        cold = ((r['borrow_code'], r, True) for r in self.history.newest_first(before, **partition_filters)
+                if r['borrow_code'] not in self._by_code)
+        return heapq.merge(hot, cold, key=lambda item: item[0], reverse=True)
+
+    def page_books(self, after=None, limit=50, status=None):
+        """Books ordered by book_id after the `after` cursor, optionally only
+        those with a copy 'available' or 'borrowed'. Returns (books, next cursor or None)."""
+        with self._lock:
+            self.refresh()
+            if self._sorted_ids is None:
+                self._sorted_ids = sorted(self._books)
+            ids = self._sorted_ids
+            i = bisect.bisect_right(ids, after) if after is not None else 0
+            page = []
+            while i < len(ids) and len(page) < limit:
+                book = self._books[ids[i]]
+                i += 1
+                if (status is None or status == 'available' and book['available_count']
+                        or status == 'borrowed' and book['available_count'] < book['quantity']):
+                    page.append(book)
+            return page, (page[-1]['book_id'] if page and i < len(ids) else None)
+
+    def page_borrowals(self, before=None, limit=50, status=None, student_class=None,
+                       date_from=None, date_to=None, today=None):
+        """Borrow records with `is_returned`, newest borrow_code first, before the `before` cursor.
+
+        Filters: status 'active' | 'returned' | 'overdue' (active and due
+        before `today`), exact student_class, and borrow_date within the ISO
+        'YYYY-mm-dd' bounds. Returns (records, next cursor or None).
+        """
+        today = today.strftime('%Y-%m-%d') if today else None
+        with self._lock:
+            self.refresh()
+            # Open loans are all in the snapshot; other filters narrow the archive partitions read
+            records = self._newest_first(before, archived=status not in ('active', 'overdue'),
+                                         date_from=date_from, date_to=date_to, student_class=student_class)
+            page = []
+            for code, record, archived in records:
+                if len(page) == limit:
+                    return page, page[-1]['borrow_code']
+                returned = archived or not inventory.loan_is_active(record, self._books.get(record['book_id']))
+                if status == 'active' and returned or status == 'returned' and not returned:
+                    continue
+                if status == 'overdue' and (returned or not (_iso_date(record.get('return_date')) or '9') < today):
+                    continue
+                if student_class is not None and record.get('student_class') != student_class:
+                    continue
+                if date_from or date_to:
+                    borrowed_on = _iso_date(record.get('borrow_date'))
+                    if not borrowed_on or (date_from and borrowed_on < date_from) or (date_to and borrowed_on > date_to):
+                        continue
+                page.append({**record, 'is_returned': returned})
+            return page, None
+
+    def available_books(self, exclude_ids=(), limit=None):
+        with self._lock:
+            self.refresh()
+            books = []
+            for book in self._books.values():
+                if limit is not None and len(books) >= limit:
+                    break
+                if book['book_id'] not in exclude_ids and book['available_count']:
+                    books.append(book)
+            return books
+
+    def count_books(self):
+        """Copies in the catalog."""
+        with self._lock:
+            self.refresh()
+            return sum(book['quantity'] for book in self._books.values())
+
+    def count_borrowed(self):
+        """Copies lent out."""
+        with self._lock:
+            self.refresh()
+            return sum(book['quantity'] - book['available_count'] for book in self._books.values())
+
+    def count_overdue(self, today):
+        """Lent copies whose return_date is before `today` (a date)."""
+        with self._lock:
+            self.refresh()
+            overdue_count = 0
+            for book in self._books.values():
+                for copy_ in inventory.lent_copies(book):
+                    try:
+                        if datetime.strptime(copy_['return_date'], '%d/%m/%Y').date() < today:
+                            overdue_count += 1
+                    except (ValueError, TypeError):
+                        continue
+            return overdue_count
+
+    def recent_borrowals(self, limit=5):
+        """The `limit` newest borrow records by borrow_code (reads the newest archive partitions only if needed)."""
+        with self._lock:
+            self.refresh()
+            records = []
+            for _, record, _ in self._newest_first():
+                if len(records) == limit:
+                    break
+                records.append(record)
+            return records
+
+    # --- mutations ---
+    def add_book(self, book):
+        """Add a book with `quantity` copies. Returns the stored book."""
+        book = inventory.normalize(book)
+        with self._mutation():
+            self._commit({'op': 'add_book', 'books': [book]})
+            return book
+
+    def add_books(self, books):
+        """Add many books in one journal entry, skipping book_ids already present.
+        Returns the books added."""
+        books = [inventory.normalize(book) for book in books]
+        with self._mutation():
+            books = [book for book in books if book['book_id'] not in self._books]
+            if books:
+                self._commit({'op': 'add_books', 'books': books})
+            return books
+
+    def update_book(self, book_id, fields, rev=None):
+        """Apply `fields` to a book; a new `quantity` adds or removes copies on the shelf.
+
+        Returns the updated book or None if missing; raises ValueError if the
+        quantity would drop below the copies lent out, RevisionConflict if
+        `rev` is given and the book has moved past it.
+        """
+        with self._mutation():
+            book = self._books.get(book_id)
+            if not book:
+                return None
+            inventory.check_rev(book, rev)
+            book = {**book, **fields}
+            book = inventory.resize(book, int(fields['quantity'])) if 'quantity' in fields else inventory.normalize(book)
+            self._commit({'op': 'update_book', 'books': [book]})
+            return book
+
+    def delete_book(self, book_id, rev=None):
+        """Remove a book. Returns the removed book or None if missing; raises
+        ValueError while a copy is lent out, RevisionConflict as update_book."""
+        with self._mutation():
+            book = self._books.get(book_id)
+            if book:
+                inventory.check_rev(book, rev)
+                if inventory.lent_copies(book):
+                    raise ValueError("cannot delete a book with copies lent out")
+                self._commit({'op': 'delete_book', 'deleted': [book_id]})
+            return book
+
+    def borrow(self, book_id, return_date, record):
+        """Lend any free copy and record the loan (with its `copy_id`) in one journal entry.
+
+        Returns the updated book, or None if it is missing or has no free copy.
+        """
+        with self._mutation():
+            book = self._books.get(book_id)
+            if not book:
+                return None
+            book, copy_ = inventory.allocate(book, record['borrow_code'], return_date)
+            if not book:
+                return None
+            record['copy_id'] = copy_['copy_id']
+            self._commit({'op': 'borrow', 'books': [book], 'borrowals': [record]})
+            return book
+
+    def return_loan(self, book_id, borrow_code=None, returned_date=None):
+        """Put back the copy lent under `borrow_code` (or the book's only lent copy)
+        and mark its borrow record returned on `returned_date` ('dd/mm/YYYY').
+
+        Returns (book, record or None), or None if there is no such loan.
+        """
+        with self._mutation():
+            book = self._books.get(book_id)
+            record = self._by_code.get(borrow_code) if borrow_code else None
+            if not book or record is not None and inventory.is_returned(record):
+                return None
+            book, copy_ = inventory.release(book, borrow_code, legacy=record is not None and not record.get('copy_id'))
+            if not book:
+                return None
+            entry = {'op': 'return', 'books': [book]}
+            if record is None and copy_['borrow_code']:
+                record = self._by_code.get(copy_['borrow_code'])
+            if record is not None:
+                record = {**record, 'returned_date': returned_date}
+                entry['borrowals'] = [record]
+            self._commit(entry)
+            return book, record
+
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+
+import inventory
+
+
+class DashboardViews:
+    """Per-user dashboard data, materialized on first request.
+
+    `build_view(email, today)` returns the user's part of the dashboard plus
+    the book_ids and borrow_codes it depends on under 'book_ids' and
+    'borrow_codes'. A view is kept until a store change touches one of
+    those books or records or adds a borrow record for that user, or until
+    the day changes (due-soon counts are per day). At most `max_users`
+    views are kept, least recently used dropped first.
+
+    Recommendations depend on every book's availability rather than the
+    user's, so they come from one shared list of the first `head_size`
+    available books, reloaded after any book changes. They carry only the
+    books' public fields (inventory.PUBLIC_FIELDS), never their copies.
+    """
+
+    def __init__(self, build_view, load_available, max_users=10000, head_size=64):
+        self._build_view = build_view
+        self._load_available = load_available
+        self.max_users = max_users
+        self.head_size = head_size
+        self._lock = threading.Lock()
+        self._views = OrderedDict()  # email -> (day, view)
+        self._watchers = {}          # ('book', id) / ('code', borrow_code) -> {emails whose view depends on it}
+        self._head = None            # first available books, None when stale
+        self._generation = 0         # bumped by every invalidation, guards racing rebuilds
+
+    # --- maintenance ---
+    def on_change(self, entry):
+        """Store listener: drop the views an entry affects, or all of them on None."""
+        with self._lock:
+            self._generation += 1
+            if entry is None:
+                self._views.clear()
+                self._watchers.clear()
+                self._head = None
+                return
+            book_ids = [book['book_id'] for book in entry.get('books', [])] + list(entry.get('deleted', []))
+            if book_ids:
+                self._head = None
+            keys = [('book', book_id) for book_id in book_ids]
+            keys += [('code', record.get('borrow_code')) for record in entry.get('borrowals', [])]
+            for key in keys:
+                for email in list(self._watchers.get(key, ())):
+                    self._drop(email)
+            for record in entry.get('borrowals', []):
+                self._drop(record.get('original_email'))
+
+    def _drop(self, email):
+        cached = self._views.pop(email, None)
+        if cached is None:
+            return
+        for key in self._keys(cached[1]):
+            emails = self._watchers.get(key)
+            if emails is not None:
+                emails.discard(email)
+                if not emails:
+                    del self._watchers[key]
+
+    @staticmethod
+    def _keys(view):
+        return [('book', b) for b in view['book_ids']] + [('code', c) for c in view['borrow_codes']]
+
+    def _store(self, email, day, view):
+        self._drop(email)
+        self._views[email] = (day, view)
+        for key in self._keys(view):
+            self._watchers.setdefault(key, set()).add(email)
+        while len(self._views) > self.max_users:
+            self._drop(next(iter(self._views)))
+
+    # --- querying ---
+    def _recommendations(self, exclude_ids, limit):
+        with self._lock:
+            head, generation = self._head, self._generation
+        if head is None:
+            head = self._load_available(limit=self.head_size)
+            with self._lock:
+                if generation == self._generation:
+                    self._head = head
+        picks = [book for book in head if book['book_id'] not in exclude_ids][:limit]
+        if len(picks) < limit and len(head) >= self.head_size:
+            picks = self._load_available(exclude_ids=exclude_ids, limit=limit)
+        return [inventory.public(book) for book in picks]
+
+    def get(self, email, today, recommendations=6):
+        """{"borrowed_books", "due_soon_books", "recommendations"} for `email` as of `today`."""
+        with self._lock:
+            cached = self._views.get(email)
+            if cached is not None and cached[0] == today:
+                self._views.move_to_end(email)
+                view = cached[1]
+            else:
+                view = None
+            generation = self._generation
+        if view is None:
+            view = self._build_view(email, today)
+            with self._lock:
+                if generation == self._generation:
+                    self._store(email, today, view)
+        return {
+            "borrowed_books": view['borrowed_books'],
+            "due_soon_books": view['due_soon_books'],
+            "recommendations": self._recommendations(view['book_ids'], recommendations)
+        }
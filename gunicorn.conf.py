@@ -0,0 +1,24 @@
+"""gunicorn settings, read from the working directory: `gunicorn --bind 0.0.0.0:$PORT`.
+
+With PRELOAD_APP=1 (default) the master runs create_app(warm=True) once,
+loading the catalog, indexes, receipt fonts and the Firebase SDK, and the
+workers fork from it warm. Background threads and database connections do
+not survive a fork, so the master closes its connections before forking
+and every worker starts its own compactor and job threads.
+"""
+import os
+
+wsgi_app = 'app:create_app(start_background=False, warm=True)'
+preload_app = os.getenv('PRELOAD_APP', '1') != '0'
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+
+
+def when_ready(server):
+    if preload_app:
+        import app
+        app.release_connections()
+
+
+def post_worker_init(worker):
+    import app
+    app.start_background_tasks()
@@ -0,0 +1,62 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import serialization
+from journal import file_lock
+
+
+STAMP_FORMAT = '%y%m%d%H%M%S'
+
+
+class IdGenerator:
+    """Monotonic, collision-free ids shared by every worker using `path`.
+
+    An id is prefix + yymmddHHMMSS + a 3-digit sequence within that second,
+    e.g. 'M261017093015004', so ids sort in issue order and after the older
+    second-resolution codes ('M261017093015'). The last (stamp, sequence)
+    issued per prefix is kept in `path` under an flock. Past 1000 ids in
+    one second, or if the clock steps back, the stamp runs ahead of the
+    clock instead of repeating.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True) if os.path.dirname(path) else None
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return serialization.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write(self, state):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(serialization.dumpb(state))
+        os.replace(tmp_path, self.path)
+
+    def next(self, prefix):
+        return self.next_many(prefix, 1)[0]
+
+    def next_many(self, prefix, count):
+        """`count` consecutive ids, reserved with a single file update."""
+        issued = []
+        with self._lock, file_lock(self.lock_path):
+            state = self._read()
+            last_stamp, last_seq = state.get(prefix, ('', -1))
+            for _ in range(count):
+                stamp, seq = datetime.now().strftime(STAMP_FORMAT), 0
+                if stamp <= last_stamp:
+                    stamp, seq = last_stamp, last_seq + 1
+                    if seq > 999:
+                        stamp = (datetime.strptime(stamp, STAMP_FORMAT) + timedelta(seconds=1)).strftime(STAMP_FORMAT)
+                        seq = 0
+                issued.append(f"{prefix}{stamp}{seq:03d}")
+                last_stamp, last_seq = stamp, seq
+            state[prefix] = (last_stamp, last_seq)
+            self._write(state)
+        return issued
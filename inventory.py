@@ -0,0 +1,156 @@
+import copy
+from datetime import datetime
+
+# Physical copies of a title live under book['copies']:
+#   {"copy_id": "B0001-2", "status": "available" | "borrowed", "borrow_code": "M...", "return_date": "dd/mm/YYYY"}
+# and the book-level fields older code reads are derived from them:
+#   quantity         number of copies
+#   available_count  copies on the shelf
+#   is_borrowed      every copy is out (nothing left to lend)
+#   return_date      earliest due date of the copies that are out
+# Loans from before copies existed have borrow_code None on their copy.
+# Every write bumps book['rev'], so a client can send back the rev it read
+# and have its update refused if the book changed in between.
+
+AVAILABLE, BORROWED = 'available', 'borrowed'
+# What unauthenticated routes may show of a book: copies hold other readers' borrow codes
+PUBLIC_FIELDS = ('book_id', 'book_name', 'author', 'quantity', 'available_count', 'is_borrowed')
+
+
+class RevisionConflict(Exception):
+    """The book changed since the revision a write was based on."""
+
+
+def _due_key(copy_):
+    try:
+        return datetime.strptime(copy_.get('return_date') or '', '%d/%m/%Y')
+    except ValueError:
+        return datetime.max
+
+
+def _new_copy(book_id, n):
+    return {"copy_id": f"{book_id}-{n}", "status": AVAILABLE, "borrow_code": None, "return_date": None}
+
+
+def _derive(book):
+    lent = [c for c in book['copies'] if c['status'] == BORROWED]
+    book['quantity'] = len(book['copies'])
+    book['available_count'] = len(book['copies']) - len(lent)
+    book['is_borrowed'] = bool(lent) and not book['available_count']
+    due = [c['return_date'] for c in sorted(lent, key=_due_key) if c.get('return_date')]
+    if due:
+        book['return_date'] = due[0]
+    else:
+        book.pop('return_date', None)
+    return book
+
+
+def normalize(book):
+    """Copy of `book` with a copies list and derived fields. Books from before
+    copies existed get `quantity` copies, the first one lent if the book was."""
+    book = {**book, 'copies': copy.deepcopy(book['copies']) if 'copies' in book else None}
+    if book['copies'] is None:
+        try:
+            quantity = max(int(book.get('quantity') or 0), 0)
+        except (TypeError, ValueError):
+            quantity = 0
+        borrowed = bool(book.get('is_borrowed'))
+        book['copies'] = [_new_copy(book['book_id'], n + 1) for n in range(max(quantity, 1 if borrowed else 0))]
+        if borrowed:
+            book['copies'][0].update(status=BORROWED, return_date=book.get('return_date'))
+    return _derive(book)
+
+
+def public(book):
+    """The PUBLIC_FIELDS of `book`."""
+    return {field: book[field] for field in PUBLIC_FIELDS if field in book}
+
+
+def lent_copies(book):
+    return [c for c in book.get('copies', []) if c['status'] == BORROWED]
+
+
+def allocate(book, borrow_code, return_date):
+    """Lend any free copy. Returns (updated book, copy) or (None, None) if none is free."""
+    book = normalize(book)
+    for copy_ in book['copies']:
+        if copy_['status'] == AVAILABLE:
+            copy_.update(status=BORROWED, borrow_code=borrow_code, return_date=return_date)
+            return _derive(book), copy_
+    return None, None
+
+
+def release(book, borrow_code=None, legacy=False):
+    """Put back the copy lent under `borrow_code`; without one, the only lent copy.
+
+    With `legacy` (the record predates copies) a code that no copy carries
+    falls back to a copy lent with borrow_code None. Returns (updated book,
+    the copy as it was) or (None, None) if nothing matches.
+    """
+    book = normalize(book)
+    lent = lent_copies(book)
+    if borrow_code is None:
+        target = lent[0] if len(lent) == 1 else None
+    else:
+        target = next((c for c in lent if c['borrow_code'] == borrow_code), None)
+        if target is None and legacy:
+            target = next((c for c in lent if c['borrow_code'] is None), None)
+    if target is None:
+        return None, None
+    released = dict(target)
+    target.update(status=AVAILABLE, borrow_code=None, return_date=None)
+    return _derive(book), released
+
+
+def resize(book, quantity):
+    """Book with `quantity` copies: adds new ones, or removes copies on the shelf.
+    Raises ValueError if that would remove a lent copy."""
+    book = normalize(book)
+    copies = book['copies']
+    if quantity < 0:
+        raise ValueError("quantity must not be negative")
+    next_n = max([int(c['copy_id'].rsplit('-', 1)[-1]) for c in copies if c['copy_id'].rsplit('-', 1)[-1].isdigit()] + [0]) + 1
+    while len(copies) < quantity:
+        copies.append(_new_copy(book['book_id'], next_n))
+        next_n += 1
+    surplus = len(copies) - quantity
+    if surplus > sum(1 for c in copies if c['status'] == AVAILABLE):
+        raise ValueError("cannot remove copies that are lent out")
+    for copy_ in reversed(list(copies)):
+        if surplus and copy_['status'] == AVAILABLE:
+            copies.remove(copy_)
+            surplus -= 1
+    return _derive(book)
+
+
+def next_rev(book):
+    """Set `book['rev']` one past the revision it was built from. Returns the book."""
+    book['rev'] = book.get('rev', 0) + 1
+    return book
+
+
+def check_rev(book, rev):
+    """Raise RevisionConflict if `rev` is given and is not the book's current revision."""
+    if rev is not None and book.get('rev', 0) != rev:
+        raise RevisionConflict(f"{book['book_id']} is at rev {book.get('rev', 0)}, not {rev}")
+
+
+def is_returned(record):
+    """Whether a borrow record is marked closed: a `returned_date`, or `returned`
+    as stamped on records archived after an unrecorded (pre-copies) return."""
+    return bool(record.get('returned_date') or record.get('returned'))
+
+
+def loan_is_active(record, book):
+    """Whether a borrow record is still open: not marked returned and its copy
+    (or, for pre-copies records, an unassigned lent copy) is still out."""
+    if is_returned(record):
+        return False
+    if book is None:
+        return True
+    for copy_ in lent_copies(book):
+        if copy_['borrow_code'] == record.get('borrow_code'):
+            return True
+        if copy_['borrow_code'] is None and not record.get('copy_id'):
+            return True
+    return False
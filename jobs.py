@@ -0,0 +1,176 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+import serialization
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,              -- e.g. the borrow_code, for status lookups
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,            -- queued | running | done | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,        -- not before this time (retry backoff)
+    lease_until REAL,               -- running jobs past this are reclaimed
+    last_error TEXT,
+    progress TEXT,                  -- JSON set by long handlers via set_progress()
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (state, run_after);
+CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs (key);
+"""
+
+
+def _short_error(e):
+    """One line naming the failure for the jobs row; the traceback goes to the log only."""
+    lines = str(e).strip().splitlines()
+    return f"{type(e).__name__}: {lines[0]}"[:200] if lines else type(e).__name__
+
+
+class JobQueue:
+    """Durable job queue in a SQLite file, drained by a pool of worker threads.
+
+    Every gunicorn worker may run a pool against the same file: jobs are
+    claimed inside BEGIN IMMEDIATE with a lease, so each runs once, and a job
+    whose worker died is picked up again when its lease expires. A handler
+    that raises is retried with exponential backoff until `max_attempts`.
+    """
+
+    def __init__(self, path, handlers, workers=2, max_attempts=5, backoff=5.0, lease=300.0, keep_done_for=7 * 86400):
+        self.path = path
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.keep_done_for = keep_done_for
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._threads = []
+        os.makedirs(os.path.dirname(path), exist_ok=True) if os.path.dirname(path) else None
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        if 'progress' not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+            conn.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    # --- producer side ---
+    def enqueue(self, kind, key, payload):
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO jobs (kind, key, payload, state, run_after, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+            (kind, key, serialization.dumps(payload), now, now, now))
+        self._wakeup.set()
+        return cur.lastrowid
+
+    def status(self, key):
+        """Latest job for `key` as a dict, or None."""
+        row = self._conn().execute(
+            "SELECT id, kind, state, attempts, last_error, progress, created_at, updated_at FROM jobs "
+            "WHERE key = ? ORDER BY id DESC LIMIT 1", (key,)).fetchone()
+        if not row:
+            return None
+        job = dict(zip(('id', 'kind', 'state', 'attempts', 'last_error', 'progress', 'created_at', 'updated_at'), row))
+        job['progress'] = serialization.loads(job['progress']) if job['progress'] else None
+        return job
+
+    def set_progress(self, key, progress):
+        """Record how far the running job for `key` has got (any JSON value), for status()."""
+        self._conn().execute("UPDATE jobs SET progress = ?, updated_at = ? WHERE id = "
+                             "(SELECT id FROM jobs WHERE key = ? ORDER BY id DESC LIMIT 1)",
+                             (serialization.dumps(progress), time.time(), key))
+
+    def counts(self):
+        """{(kind, state): number of jobs} over the whole queue."""
+        return {(kind, state): n for kind, state, n in
+                self._conn().execute("SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state")}
+
+    def close(self):
+        """Close the calling thread's connection; it is reopened on next use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+    # --- consumer side ---
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _claim(self):
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts FROM jobs "
+                "WHERE (state = 'queued' AND run_after <= ?) OR (state = 'running' AND lease_until < ?) "
+                "ORDER BY run_after LIMIT 1", (now, now)).fetchone()
+            if row:
+                conn.execute("UPDATE jobs SET state = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? "
+                             "WHERE id = ?", (now + self.lease, now, row[0]))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return row
+
+    def run_pending(self):
+        """Run one ready job in the calling thread. Returns False if none was ready."""
+        row = self._claim()
+        if not row:
+            return False
+        job_id, kind, payload, attempts = row
+        attempts += 1
+        try:
+            self.handlers[kind](serialization.loads(payload))
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) attempt {attempts} failed: {e}\n{traceback.format_exc(limit=3)}")
+            if attempts >= self.max_attempts:
+                state, run_after = 'failed', time.time()
+            else:
+                state, run_after = 'queued', time.time() + self.backoff * 2 ** (attempts - 1)
+            self._conn().execute("UPDATE jobs SET state = ?, run_after = ?, lease_until = NULL, last_error = ?, updated_at = ? "
+                                 "WHERE id = ?", (state, run_after, _short_error(e), time.time(), job_id))
+        else:
+            self._conn().execute("UPDATE jobs SET state = 'done', lease_until = NULL, last_error = NULL, updated_at = ? "
+                                 "WHERE id = ?", (time.time(), job_id))
+        return True
+
+    def purge(self):
+        """Drop finished jobs older than `keep_done_for`."""
+        self._conn().execute("DELETE FROM jobs WHERE state = 'done' AND updated_at < ?",
+                             (time.time() - self.keep_done_for,))
+
+    def _work(self):
+        last_purge = 0
+        while True:
+            try:
+                if time.time() - last_purge > 3600:
+                    self.purge()
+                    last_purge = time.time()
+                if self.run_pending():
+                    continue
+            except Exception as e:
+                print(f"Job worker error: {e}")
+            self._wakeup.wait(1.0)
+            self._wakeup.clear()
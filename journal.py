@@ -0,0 +1,96 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+
+import serialization
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: locking falls back to in-process only
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Inter-process lock on `path` (flock). No-op across processes without fcntl."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class Journal:
+    """Append-only write-ahead log: one compact JSON object per line, fsync'd.
+
+    Readers keep an (inode, offset) cursor and only parse lines appended since
+    their last read. Compaction swaps in a fresh empty file, which changes the
+    inode so readers know to start over from the snapshot.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True) if os.path.dirname(path) else None
+
+    def identity(self):
+        """(inode, size) of the journal file, or None if it does not exist."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size)
+
+    def read_from(self, offset):
+        """Entries after byte `offset`, plus the offset just past the last complete line.
+
+        A torn trailing line (crash mid-append) is left unread.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        entries = []
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                entries.append(serialization.loads(line))
+            except json.JSONDecodeError:
+                print(f"Skipping corrupt journal line in {self.path}")
+        return entries, offset + end
+
+    def append(self, entry, offset=None):
+        """Durably append `entry`. Returns the new end offset.
+
+        When the caller knows where the last complete line ends (`offset`),
+        any torn tail left by a crash is cut off first so it cannot merge
+        with this record.
+        """
+        line = serialization.dumpb(entry) + b'\n'
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                if offset is not None and os.fstat(fd).st_size != offset:
+                    os.ftruncate(fd, offset)
+                os.write(fd, line)
+                os.fsync(fd)
+                return os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+
+    def reset(self):
+        """Atomically replace the journal with an empty file."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
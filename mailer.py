@@ -0,0 +1,143 @@
+import os
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SMTPPool:
+    """A few authenticated SMTP sessions kept open and shared between threads.
+
+    At most `size` sessions exist at once; callers beyond that wait. A session
+    that has been idle longer than `idle_check` is probed with NOOP before
+    reuse, and any session that errors is dropped and replaced, so a send is
+    retried once on a fresh connection after a disconnect.
+    """
+
+    def __init__(self, host, port, username=None, password=None, security='ssl', size=2, timeout=30, idle_check=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.security = security
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []           # [(smtp, last_used)]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """SMTP_HOST/SMTP_PORT/SMTP_SECURITY (ssl|starttls|none)/SMTP_POOL_SIZE, Gmail by default."""
+        return cls(
+            host=os.getenv('SMTP_HOST', 'smtp.gmail.com'),
+            port=int(os.getenv('SMTP_PORT', '465')),
+            username=os.getenv('SMTP_USERNAME', os.getenv('EMAIL_ADDRESS')),
+            password=os.getenv('SMTP_PASSWORD', os.getenv('EMAIL_PASSWORD')),
+            security=os.getenv('SMTP_SECURITY', 'ssl').lower(),
+            size=int(os.getenv('SMTP_POOL_SIZE', '2'))
+        )
+
+    def _connect(self):
+        if self.security == 'ssl':
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.security == 'starttls':
+                smtp.starttls()
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    @staticmethod
+    def _discard(smtp):
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                smtp, last_used = self._idle.pop()
+            if time.time() - last_used < self.idle_check:
+                return smtp
+            try:
+                if smtp.noop()[0] == 250:
+                    return smtp
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._discard(smtp)
+        return self._connect()
+
+    @contextmanager
+    def session(self):
+        """An authenticated SMTP connection, returned to the pool unless it failed."""
+        self._slots.acquire()
+        smtp = None
+        try:
+            smtp = self._checkout()
+            yield smtp
+        except BaseException:
+            if smtp is not None:
+                self._discard(smtp)
+            raise
+        else:
+            with self._lock:
+                self._idle.append((smtp, time.time()))
+        finally:
+            self._slots.release()
+
+    def send(self, msg):
+        """Send one message, reconnecting once if the pooled session went away."""
+        try:
+            with self.session() as smtp:
+                smtp.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError):
+            with self.session() as smtp:
+                smtp.send_message(msg)
+
+    def send_many(self, messages):
+        """Send messages over one session. Returns [(msg, error)] for the ones that failed.
+
+        A message whose session drops is retried once on a new session; if no
+        session can be opened at all, every remaining message fails.
+        """
+        failures = []
+        pending = list(messages)
+        retried = False
+        while pending:
+            connected = False
+            try:
+                with self.session() as smtp:
+                    connected = True
+                    while pending:
+                        msg = pending[0]
+                        try:
+                            smtp.send_message(msg)
+                        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                            failures.append((msg, e))
+                        pending.pop(0)
+                        retried = False
+            except (smtplib.SMTPException, OSError) as e:
+                if not connected:
+                    failures.extend((msg, e) for msg in pending)
+                    break
+                # Session dropped mid-batch: retry the current message once on a new session
+                if retried:
+                    failures.append((pending.pop(0), e))
+                retried = not retried
+        return failures
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            self._discard(smtp)
@@ -0,0 +1,200 @@
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from functools import wraps
+
+import serialization
+
+
+# Latency buckets in seconds, from a cache hit to a slow external call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger('libra')
+
+# (started, {step: seconds}) of the request being handled: per thread under WSGI,
+# per task under asgi.py (and copied into the threads a task hands work to)
+_request = contextvars.ContextVar('libra_request', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Registry:
+    """In-process counters, histograms and callback gauges, rendered as Prometheus text.
+
+    Recording is a dict lookup and a bisect under one lock, so it is cheap
+    enough for every request. Values are per process: with several
+    gunicorn workers each one reports its own (see the `pid` in
+    libra_process_info).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._meta = {}         # name -> (type, help, label names)
+        self._counters = {}     # (name, label values) -> value
+        self._histograms = {}   # (name, label values) -> [bucket counts..., +Inf count, sum]
+        self._gauges = []       # (name, help, fn, label names); fn returns a number or {label values: number}
+
+    def _declare(self, name, kind, help, labels):
+        if name not in self._meta:
+            self._meta[name] = (kind, help, tuple(labels))
+
+    def counter(self, name, help, labels=()):
+        self._declare(name, 'counter', help, labels)
+
+    def histogram(self, name, help, labels=()):
+        self._declare(name, 'histogram', help, labels)
+
+    def gauge(self, name, help, fn, labels=()):
+        """Register `fn()` to be read at scrape time: a number, or {label values: number}."""
+        self._gauges.append((name, help, fn, tuple(labels)))
+
+    def inc(self, name, *labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, *labels):
+        key = (name, labels)
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += seconds
+
+    def render(self):
+        """All series in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+        lines = []
+        for name, (kind, help, label_names) in self._meta.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (series, values), value in sorted(counters.items()):
+                    if series == name:
+                        lines.append(f"{name}{_labels(label_names, values)} {value}")
+                continue
+            for (series, values), counts in sorted(histograms.items()):
+                if series != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                    lines.append(f"{name}_bucket{_labels(label_names, values, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(label_names, values)} {counts[-1]:.6f}")
+                lines.append(f"{name}_count{_labels(label_names, values)} {cumulative}")
+        for name, help, fn, label_names in self._gauges:
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"Metrics gauge {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for values, v in (value.items() if isinstance(value, dict) else [((), value)]):
+                lines.append(f"{name}{_labels(label_names, values)} {v}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+registry.histogram('libra_http_request_duration_seconds', 'Time to build the response, by route template.',
+                   ('method', 'route'))
+registry.counter('libra_http_requests_total', 'Responses by route template and status code.',
+                 ('method', 'route', 'status'))
+registry.histogram('libra_step_duration_seconds', 'Time spent in an external call or heavy step.', ('step',))
+registry.counter('libra_step_errors_total', 'Steps that raised.', ('step',))
+
+
+# --- per-request span collection (for the structured request log line) ---
+def begin_request():
+    _request.set((time.perf_counter(), {}))
+
+def end_request():
+    """(seconds since begin_request, {step: seconds}) and clear; (None, {}) outside a request."""
+    state = _request.get()
+    if state is None:
+        return None, {}
+    _request.set(None)
+    return time.perf_counter() - state[0], state[1]
+
+
+def record_step(step, seconds, failed=False):
+    registry.observe('libra_step_duration_seconds', seconds, step)
+    if failed:
+        registry.inc('libra_step_errors_total', step)
+    state = _request.get()
+    if state is not None:
+        steps = state[1]
+        steps[step] = steps.get(step, 0.0) + seconds
+
+
+class timer:
+    """Time a block or function as `step`: `with timer('smtp.send'):` or `@timer('pdf.render')`."""
+
+    __slots__ = ('step', 'started')
+
+    def __init__(self, step):
+        self.step = step
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record_step(self.step, time.perf_counter() - self.started, exc_type is not None)
+
+    def __call__(self, fn):
+        step = self.step
+        @wraps(fn)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                record_step(step, time.perf_counter() - started, failed)
+        return timed
+
+
+class Timed:
+    """Proxy timing every public method of `target` as step '<prefix>.<method>'."""
+
+    def __init__(self, target, prefix):
+        self._target = target
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        timed = timer(f"{self._prefix}.{name}")(attr)
+        setattr(self, name, timed)  # later lookups skip __getattr__
+        return timed
+
+
+def log_request(method, route, status, seconds, steps):
+    """One JSON line per request on the 'libra' logger: route, status, total and per-step milliseconds."""
+    if log.isEnabledFor(logging.INFO):
+        log.info(serialization.dumps({
+            'event': 'request', 'method': method, 'route': route, 'status': status,
+            'ms': round(seconds * 1000, 2),
+            'steps': {step: round(s * 1000, 2) for step, s in steps.items()}
+        }))
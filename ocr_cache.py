@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr_results (
+    key TEXT PRIMARY KEY,           -- sha256 of the decoded image bytes
+    text TEXT NOT NULL,             -- clean_book_text() output
+    size INTEGER NOT NULL,          -- bytes counted against max_bytes
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ocr_last_used ON ocr_results (last_used);
+"""
+
+
+class OCRCache:
+    """Persistent LRU cache of OCR results in a SQLite file, shared by all workers.
+
+    Every hit refreshes the entry's `last_used`; each insert evicts the least
+    recently used entries until at most `max_entries` remain and their text
+    takes at most `max_bytes`.
+    """
+
+    def __init__(self, path, max_entries=5000, max_bytes=16 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True) if os.path.dirname(path) else None
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Cached text for `key`, or None on a miss."""
+        conn = self._conn()
+        row = conn.execute("SELECT text FROM ocr_results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        conn.execute("UPDATE ocr_results SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key, text):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                "INSERT INTO ocr_results (key, text, size, last_used) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET text=excluded.text, size=excluded.size, last_used=excluded.last_used",
+                (key, text, len(text.encode('utf-8')) + len(key), time.time()))
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr_results").fetchone()
+            if count > self.max_entries or total > self.max_bytes:
+                self._evict(conn, count, total)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _evict(self, conn, count, total):
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM ocr_results ORDER BY last_used"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM ocr_results WHERE key = ?", doomed)
+
+    def close(self):
+        """Close the calling thread's connection; it is reopened on next use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+    def stats(self):
+        count, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr_results").fetchone()
+        return {'entries': count, 'bytes': total, 'hits': self.hits, 'misses': self.misses}
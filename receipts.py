@@ -0,0 +1,171 @@
+import os
+import io
+import copy
+import tempfile
+import threading
+import unicodedata
+
+from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+from fontTools import ttLib
+from fontTools import subset as ftsubset
+
+from barcodes import draw_barcode
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+FONT_FAMILY = 'BeVietnamPro'
+FONT_FILES = {'': 'BeVietnamPro-Regular.ttf', 'B': 'BeVietnamPro-Bold.ttf'}
+
+# Everything a receipt can reasonably contain: ASCII, Latin-1, Latin Extended-A,
+# Vietnamese letters (Ơ Ư and the U+1EA0 block), combining marks and punctuation.
+RECEIPT_CHARSET = ''.join(chr(c) for c in [
+    *range(0x20, 0x7F), *range(0xA0, 0x180), 0x1A0, 0x1A1, 0x1AF, 0x1B0,
+    *range(0x300, 0x324), *range(0x1EA0, 0x1EFA), *range(0x2010, 0x2028), 0x20AB, 0x20AC,
+])
+
+# Fixed layout (mm from the top of an A4 page, 10 mm margins)
+DETAILS_Y = 30
+BARCODE_X, BARCODE_Y, BARCODE_W, BARCODE_H = 75, 68, 60, 16
+FOOTER_Y = 92
+
+# Label sheets: A4, 3 columns x 8 rows of 70 x 37 mm labels
+LABEL_COLUMNS, LABEL_ROWS = 3, 8
+LABEL_W, LABEL_H = 70, 37
+LABEL_TOP = 0.5
+
+
+def _subset_font(path, cache_dir):
+    """Cut a font down to RECEIPT_CHARSET once; cached on disk by source size/mtime."""
+    st = os.stat(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    cached = os.path.join(cache_dir, f"{name}-{st.st_size}-{st.st_mtime_ns}.ttf")
+    if not os.path.exists(cached):
+        options = ftsubset.Options()
+        options.layout_features = []
+        options.notdef_outline = True
+        options.recommended_glyphs = True
+        options.hinting = False
+        font = ttLib.TTFont(path)
+        subsetter = ftsubset.Subsetter(options)
+        subsetter.populate(text=RECEIPT_CHARSET)
+        subsetter.subset(font)
+        tmp_path = f"{cached}.{os.getpid()}.tmp"
+        font.save(tmp_path)
+        os.replace(tmp_path, cached)
+    return cached
+
+
+class ReceiptRenderer:
+    """Borrow receipt and barcode label PDFs from templates built once per process.
+
+    The receipt template already has the fonts parsed and the static header
+    and footer drawn; each receipt is a deep copy of it with the borrow
+    details and a vector barcode added. fpdf2 shares the parsed font tables
+    between copies, but its output step subsets those tables in place, so
+    every copy gets its own lazily loaded font file before rendering.
+    """
+
+    def __init__(self, font_dir=FONT_DIR, cache_dir=None):
+        self.font_dir = font_dir
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'libranct-fonts')
+        self._lock = threading.Lock()
+        self._fonts_template = None    # FPDF with the fonts loaded, no pages
+        self._receipt_template = None
+        self._font_bytes = {}          # fontkey -> subset font file contents
+
+    def _build_fonts_template(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        pdf = FPDF()
+        for style, filename in FONT_FILES.items():
+            path = _subset_font(os.path.join(self.font_dir, filename), self.cache_dir)
+            pdf.add_font(FONT_FAMILY, style, path)
+            with open(path, 'rb') as f:
+                self._font_bytes[f"{FONT_FAMILY.lower()}{style}"] = f.read()
+        return pdf
+
+    def _build_receipt_template(self):
+        pdf = copy.deepcopy(self._fonts_template)
+        pdf.add_page()
+        pdf.set_font(FONT_FAMILY, 'B', 16)
+        pdf.cell(0, 10, 'PHIẾU MƯỢN SÁCH - Thư viện LibraNCT', align='C', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.set_y(FOOTER_Y)
+        pdf.set_font(FONT_FAMILY, '', 10)
+        pdf.cell(0, 8, 'Vui lòng đưa phiếu này cho thủ thư để nhận sách.', align='C', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.cell(0, 8, 'Cảm ơn bạn đã sử dụng dịch vụ của LibraNCT!', align='C', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        return pdf
+
+    def _prepare(self, receipt=True):
+        with self._lock:
+            if self._fonts_template is None:
+                self._fonts_template = self._build_fonts_template()
+            if receipt and self._receipt_template is None:
+                self._receipt_template = self._build_receipt_template()
+
+    def warm_up(self):
+        """Parse the fonts and draw the receipt template now rather than on the first render."""
+        self._prepare()
+
+    def _new_document(self, receipt=True):
+        self._prepare(receipt)
+        pdf = copy.deepcopy(self._receipt_template if receipt else self._fonts_template)
+        for fontkey, font in pdf.fonts.items():
+            font.ttfont = ttLib.TTFont(io.BytesIO(self._font_bytes[fontkey]), recalcTimestamp=False, lazy=True)
+        return pdf
+
+    def render(self, details, barcode_png=None):
+        """PDF bytes for one receipt.
+
+        The borrow_code barcode is drawn as vector bars unless a pre-rendered
+        `barcode_png` (bytes or a buffer) is passed.
+        """
+        details = {k: unicodedata.normalize('NFC', str(v)) if v is not None else '' for k, v in details.items()}
+        pdf = self._new_document()
+        pdf.set_y(DETAILS_Y)
+        pdf.set_font(FONT_FAMILY, '', 12)
+        for line in (f"Tên sách: {details['book_title']}",
+                     f"Học sinh: {details['student_name']} - Lớp: {details['student_class']}",
+                     f"Ngày mượn: {details['borrow_date']}"):
+            pdf.cell(0, 8, line, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.set_font(FONT_FAMILY, 'B', 12)
+        pdf.cell(0, 8, f"Hạn trả: {details['return_date']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+        if barcode_png is None:
+            draw_barcode(pdf, details['borrow_code'], BARCODE_X, BARCODE_Y, BARCODE_W, BARCODE_H)
+            pdf.set_xy(BARCODE_X, BARCODE_Y + BARCODE_H + 1)
+            pdf.set_font(FONT_FAMILY, '', 10)
+            pdf.cell(BARCODE_W, 5, details['borrow_code'], align='C')
+        else:
+            if isinstance(barcode_png, (bytes, bytearray)):
+                barcode_png = io.BytesIO(barcode_png)
+            barcode_png.seek(0)
+            pdf.image(barcode_png, x=70, y=BARCODE_Y - 1, w=70, type='PNG')
+        return bytes(pdf.output())
+
+    def render_labels(self, labels):
+        """A4 sheets of barcode labels, e.g. shelf labels for book_ids or receipt reprints.
+
+        `labels` is an iterable of (code, caption) pairs; each label gets the
+        code as vector bars, the code in text and the caption on one line.
+        """
+        pdf = self._new_document(receipt=False)
+        pdf.set_auto_page_break(False)
+        per_page = LABEL_COLUMNS * LABEL_ROWS
+        for i, (code, caption) in enumerate(labels):
+            if i % per_page == 0:
+                pdf.add_page()
+            col, row = i % LABEL_COLUMNS, (i % per_page) // LABEL_COLUMNS
+            x = (pdf.w - LABEL_COLUMNS * LABEL_W) / 2 + col * LABEL_W
+            y = LABEL_TOP + row * LABEL_H
+            draw_barcode(pdf, code, x + 8, y + 4, LABEL_W - 16, 16)
+            pdf.set_xy(x + 4, y + 21)
+            pdf.set_font(FONT_FAMILY, 'B', 9)
+            pdf.cell(LABEL_W - 8, 5, code, align='C')
+            pdf.set_xy(x + 4, y + 26)
+            pdf.set_font(FONT_FAMILY, '', 8)
+            caption = unicodedata.normalize('NFC', str(caption or ''))
+            while caption and pdf.get_string_width(caption) > LABEL_W - 8:
+                caption = caption[:-2] + '…'
+            pdf.cell(LABEL_W - 8, 5, caption, align='C')
+        if pdf.page == 0:
+            pdf.add_page()
+        return bytes(pdf.output())
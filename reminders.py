@@ -0,0 +1,212 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import inventory
+import serialization
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    day TEXT NOT NULL,              -- 'YYYY-mm-dd' of the run
+    recipient TEXT NOT NULL,        -- the student's account email (lowercase)
+    state TEXT NOT NULL,            -- sending | sent | nothing_new
+    borrow_codes TEXT,              -- JSON list of the loans in the digest
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (day, recipient)
+);
+CREATE TABLE IF NOT EXISTS notified (
+    borrow_code TEXT NOT NULL,
+    stage TEXT NOT NULL,            -- due_soon | overdue-<n>, see ReminderScheduler.stage()
+    day TEXT NOT NULL,
+    PRIMARY KEY (borrow_code, stage)
+);
+"""
+
+
+class ReminderScheduler:
+    """Daily digest email per student of their loans due within `days` days or overdue.
+
+    Loans come from `due_until(day)`, the due-date ordered index of lent
+    copies in CatalogStats, so a run is one bisect plus a lookup of those
+    borrow records, never a scan of all of them. Every digest is claimed
+    for (day, student) in a SQLite log before it is sent, so a restart or
+    another gunicorn worker on the same schedule does not send it again.
+    It is only sent when it holds a loan at a stage the student has not
+    been told about: due soon, then overdue, again every `overdue_every`
+    days. All digests of a run go out over one SMTP session via
+    `send_many`. A digest that fails to send is released and retried on
+    the next check.
+    """
+
+    def __init__(self, path, due_until, get_borrowals, build_message, send_many, days=3, hour=7,
+                 overdue_every=7, dry_run=False, check_every=600, lease=3600):
+        self.path = path
+        self.due_until = due_until
+        self.get_borrowals = get_borrowals
+        self.build_message = build_message
+        self.send_many = send_many
+        self.days = days
+        self.hour = hour
+        self.overdue_every = overdue_every
+        self.dry_run = dry_run
+        self.check_every = check_every
+        self.lease = lease
+        self._local = threading.local()
+        self._thread = None
+        self._done_day = None
+        os.makedirs(os.path.dirname(path), exist_ok=True) if os.path.dirname(path) else None
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Close the calling thread's connection; it is reopened on next use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+    def stage(self, days_left):
+        if days_left >= 0:
+            return 'due_soon'
+        return f"overdue-{(-days_left - 1) // self.overdue_every}"
+
+    # --- collecting ---
+    def collect(self, today):
+        """{recipient: digest} of open loans due by today + `days`, grouped by the borrower's account email."""
+        due = self.due_until(today + timedelta(days=self.days))
+        records = self.get_borrowals([code for *_, code in due if code])
+        digests = {}
+        for due_key, book_id, copy_id, code in due:
+            record = records.get(code)
+            if not record or inventory.is_returned(record):
+                continue
+            recipient = (record.get('original_email') or record.get('contact_email') or '').strip().lower()
+            if not recipient:
+                continue
+            days_left = (datetime.strptime(due_key, '%Y-%m-%d').date() - today).days
+            digest = digests.setdefault(recipient, {
+                'recipient': recipient, 'student_name': record.get('student_name'), 'recipients': set(), 'loans': []})
+            digest['recipients'].update(r for r in (record.get('original_email'), record.get('contact_email')) if r)
+            digest['loans'].append({
+                'borrow_code': code, 'book_id': book_id, 'copy_id': copy_id, 'book_title': record.get('book_title'),
+                'return_date': record.get('return_date'), 'days_left': days_left, 'stage': self.stage(days_left)})
+        for digest in digests.values():
+            digest['recipients'] = sorted(digest['recipients'])
+        return digests
+
+    # --- sent log ---
+    def _claim(self, day, recipient, codes):
+        """Take (day, recipient) unless it was sent, or another process is sending it right now."""
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO digests (day, recipient, state, borrow_codes, updated_at) VALUES (?, ?, 'sending', ?, ?) "
+            "ON CONFLICT (day, recipient) DO UPDATE SET state = 'sending', borrow_codes = excluded.borrow_codes, "
+            "updated_at = excluded.updated_at WHERE digests.state = 'sending' AND digests.updated_at < ?",
+            (day, recipient, serialization.dumps(codes), now, now - self.lease))
+        return cur.rowcount == 1
+
+    def _release(self, day, recipient):
+        self._conn().execute("DELETE FROM digests WHERE day = ? AND recipient = ? AND state = 'sending'", (day, recipient))
+
+    def _finish(self, day, recipient, state, loans=()):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany("INSERT OR IGNORE INTO notified (borrow_code, stage, day) VALUES (?, ?, ?)",
+                             [(loan['borrow_code'], loan['stage'], day) for loan in loans])
+            conn.execute("UPDATE digests SET state = ?, updated_at = ? WHERE day = ? AND recipient = ?",
+                         (state, time.time(), day, recipient))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _already_notified(self, loans):
+        """{(borrow_code, stage)} already told for these loans."""
+        codes = sorted({loan['borrow_code'] for loan in loans})
+        found = set()
+        for i in range(0, len(codes), 500):
+            chunk = codes[i:i + 500]
+            found.update(self._conn().execute(
+                f"SELECT borrow_code, stage FROM notified WHERE borrow_code IN ({','.join('?' * len(chunk))})", chunk))
+        return found
+
+    # --- running ---
+    def run(self, today=None, dry_run=None):
+        """Send today's digests. Returns a summary; with dry_run, the digests instead, with nothing sent or logged."""
+        today = today or datetime.now().date()
+        dry_run = self.dry_run if dry_run is None else dry_run
+        day = today.isoformat()
+        digests = self.collect(today)
+        summary = {'day': day, 'dry_run': dry_run, 'loans': sum(len(d['loans']) for d in digests.values()),
+                   'digests': len(digests), 'sent': 0, 'nothing_new': 0, 'skipped': 0, 'failed': 0}
+        if dry_run:
+            summary['preview'] = list(digests.values())
+            return summary
+
+        batch = []
+        for recipient, digest in digests.items():
+            if not self._claim(day, recipient, [loan['borrow_code'] for loan in digest['loans']]):
+                summary['skipped'] += 1
+                continue
+            told = self._already_notified(digest['loans'])
+            new = [loan for loan in digest['loans'] if (loan['borrow_code'], loan['stage']) not in told]
+            if not new:
+                self._finish(day, recipient, 'nothing_new')
+                summary['nothing_new'] += 1
+                continue
+            try:
+                batch.append((digest, new, self.build_message(digest, today)))
+            except Exception as e:
+                print(f"Could not build reminder for {recipient}: {e}")
+                self._release(day, recipient)
+                summary['failed'] += 1
+
+        failures = self.send_many([msg for _, _, msg in batch]) if batch else []
+        failed = {id(msg): error for msg, error in failures}
+        for digest, new, msg in batch:
+            if id(msg) in failed:
+                print(f"Reminder to {digest['recipient']} failed: {failed[id(msg)]}")
+                self._release(day, digest['recipient'])
+                summary['failed'] += 1
+            else:
+                self._finish(day, digest['recipient'], 'sent', new)
+                summary['sent'] += 1
+        return summary
+
+    def tick(self, now=None):
+        """Run once a day from `hour` on; a run with failures is repeated on the next tick. Returns the summary or None."""
+        now = now or datetime.now()
+        if now.hour < self.hour or self._done_day == now.date():
+            return None
+        summary = self.run(now.date())
+        if not summary['failed']:
+            self._done_day = now.date()
+        print(f"Reminders {summary['day']}: {summary['digests']} digests, {summary['sent']} sent, "
+              f"{summary['nothing_new']} nothing new, {summary['skipped']} skipped, {summary['failed']} failed"
+              f"{' (dry run)' if summary['dry_run'] else ''}")
+        return summary
+
+    def start(self):
+        if self._thread:
+            return
+        def run():
+            while True:
+                try:
+                    self.tick()
+                except Exception as e:
+                    print(f"Reminder run failed: {e}")
+                time.sleep(self.check_every)
+        self._thread = threading.Thread(target=run, name='reminders', daemon=True)
+        self._thread.start()
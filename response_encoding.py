@@ -0,0 +1,86 @@
+"""Response serialization and compression for the Flask app.
+
+FastJSONProvider makes jsonify/request.json go through `serialization`
+(orjson when installed). `compress()` applies gzip, or brotli when the
+`brotli` package is installed and the client prefers it, to compressible
+responses: buffered bodies of at least `min_bytes`, and streamed exports
+chunk by chunk as they are produced.
+"""
+import zlib
+
+from flask.json.provider import DefaultJSONProvider
+
+import serialization
+
+try:
+    import brotli
+except ImportError:  # optional: without it responses are gzip-only
+    brotli = None
+
+COMPRESSIBLE_TYPES = frozenset({'application/json', 'application/x-ndjson', 'text/csv', 'text/plain',
+                                'text/html', 'image/svg+xml'})
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+# gzip 4 is ~95% of level 6's ratio on catalog JSON at ~70% of the CPU
+GZIP_LEVEL = 4
+BROTLI_QUALITY = 4
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify and request.json through `serialization`: compact, UTF-8, keys in insertion order."""
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get('indent'):  # debug-mode pretty printing
+            return super().dumps(obj, **kwargs)
+        return serialization.dumps(obj, default=self.default)
+
+    def loads(self, s, **kwargs):
+        return serialization.loads(s)
+
+
+def _compressor(encoding, level):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level['br'])
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(level['gzip'], zlib.DEFLATED, 31)  # wbits 31: gzip container
+    return compressor.compress, compressor.flush
+
+
+def _compressed_stream(chunks, encoding, level):
+    process, finish = _compressor(encoding, level)
+    for chunk in chunks:
+        out = process(chunk)
+        if out:
+            yield out
+    yield finish()
+
+
+def compress(response, accept_encodings, min_bytes=1024, gzip_level=GZIP_LEVEL, brotli_quality=BROTLI_QUALITY):
+    """Encode `response` in place for the best of ENCODINGS the client accepts. Returns it."""
+    if response.mimetype not in COMPRESSIBLE_TYPES or response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accept_encodings.best_match(ENCODINGS)
+    if not encoding or response.direct_passthrough or 'Content-Encoding' in response.headers \
+            or 'Content-Range' in response.headers:
+        return response
+    level = {'gzip': gzip_level, 'br': brotli_quality}
+    if response.is_streamed:
+        response.response = _compressed_stream(response.iter_encoded(), encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        process, finish = _compressor(encoding, level)
+        compressed = process(data) + finish()
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # Same resource, different bytes: a strong ETag would claim byte-identity
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,246 @@
+import re
+import bisect
+import threading
+import unicodedata
+
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# Field weights: an id or title hit matters more than an author hit
+TITLE_WEIGHT, AUTHOR_WEIGHT, ID_WEIGHT = 2, 1, 3
+# Match kinds: whole token, token prefix (typeahead), substring (trigram)
+EXACT, PREFIX, SUBSTRING = 3, 2, 1
+
+
+def fold(text):
+    """Lowercase and strip Vietnamese diacritics: 'Tai nạn Đà Nẵng' -> 'tai nan da nang'."""
+    text = unicodedata.normalize('NFD', str(text or '').lower()).replace('đ', 'd')
+    return ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+
+def tokenize(text):
+    return _TOKEN_RE.findall(fold(text))
+
+def _trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+def _padded_trigrams(tokens):
+    """Trigrams of ' token ' for each token, so short words and word edges count too."""
+    grams = set()
+    for token in tokens:
+        grams |= _trigrams(f' {token} ')
+    return grams
+
+
+class SearchIndex:
+    """Accent-insensitive inverted + trigram index over book_name, author and book_id.
+
+    `load_books` is called to (re)build the index lazily whenever it has been
+    reset; `on_change` keeps it up to date incrementally from store change
+    events, so adding or editing one book only re-indexes that book.
+    """
+
+    def __init__(self, load_books):
+        self._load_books = load_books
+        self._lock = threading.RLock()
+        self._stale = True
+        self._pending = None    # change entries seen while a rebuild is loading
+        self._docs = {}         # book_id -> {'title': folded title, 'tokens': {token: weight}, 'grams': title trigrams}
+        self._order = {}        # book_id -> insertion sequence, for stable unranked listing
+        self._seq = 0
+        self._postings = {}     # token -> {book_id: field weight}
+        self._vocab = []        # sorted tokens, for prefix lookups
+        self._trigram_map = {}  # trigram -> {book_id}
+
+    # --- maintenance ---
+    def on_change(self, entry):
+        """Store listener: apply a change entry, or reset on None (full reload)."""
+        with self._lock:
+            if entry is None:
+                self._stale = True
+            elif self._pending is not None:
+                self._pending.append(entry)
+            elif not self._stale:
+                self._apply(entry)
+
+    def _apply(self, entry):
+        for book in entry.get('books', []):
+            self.add(book)
+        for book_id in entry.get('deleted', []):
+            self.remove(book_id)
+
+    def warm_up(self):
+        """Build now instead of on the first query."""
+        self._ensure_built()
+
+    def _ensure_built(self):
+        """Rebuild from the store if reset. The store is read without holding
+        our lock (its listeners call back into us under its own lock); changes
+        arriving meanwhile are buffered and re-applied, which is safe because
+        they are upserts."""
+        with self._lock:
+            if not self._stale or self._pending is not None:
+                return
+            self._stale = False
+            self._pending = []
+        try:
+            books = self._load_books()
+        except BaseException:
+            with self._lock:
+                self._stale, self._pending = True, None
+            raise
+        with self._lock:
+            self._docs, self._order, self._postings, self._vocab, self._trigram_map = {}, {}, {}, [], {}
+            for book in books:
+                self.add(book)
+            pending, self._pending = self._pending, None
+            for entry in pending:
+                self._apply(entry)
+
+    def add(self, book):
+        """Index (or re-index) one book."""
+        with self._lock:
+            book_id = book['book_id']
+            if book_id in self._docs:
+                self.remove(book_id, keep_order=True)
+            fields = {}
+            for token in tokenize(book.get('book_name')):
+                fields[token] = max(fields.get(token, 0), TITLE_WEIGHT)
+            for token in tokenize(book.get('author')):
+                fields[token] = max(fields.get(token, 0), AUTHOR_WEIGHT)
+            for token in tokenize(book_id):
+                fields[token] = max(fields.get(token, 0), ID_WEIGHT)
+            for token, weight in fields.items():
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = {}
+                    bisect.insort(self._vocab, token)
+                posting[book_id] = weight
+                for gram in _trigrams(token):
+                    self._trigram_map.setdefault(gram, set()).add(book_id)
+            title_tokens = tokenize(book.get('book_name'))
+            self._docs[book_id] = {'title': ' '.join(title_tokens), 'tokens': fields,
+                                   'grams': _padded_trigrams(title_tokens)}
+            if book_id not in self._order:
+                self._seq += 1
+                self._order[book_id] = self._seq
+
+    def remove(self, book_id, keep_order=False):
+        with self._lock:
+            doc = self._docs.pop(book_id, None)
+            if not doc:
+                return
+            if not keep_order:
+                self._order.pop(book_id, None)
+            for token in doc['tokens']:
+                posting = self._postings.get(token, {})
+                posting.pop(book_id, None)
+                if not posting:
+                    self._postings.pop(token, None)
+                    i = bisect.bisect_left(self._vocab, token)
+                    if i < len(self._vocab) and self._vocab[i] == token:
+                        self._vocab.pop(i)
+                for gram in _trigrams(token):
+                    ids = self._trigram_map.get(gram)
+                    if ids is not None:
+                        ids.discard(book_id)
+                        if not ids:
+                            del self._trigram_map[gram]
+
+    # --- querying ---
+    def _prefix_tokens(self, prefix):
+        i = bisect.bisect_left(self._vocab, prefix)
+        while i < len(self._vocab) and self._vocab[i].startswith(prefix):
+            yield self._vocab[i]
+            i += 1
+
+    def _substring_matches(self, token):
+        """book_id -> best field weight of an indexed token containing `token`."""
+        if len(token) < 3:
+            return {}
+        candidates = None
+        for gram in _trigrams(token):
+            ids = self._trigram_map.get(gram, set())
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return {}
+        matches = {}
+        for book_id in candidates:
+            weights = [w for t, w in self._docs[book_id]['tokens'].items() if token in t]
+            if weights:
+                matches[book_id] = max(weights)
+        return matches
+
+    def _score_token(self, token):
+        scores = {}
+        for book_id, weight in self._substring_matches(token).items():
+            scores[book_id] = SUBSTRING * weight
+        for candidate in self._prefix_tokens(token):
+            kind = EXACT if candidate == token else PREFIX
+            for book_id, weight in self._postings[candidate].items():
+                scores[book_id] = max(scores.get(book_id, 0), kind * weight)
+        return scores
+
+    def search(self, query, limit=None, offset=0):
+        """Ranked book_ids matching every word of `query`. Returns (total, page_of_ids).
+
+        Each word may match a whole token, a token prefix (so the last word
+        being typed already matches) or, from three letters on, any substring.
+        An empty query lists every book in catalog order.
+        """
+        self._ensure_built()
+        with self._lock:
+            tokens = tokenize(query)
+            if not tokens:
+                ranked = sorted(self._docs, key=self._order.get)
+            else:
+                scores = None
+                for token in dict.fromkeys(tokens):
+                    token_scores = self._score_token(token)
+                    if scores is None:
+                        scores = token_scores
+                    else:
+                        scores = {b: s + token_scores[b] for b, s in scores.items() if b in token_scores}
+                    if not scores:
+                        break
+                phrase = ' '.join(tokens)
+                for book_id in scores:
+                    title = self._docs[book_id]['title']
+                    if title.startswith(phrase):
+                        scores[book_id] += 2 * len(tokens)
+                    elif phrase in title:
+                        scores[book_id] += len(tokens)
+                ranked = sorted(scores, key=lambda b: (-scores[b], self._docs[b]['title'], self._order[b]))
+            end = None if limit is None else offset + limit
+            return len(ranked), ranked[offset:end]
+
+    def match(self, text, limit=5, min_score=0.2, max_candidates=50):
+        """Fuzzy-match noisy text (e.g. OCR of a cover or spine) to books.
+
+        Returns [(book_id, score)] best first, score in 0..1: the mean of how
+        much of the title's trigrams appear in `text` and their Dice overlap.
+        A book_id appearing verbatim in the text scores 1.0.
+        """
+        self._ensure_built()
+        tokens = tokenize(text)
+        grams = _padded_trigrams(tokens)
+        with self._lock:
+            scores = {}
+            for token in tokens:
+                for book_id, weight in self._postings.get(token, {}).items():
+                    if weight == ID_WEIGHT and fold(book_id) == token:
+                        scores[book_id] = 1.0
+            shared = {}
+            for token in set(tokens):
+                for gram in _trigrams(token):
+                    for book_id in self._trigram_map.get(gram, ()):
+                        shared[book_id] = shared.get(book_id, 0) + 1
+            for book_id in sorted(shared, key=shared.get, reverse=True)[:max_candidates]:
+                doc_grams = self._docs[book_id]['grams']
+                if not doc_grams or book_id in scores:
+                    continue
+                common = len(grams & doc_grams)
+                score = (common / len(doc_grams) + 2 * common / (len(grams) + len(doc_grams))) / 2
+                if score >= min_score:
+                    scores[book_id] = round(score, 3)
+            ranked = sorted(scores, key=lambda b: (-scores[b], self._order[b]))
+            return [(book_id, scores[book_id]) for book_id in ranked[:limit]]
@@ -0,0 +1,36 @@
+"""JSON encoding shared by the data files, the journal, SQLite rows and API responses.
+
+Output is compact UTF-8 (no indentation, no \\u escapes for Vietnamese
+text). orjson is used when installed, the stdlib otherwise; either way
+`loads` accepts any valid JSON, so pretty-printed files written by older
+versions still read.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speedup; the stdlib produces the same JSON, slower
+    orjson = None
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+
+def dumpb(obj, default=None):
+    """Compact UTF-8 JSON bytes. `default(o)` converts objects JSON has no type for."""
+    if orjson:
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps(obj, default=None):
+    """Compact JSON text."""
+    if orjson:
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS).decode('utf-8')
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(data):
+    """Parse JSON from str or bytes. Raises json.JSONDecodeError (a ValueError) on bad input."""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,40 +1,109 @@
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
+from mailer import SMTPPool
 from dotenv import load_dotenv
 import os
 import base64
-import requests
-import cloudinary
-import cloudinary.api
-import cloudinary.uploader
-from barcode import Code128
-from barcode.writer import ImageWriter
-from fpdf import FPDF
+import binascii
+import hashlib
 from io import BytesIO
+from html import escape
 import time
-from PIL import Image # Thêm thư viện Pillow
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ocr_cache import OCRCache
+from metrics import timer
+import admission
 
 load_dotenv()
 
 # --- Email Sending ---
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+# Authenticated SMTP sessions reused across sends (SMTP_HOST/SMTP_PORT to point elsewhere)
+mail_pool = SMTPPool.from_env()
+
+# fpdf/fontTools, requests, Pillow, cloudinary and python-barcode are imported on first
+# use (or by warm_up()), so importing this module stays cheap for every worker boot
+_lazy_lock = threading.Lock()
+
+# --- Receipts (fonts and page template are prepared once per process) ---
+_receipt_renderer = None
+
+def get_receipt_renderer():
+    global _receipt_renderer
+    if _receipt_renderer is None:
+        with _lazy_lock:
+            if _receipt_renderer is None:
+                from receipts import ReceiptRenderer
+                _receipt_renderer = ReceiptRenderer()
+    return _receipt_renderer
 
 # --- OCR Processing ---
 OCR_SPACE_API_KEY = os.getenv("OCR_SPACE_API_KEY")
-OCR_SPACE_URL = 'https://api.ocr.space/parse/image'
+OCR_SPACE_URL = os.getenv("OCR_SPACE_URL", 'https://api.ocr.space/parse/image')
+# Images larger than this (pixels on the long side, or encoded bytes) are shrunk to JPEG before upload
+OCR_MAX_DIMENSION = int(os.getenv("OCR_MAX_DIMENSION", "1600"))
+OCR_MAX_UPLOAD_BYTES = int(os.getenv("OCR_MAX_UPLOAD_KB", "900")) * 1024
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+
+# Keep-alive connections to the OCR service, shared by all request threads
+_ocr_session = None
+
+def get_ocr_session():
+    global _ocr_session
+    if _ocr_session is None:
+        with _lazy_lock:
+            if _ocr_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=int(os.getenv("OCR_POOL_SIZE", "4"))))
+                session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=int(os.getenv("OCR_POOL_SIZE", "4"))))
+                _ocr_session = session
+    return _ocr_session
+
+# Batch scans share this pool, so concurrent batches together stay within the limit
+OCR_BATCH_CONCURRENCY = int(os.getenv("OCR_BATCH_CONCURRENCY", "4"))
+ocr_executor = ThreadPoolExecutor(max_workers=OCR_BATCH_CONCURRENCY, thread_name_prefix='ocr')
+
+DATA_DIR = os.getenv("DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+# Results of earlier scans, keyed by image hash (persisted under DATA_DIR)
+ocr_cache = OCRCache(
+    os.path.join(DATA_DIR, 'ocr_cache.db'),
+    max_entries=int(os.getenv("OCR_CACHE_MAX_ENTRIES", "5000")),
+    max_bytes=int(os.getenv("OCR_CACHE_MAX_MB", "16")) * 1024 * 1024
+)
+
+# --- Admission control (see admission.py) ---
+# Calls to OCR.space in flight across all workers on this host; a cover scan waits
+# OCR_QUEUE_WAIT seconds for a slot before it is refused, a batch image OCR_BATCH_QUEUE_WAIT
+ocr_slots = admission.Bulkhead('ocr', int(os.getenv("OCR_MAX_CONCURRENCY", "2")), os.path.join(DATA_DIR, 'admission'),
+                               max_wait=float(os.getenv("OCR_QUEUE_WAIT", "1")))
+OCR_BATCH_QUEUE_WAIT = float(os.getenv("OCR_BATCH_QUEUE_WAIT", "30"))
+# After BREAKER_FAILURES failures in a row a backend is not called for BREAKER_RESET_SECONDS
+_breaker_settings = dict(failures=int(os.getenv("BREAKER_FAILURES", "5")),
+                         reset_after=float(os.getenv("BREAKER_RESET_SECONDS", "30")))
+ocr_breaker = admission.CircuitBreaker('ocr', **_breaker_settings)
+smtp_breaker = admission.CircuitBreaker('smtp', **_breaker_settings)
 
 # --- Cloudinary Configuration ---
+_cloudinary_configured = False
+
 def configure_cloudinary():
+    global _cloudinary_configured
     try:
+        import cloudinary
         cloudinary.config(
             cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
             api_key=os.getenv("CLOUDINARY_API_KEY"),
             api_secret=os.getenv("CLOUDINARY_API_SECRET"),
             secure=True
         )
+        _cloudinary_configured = True
         print("Cloudinary configured successfully.")
     except Exception as e:
         print(f"CRITICAL: Failed to configure Cloudinary. Check .env variables. Error: {e}")
@@ -42,15 +111,19 @@ def configure_cloudinary():
 
 def generate_cloudinary_signature():
     try:
+        import cloudinary.utils
+        if not _cloudinary_configured:
+            configure_cloudinary()
         timestamp = int(time.time())
         params_to_sign = {
             'timestamp': timestamp,
             'folder': 'library_cards'
         }
-        signature = cloudinary.utils.api_sign_request(
-            params_to_sign,
-            os.getenv("CLOUDINARY_API_SECRET")
-        )
+        with timer('cloudinary.sign'):
+            signature = cloudinary.utils.api_sign_request(
+                params_to_sign,
+                os.getenv("CLOUDINARY_API_SECRET")
+            )
         return {"timestamp": timestamp, "signature": signature}
     except Exception as e:
         print(f"Error generating Cloudinary signature: {e}")
@@ -58,40 +131,102 @@ def generate_cloudinary_signature():
 
 # --- Service Functions ---
 
-def process_ocr_for_text(base64_image_data):
-    """Enhanced OCR processing for book scanning with better accuracy"""
+def decode_image_data(base64_image_data):
+    """Raw image bytes from base64, with or without a data: URL prefix."""
+    if base64_image_data.startswith('data:'):
+        base64_image_data = base64_image_data.partition(',')[2]
     try:
-        # Enhanced payload for better book text recognition
-        payload = {
-            'apikey': OCR_SPACE_API_KEY, 
-            'language': 'vie+eng',  # Support both Vietnamese and English
-            'isOverlayRequired': False,
-            'base64image': f"data:image/jpeg;base64,{base64_image_data}", 
-            'ocrengine': 2,  # Use OCR Engine 2 for better accuracy
-            'detectOrientation': True,  # Auto-detect text orientation
-            'scale': True,  # Scale image for better recognition
-            'OCREngine': 2,
-            'filetype': 'JPG',
-            'isCreateSearchablePdf': False,
-            'isSearchablePdfHideTextLayer': False
-        }
-        
-        response = requests.post(OCR_SPACE_URL, data=payload, timeout=30)
-        response.raise_for_status()
-        result = response.json()
+        image_bytes = base64.b64decode(base64_image_data)
+    except (binascii.Error, ValueError):
+        image_bytes = b''
+    if not image_bytes:
+        raise Exception("Invalid image data.")
+    return image_bytes
+
+def shrink_image_for_ocr(image_bytes):
+    """Downscale/recompress oversized images to JPEG; small ones are returned unchanged."""
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(BytesIO(image_bytes)) as img:
+            if max(img.size) <= OCR_MAX_DIMENSION and len(image_bytes) <= OCR_MAX_UPLOAD_BYTES:
+                return image_bytes
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.LANCZOS)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            out = BytesIO()
+            img.save(out, format='JPEG', quality=OCR_JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        print(f"Could not shrink OCR image, sending it as is: {e}")
+        return image_bytes
+    shrunk = out.getvalue()
+    return shrunk if len(shrunk) < len(image_bytes) else image_bytes
+
+def _ocr_lookup(base64_image_data):
+    """(image bytes, cache key, cached text or None) for a base64 image."""
+    image_bytes = decode_image_data(base64_image_data)
+    cache_key = hashlib.sha256(image_bytes).hexdigest()
+    with timer('ocr.cache'):
+        return image_bytes, cache_key, ocr_cache.get(cache_key)
+
+def _ocr_payload(image_bytes):
+    """OCR.space form fields for an image, shrunk first if oversized."""
+    with timer('ocr.shrink'):
+        upload = base64.b64encode(shrink_image_for_ocr(image_bytes)).decode('ascii')
+    # Enhanced payload for better book text recognition
+    return {
+        'apikey': OCR_SPACE_API_KEY, 
+        'language': 'vie+eng',  # Support both Vietnamese and English
+        'isOverlayRequired': False,
+        'base64image': f"data:image/jpeg;base64,{upload}", 
+        'ocrengine': 2,  # Use OCR Engine 2 for better accuracy
+        'detectOrientation': True,  # Auto-detect text orientation
+        'scale': True,  # Scale image for better recognition
+        'OCREngine': 2,
+        'filetype': 'JPG',
+        'isCreateSearchablePdf': False,
+        'isSearchablePdfHideTextLayer': False
+    }
+
+def _ocr_text(result, cache_key):
+    """Cleaned text of an OCR.space reply (and cache it), or None if nothing was read."""
+    if result.get('IsErroredOnProcessing'):
+        raise Exception(f"OCR Error: {result.get('ErrorMessage')}")
+    
+    if result['ParsedResults']:
+        raw_text = result['ParsedResults'][0]['ParsedText']
         
-        if result.get('IsErroredOnProcessing'):
-            raise Exception(f"OCR Error: {result.get('ErrorMessage')}")
+        # Clean and process the text for book recognition
+        cleaned_text = clean_book_text(raw_text)
+        try:
+            ocr_cache.put(cache_key, cleaned_text)
+        except Exception as e:
+            print(f"Could not cache OCR result: {e}")
+        return cleaned_text
         
-        if result['ParsedResults']:
-            raw_text = result['ParsedResults'][0]['ParsedText']
-            
-            # Clean and process the text for book recognition
-            cleaned_text = clean_book_text(raw_text)
-            return cleaned_text
-            
-        return None
+    return None
+
+def process_ocr_for_text(base64_image_data, max_wait=None):
+    """Enhanced OCR processing for book scanning with better accuracy
+
+    Raises admission.Saturated if no OCR slot frees up within `max_wait`
+    seconds (default OCR_QUEUE_WAIT), admission.CircuitOpen while OCR.space
+    keeps failing.
+    """
+    import requests
+    image_bytes, cache_key, cached = _ocr_lookup(base64_image_data)
+    if cached is not None:
+        return cached
+    try:
+        payload = _ocr_payload(image_bytes)
+        with ocr_slots.slot(max_wait), ocr_breaker.guard(), timer('ocr.request'):
+            response = get_ocr_session().post(OCR_SPACE_URL, data=payload, timeout=30)
+            response.raise_for_status()
+            result = response.json()
+        return _ocr_text(result, cache_key)
         
+    except admission.Rejected:
+        raise
     except requests.exceptions.Timeout:
         raise Exception("OCR request timeout. Please try again.")
     except requests.exceptions.RequestException as e:
@@ -99,6 +234,74 @@ def process_ocr_for_text(base64_image_data):
     except Exception as e:
         raise Exception(f"OCR processing failed: {str(e)}")
 
+def process_ocr_batch(images):
+    """OCR many base64 images concurrently. Returns [(text, error message)] in input order."""
+    futures = [ocr_executor.submit(process_ocr_for_text, image, OCR_BATCH_QUEUE_WAIT) for image in images]
+    results = []
+    for future in futures:
+        try:
+            results.append((future.result(), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+# --- OCR for the ASGI app (asgi.py): same cache, slots and breaker, awaited instead of blocking ---
+_async_ocr_client = None
+
+def get_async_ocr_client():
+    """Keep-alive httpx.AsyncClient to the OCR service; created on first use inside the event loop."""
+    global _async_ocr_client
+    if _async_ocr_client is None:
+        import httpx
+        size = int(os.getenv("OCR_POOL_SIZE", "4"))
+        _async_ocr_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=size, max_keepalive_connections=size))
+    return _async_ocr_client
+
+async def close_async_clients():
+    global _async_ocr_client
+    if _async_ocr_client is not None:
+        await _async_ocr_client.aclose()
+        _async_ocr_client = None
+
+async def process_ocr_for_text_async(base64_image_data, max_wait=None):
+    """process_ocr_for_text as a coroutine: the upload is awaited, image shrinking and the cache run in threads."""
+    import anyio
+    import httpx
+    # The cache is SQLite, which can wait on another process's write lock
+    image_bytes, cache_key, cached = await anyio.to_thread.run_sync(_ocr_lookup, base64_image_data)
+    if cached is not None:
+        return cached
+    try:
+        payload = await anyio.to_thread.run_sync(_ocr_payload, image_bytes)
+        # str() each field the way requests form-encodes them
+        payload = {k: str(v) for k, v in payload.items() if v is not None}
+        async with ocr_slots.async_slot(max_wait):
+            with ocr_breaker.guard(), timer('ocr.request'):
+                response = await get_async_ocr_client().post(OCR_SPACE_URL, data=payload, timeout=30)
+                response.raise_for_status()
+                result = response.json()
+        return await anyio.to_thread.run_sync(_ocr_text, result, cache_key)
+    except admission.Rejected:
+        raise
+    except httpx.TimeoutException:
+        raise Exception("OCR request timeout. Please try again.")
+    except httpx.HTTPError as e:
+        raise Exception(f"OCR service error: {str(e)}")
+    except Exception as e:
+        raise Exception(f"OCR processing failed: {str(e)}")
+
+async def process_ocr_batch_async(images):
+    """process_ocr_batch as a coroutine; OCR_BATCH_CONCURRENCY images of a batch are in flight at once."""
+    gate = asyncio.Semaphore(OCR_BATCH_CONCURRENCY)
+
+    async def one(image):
+        async with gate:
+            try:
+                return await process_ocr_for_text_async(image, OCR_BATCH_QUEUE_WAIT), None
+            except Exception as e:
+                return None, str(e)
+    return await asyncio.gather(*(one(image) for image in images))
+
 def clean_book_text(raw_text):
     """Clean and process OCR text for better book recognition"""
     if not raw_text:
@@ -144,91 +347,150 @@ def clean_book_text(raw_text):
         return text.split('\n')[0].strip() if text else ""
 
 def generate_barcode_image(borrow_code):
+    """PNG barcode in a BytesIO. Receipts and labels draw vector bars instead; kept for callers wanting a bitmap."""
     try:
+        from barcode import Code128
+        from barcode.writer import ImageWriter
         buffer = BytesIO()
-        Code128(borrow_code, writer=ImageWriter()).write(buffer)
+        with timer('barcode.png'):
+            Code128(borrow_code, writer=ImageWriter()).write(buffer)
         return buffer
     except Exception as e:
         print(f"Error generating barcode: {e}")
         return None
 
-def generate_pdf_receipt(details, barcode_buffer):
+def generate_barcode_svgs(codes):
+    """{code: svg} for many borrow_codes or book_ids at once, without any raster images."""
     try:
-        # --- START FIX ---
-        # 1. Dùng Pillow để mở và chuẩn hóa dữ liệu ảnh từ buffer
-        barcode_buffer.seek(0)
-        img = Image.open(barcode_buffer)
-
-        # 2. Tạo một buffer mới và lưu ảnh đã chuẩn hóa vào đó
-        clean_image_buffer = BytesIO()
-        img.save(clean_image_buffer, format="PNG")
-        clean_image_buffer.seek(0)
-        # --- END FIX ---
-
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.add_font('BeVietnamPro', '', 'fonts/BeVietnamPro-Regular.ttf', uni=True)
-        pdf.add_font('BeVietnamPro', 'B', 'fonts/BeVietnamPro-Bold.ttf', uni=True)
-
-        pdf.set_font('BeVietnamPro', 'B', 16)
-        pdf.cell(0, 10, 'PHIẾU MƯỢN SÁCH - Thư viện LibraNCT', 0, 1, 'C')
-        pdf.ln(10)
-
-        pdf.set_font('BeVietnamPro', '', 12)
-        pdf.cell(0, 8, f"Tên sách: {details['book_title']}", 0, 1)
-        pdf.cell(0, 8, f"Học sinh: {details['student_name']} - Lớp: {details['student_class']}", 0, 1)
-        pdf.cell(0, 8, f"Ngày mượn: {details['borrow_date']}", 0, 1)
-        pdf.set_font('BeVietnamPro', 'B', 12)
-        pdf.cell(0, 8, f"Hạn trả: {details['return_date']}", 0, 1)
-        pdf.ln(5)
-
-        # Sử dụng buffer đã được làm sạch và chuẩn hóa
-        pdf.image(clean_image_buffer, x=70, y=pdf.get_y(), w=70, type='PNG')
-        pdf.ln(25)
-
-        pdf.set_font('BeVietnamPro', '', 10)
-        pdf.cell(0, 8, 'Vui lòng đưa phiếu này cho thủ thư để nhận sách.', 0, 1, 'C')
-        pdf.cell(0, 8, 'Cảm ơn bạn đã sử dụng dịch vụ của LibraNCT!', 0, 1, 'C')
-
-        pdf_output_bytes = pdf.output(dest='S')
-        pdf_base64 = base64.b64encode(pdf_output_bytes).decode('utf-8')
-        return pdf_base64
+        from barcodes import barcode_svgs
+        with timer('barcode.svg'):
+            return barcode_svgs(codes)
+    except Exception as e:
+        print(f"Error generating barcodes: {e}")
+        return None
+
+def generate_barcode_labels(labels):
+    """PDF sheet of (code, caption) barcode labels as raw bytes, or None on failure."""
+    try:
+        with timer('pdf.labels'):
+            return get_receipt_renderer().render_labels(labels)
+    except Exception as e:
+        print(f"Error generating barcode labels: {e}")
+        return None
 
+def generate_pdf_receipt(details, barcode_buffer=None):
+    """Receipt PDF as raw bytes (vector barcode unless a PNG buffer is given), or None on failure."""
+    try:
+        with timer('pdf.receipt'):
+            return get_receipt_renderer().render(details, barcode_buffer)
     except Exception as e:
         print(f"Error generating PDF: {e}")
         return None
 
 
-def send_borrow_confirmation_email(recipients, details, pdf_base64):
+def build_borrow_confirmation_email(recipients, details, pdf_bytes):
+    msg = MIMEMultipart()
+    msg['From'] = EMAIL_ADDRESS
+    msg['To'] = ", ".join(recipients)
+    msg['Subject'] = f"Xác nhận mượn sách thành công - Mã: {details['borrow_code']}"
+
+    body = f"""
+    <html><body>
+        <h2>Chào {details['student_name']},</h2>
+        <p>Bạn đã mượn thành công cuốn sách <b>{details['book_title']}</b>.</p>
+        <p>Mã mượn sách của bạn là: <b>{details['borrow_code']}</b></p>
+        <p>Vui lòng trả sách trước hoặc trong ngày: <b>{details['return_date']}</b>.</p>
+        <p>Phiếu mượn sách chi tiết đã được đính kèm trong email này.</p>
+        <br>
+        <p>Cảm ơn bạn,</p>
+        <p><b>Thư viện LibraNCT</b></p>
+    </body></html>
+    """
+    msg.attach(MIMEText(body, 'html'))
+
+    pdf_attachment = MIMEApplication(pdf_bytes, _subtype="pdf")
+    pdf_attachment.add_header('Content-Disposition', 'attachment', filename=f"phieu-muon-{details['borrow_code']}.pdf")
+    msg.attach(pdf_attachment)
+    return msg
+
+def build_due_reminder_email(digest, today):
+    """One student's reminder digest (see reminders.ReminderScheduler.collect) as an email."""
+    msg = MIMEMultipart()
+    msg['From'] = EMAIL_ADDRESS
+    msg['To'] = ", ".join(digest['recipients'])
+    overdue = sum(1 for loan in digest['loans'] if loan['days_left'] < 0)
+    msg['Subject'] = (f"Nhắc trả sách: {overdue} cuốn đã quá hạn" if overdue
+                      else f"Nhắc trả sách: {len(digest['loans'])} cuốn sắp đến hạn")
+
+    rows = []
+    for loan in digest['loans']:
+        days_left = loan['days_left']
+        if days_left < 0:
+            when = f"<b>quá hạn {-days_left} ngày</b>"
+        elif days_left == 0:
+            when = "<b>hết hạn hôm nay</b>"
+        else:
+            when = f"còn {days_left} ngày"
+        rows.append(f"<li><b>{escape(loan['book_title'] or '')}</b> (mã mượn {loan['borrow_code']}): "
+                    f"hạn trả {loan['return_date']}, {when}</li>")
+    body = f"""
+    <html><body>
+        <h2>Chào {escape(digest['student_name'] or 'bạn')},</h2>
+        <p>Thư viện xin nhắc bạn về các sách đang mượn (tính đến ngày {today:%d/%m/%Y}):</p>
+        <ul>{''.join(rows)}</ul>
+        <p>Vui lòng trả sách đúng hạn để các bạn khác cũng có thể mượn.</p>
+        <br>
+        <p>Cảm ơn bạn,</p>
+        <p><b>Thư viện LibraNCT</b></p>
+    </body></html>
+    """
+    msg.attach(MIMEText(body, 'html'))
+    return msg
+
+def send_borrow_confirmation_email(recipients, details, pdf_bytes):
     try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_ADDRESS
-        msg['To'] = ", ".join(recipients)
-        msg['Subject'] = f"Xác nhận mượn sách thành công - Mã: {details['borrow_code']}"
-
-        body = f"""
-        <html><body>
-            <h2>Chào {details['student_name']},</h2>
-            <p>Bạn đã mượn thành công cuốn sách <b>{details['book_title']}</b>.</p>
-            <p>Mã mượn sách của bạn là: <b>{details['borrow_code']}</b></p>
-            <p>Vui lòng trả sách trước hoặc trong ngày: <b>{details['return_date']}</b>.</p>
-            <p>Phiếu mượn sách chi tiết đã được đính kèm trong email này.</p>
-            <br>
-            <p>Cảm ơn bạn,</p>
-            <p><b>Thư viện LibraNCT</b></p>
-        </body></html>
-        """
-        msg.attach(MIMEText(body, 'html'))
-
-        pdf_attachment = MIMEApplication(base64.b64decode(pdf_base64), _subtype="pdf")
-        pdf_attachment.add_header('Content-Disposition', 'attachment', filename=f"phieu-muon-{details['borrow_code']}.pdf")
-        msg.attach(pdf_attachment)
-
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.send_message(msg)
+        msg = build_borrow_confirmation_email(recipients, details, pdf_bytes)
+        with smtp_breaker.guard(), timer('smtp.send'):
+            mail_pool.send(msg)
         return True
     except Exception as e:
         print(f"Failed to send confirmation email: {e}")
         return False
 
+
+def send_many(messages):
+    """mail_pool.send_many behind the SMTP circuit breaker. Returns [(msg, error)] for the
+    ones that failed: all of them, unsent, while the circuit is open."""
+    messages = list(messages)
+    try:
+        smtp_breaker.before()
+    except admission.CircuitOpen as e:
+        return [(msg, e) for msg in messages]
+    failures = mail_pool.send_many(messages)
+    if messages and len(failures) == len(messages):
+        smtp_breaker.failure()
+    else:
+        smtp_breaker.success()
+    return failures
+
+
+def deliver_borrow_receipt(recipients, details):
+    """Render the receipt and email it. Raises on failure so the job queue retries."""
+    pdf_bytes = generate_pdf_receipt(details)
+    if pdf_bytes is None:
+        raise Exception("PDF generation failed.")
+    if not send_borrow_confirmation_email(recipients, details, pdf_bytes):
+        raise Exception("Sending the confirmation email failed.")
+
+
+def warm_up():
+    """Import every lazily loaded dependency and build the receipt templates now.
+
+    For a gunicorn master that preloads the app: forked workers then start
+    with fonts parsed and modules imported instead of paying on first use.
+    """
+    import PIL.Image, PIL.ImageOps, barcode.writer, barcodes, cloudinary.utils
+    get_ocr_session()
+    get_receipt_renderer().warm_up()
+    if os.getenv("CLOUDINARY_CLOUD_NAME") and not _cloudinary_configured:
+        configure_cloudinary()
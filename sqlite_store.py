@@ -0,0 +1,564 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from contextlib import contextmanager
+
+import inventory
+import serialization
+from borrow_history import month_of
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    book_id TEXT PRIMARY KEY,
+    is_borrowed INTEGER NOT NULL DEFAULT 0,  -- every copy is out
+    return_date TEXT,               -- ISO yyyy-mm-dd of the earliest due copy, for range queries
+    data TEXT NOT NULL              -- full book record as JSON
+);
+CREATE INDEX IF NOT EXISTS idx_books_due ON books (is_borrowed, return_date);
+
+CREATE TABLE IF NOT EXISTS borrowals (
+    borrow_code TEXT PRIMARY KEY,
+    book_id TEXT,
+    original_email TEXT,
+    return_date TEXT,               -- ISO yyyy-mm-dd
+    month TEXT,                     -- yyyy-mm partition of the borrow date, see borrow_history.month_of
+    returned INTEGER NOT NULL DEFAULT 0,  -- loan closed, see inventory.is_returned
+    data TEXT NOT NULL              -- full borrow record as JSON
+);
+CREATE INDEX IF NOT EXISTS idx_borrowals_book ON borrowals (book_id);
+CREATE INDEX IF NOT EXISTS idx_borrowals_email ON borrowals (original_email);
+CREATE INDEX IF NOT EXISTS idx_borrowals_return ON borrowals (return_date);
+
+-- Bumped by every write transaction so workers can spot each other's changes
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+
+-- What each recent version wrote, so other workers can apply it instead of reloading
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER NOT NULL,
+    kind TEXT NOT NULL,             -- 'book' or 'code' (a borrow record); 'all' when not itemized
+    key TEXT NOT NULL,
+    PRIMARY KEY (version, kind, key)
+) WITHOUT ROWID;
+"""
+
+# Created once the partition columns exist, which databases from before them gain on open
+PARTITION_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_borrowals_month ON borrowals (month, borrow_code);
+CREATE INDEX IF NOT EXISTS idx_borrowals_open ON borrowals (original_email) WHERE returned = 0;
+"""
+
+# Versions whose changes are kept; a worker further behind than this reloads
+CHANGES_KEPT = 1000
+# Changed keys past which a version (or a catch-up) is a full reload rather than itemized
+CHANGES_MAX_KEYS = 500
+
+
+def _iso_date(value):
+    """'dd/mm/YYYY' -> 'YYYY-mm-dd' (sortable), None if missing or malformed."""
+    try:
+        return datetime.strptime(value, '%d/%m/%Y').strftime('%Y-%m-%d')
+    except (ValueError, TypeError):
+        return None
+
+
+class SqliteStore:
+    """SQLite (WAL mode) implementation of the catalog store API.
+
+    Records are kept whole in a JSON `data` column so they round-trip exactly
+    like the JSON backend; the columns next to it exist only to be indexed.
+    Each thread gets its own connection, and mutations run in BEGIN IMMEDIATE
+    transactions so concurrent gunicorn workers serialize on the database.
+
+    Listeners registered with `subscribe()` get the same change entries as
+    with the JSON backend for writes made by this process. Each write also
+    logs the book_ids and borrow codes it touched under its version (table
+    `changes`), so once another process has written, `refresh()` and the
+    next write here pass listeners one entry with the current state of those
+    rows ('op': 'external'). They get None, a full reload, only after bulk
+    writes or when more than CHANGES_KEPT versions behind.
+
+    Books are stored normalized to copy-level inventory (see inventory.py);
+    rows written before copies existed are converted when the store opens.
+
+    Borrow history is partitioned by index rather than by file: each row
+    carries its borrow month and a `returned` flag, open loans have their
+    own partial index, and compaction flags loans closed without a return
+    date, so queries for open loans and date ranges never walk the rest.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True) if os.path.dirname(path) else None
+        self._local = threading.local()
+        self._compactor = None
+        self._listeners = []
+        self._version_lock = threading.Lock()
+        self._conn().executescript(SCHEMA)
+        self._seen_version = self._version()
+        self._add_partition_columns()
+        self._normalize_books()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        changes = conn.total_changes
+        self._local.touched = touched = set()
+        external = False
+        try:
+            yield conn
+            # A transaction that wrote nothing (no free copy, already returned, no-op
+            # update) leaves the version alone, so ETags and other workers' caches hold
+            if conn.total_changes != changes:
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+                version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+                # Writes not made through _put_*/_touch (migrations) and bulk ones are logged as 'all'
+                if not touched or len(touched) > CHANGES_MAX_KEYS:
+                    touched = {('all', '')}
+                conn.executemany("INSERT OR IGNORE INTO changes (version, kind, key) VALUES (?, ?, ?)",
+                                 [(version, kind, key) for kind, key in touched])
+                conn.execute("DELETE FROM changes WHERE version <= ?", (version - CHANGES_KEPT,))
+                # Still holding the write lock, so versions are seen in commit order
+                with self._version_lock:
+                    seen = self._seen_version
+                    self._seen_version = version
+                if version != seen + 1:
+                    external = self._changes_between(conn, seen, version - 1)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            self._local.touched = None
+        conn.execute('COMMIT')
+        if external is not False:
+            self._notify(external)
+
+    def _touch(self, kind, key):
+        """Log that the current transaction wrote book `key` ('book') or borrow record `key` ('code')."""
+        self._local.touched.add((kind, key))
+
+    def _changes_between(self, conn, after, upto):
+        """Change entry bringing a listener from version `after` to `upto` (current rows of
+        what those versions touched), or None if that takes a full reload."""
+        rows = conn.execute("SELECT version, kind, key FROM changes WHERE version > ? AND version <= ?",
+                            (after, upto)).fetchall()
+        keys = {(kind, key) for _, kind, key in rows}
+        # Every version in the range must still be logged (older ones are pruned)
+        if len({version for version, _, _ in rows}) != upto - after or ('all', '') in keys or len(keys) > CHANGES_MAX_KEYS:
+            return None
+        book_ids = [key for kind, key in keys if kind == 'book']
+        books = [serialization.loads(row[0]) for row in conn.execute(
+            "SELECT data FROM books WHERE book_id IN (SELECT value FROM json_each(?))", (serialization.dumps(book_ids),))]
+        found = {book['book_id'] for book in books}
+        borrowals = [serialization.loads(row[0]) for row in conn.execute(
+            "SELECT data FROM borrowals WHERE borrow_code IN (SELECT value FROM json_each(?))",
+            (serialization.dumps([key for kind, key in keys if kind == 'code']),))]
+        return {'op': 'external', 'books': books, 'deleted': [b for b in book_ids if b not in found], 'borrowals': borrowals}
+
+    def _version(self):
+        return self._scalar("SELECT value FROM meta WHERE key = 'version'")
+
+    def _add_partition_columns(self):
+        """Give borrowals created before history partitioning its month/returned columns (once)."""
+        columns = {row[1] for row in self._conn().execute('PRAGMA table_info(borrowals)')}
+        if 'month' not in columns:
+            with self._transaction() as conn:
+                columns = {row[1] for row in conn.execute('PRAGMA table_info(borrowals)')}
+                if 'month' not in columns:  # another worker may have got here first
+                    conn.execute("ALTER TABLE borrowals ADD COLUMN month TEXT")
+                    conn.execute("ALTER TABLE borrowals ADD COLUMN returned INTEGER NOT NULL DEFAULT 0")
+                    for code, data in conn.execute("SELECT borrow_code, data FROM borrowals").fetchall():
+                        record = serialization.loads(data)
+                        conn.execute("UPDATE borrowals SET month = ?, returned = ? WHERE borrow_code = ?",
+                                     (month_of(record), 1 if inventory.is_returned(record) else 0, code))
+        self._conn().executescript(PARTITION_INDEXES)
+
+    def _normalize_books(self):
+        """Give books stored before copies existed their copies list (once; cheap when none are left)."""
+        if not self._scalar("SELECT COUNT(*) FROM books WHERE json_type(data, '$.copies') IS NULL"):
+            return
+        with self._transaction() as conn:
+            for book in self._rows("SELECT data FROM books WHERE json_type(data, '$.copies') IS NULL"):
+                self._put_book(conn, inventory.normalize(book))
+
+    def subscribe(self, listener):
+        """Call `listener(entry)` for every change written here, `listener(None)` on outside changes."""
+        self._listeners.append(listener)
+
+    def _notify(self, entry):
+        for listener in self._listeners:
+            try:
+                listener(entry)
+            except Exception as e:
+                print(f"Catalog listener {listener} failed: {e}")
+
+    def _rows(self, sql, params=()):
+        return [serialization.loads(row[0]) for row in self._conn().execute(sql, params)]
+
+    def _scalar(self, sql, params=()):
+        return self._conn().execute(sql, params).fetchone()[0]
+
+    def _put_book(self, conn, book):
+        self._touch('book', book['book_id'])
+        conn.execute(
+            "INSERT INTO books (book_id, is_borrowed, return_date, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(book_id) DO UPDATE SET is_borrowed=excluded.is_borrowed, "
+            "return_date=excluded.return_date, data=excluded.data",
+            (book['book_id'], 1 if book.get('is_borrowed') else 0,
+             _iso_date(book.get('return_date')), serialization.dumps(book)))
+
+    def _put_borrowal(self, conn, record):
+        self._touch('code', record['borrow_code'])
+        conn.execute(
+            "INSERT INTO borrowals (borrow_code, book_id, original_email, return_date, month, returned, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(borrow_code) DO UPDATE SET book_id=excluded.book_id, original_email=excluded.original_email, "
+            "return_date=excluded.return_date, month=excluded.month, returned=excluded.returned, data=excluded.data",
+            (record['borrow_code'], record.get('book_id'), record.get('original_email'),
+             _iso_date(record.get('return_date')), month_of(record), 1 if inventory.is_returned(record) else 0,
+             serialization.dumps(record)))
+
+    def _get_book(self, conn, book_id):
+        row = conn.execute("SELECT data FROM books WHERE book_id = ?", (book_id,)).fetchone()
+        return serialization.loads(row[0]) if row else None
+
+    # --- maintenance (the JSON backend's snapshot/journal hooks) ---
+    def refresh(self):
+        """Pass listeners what other processes wrote since we last looked."""
+        version = self._version()
+        with self._version_lock:
+            seen = self._seen_version
+            # A write of ours may have moved past what we just read
+            if version <= seen:
+                return
+            self._seen_version = version
+        self._notify(self._changes_between(self._conn(), seen, version))
+
+    def close(self):
+        """Close the calling thread's connection; it is reopened on next use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+    def _close_finished_loans(self):
+        """Flag `returned` on loans whose copy came back without a return date
+        (pre-copies returns), taking them out of the open-loan index."""
+        rows = self._conn().execute(
+            "SELECT r.data, b.data FROM borrowals r LEFT JOIN books b ON b.book_id = r.book_id "
+            "WHERE r.returned = 0").fetchall()
+        closed = [r for r in self._with_status(rows) if r['is_returned']]
+        if closed:
+            with self._transaction() as conn:
+                for record in closed:
+                    del record['is_returned']
+                    self._put_borrowal(conn, {**record, 'returned': True})
+        return len(closed)
+
+    def compact(self):
+        """Flag finished loans returned, then checkpoint the WAL back into the main database file."""
+        self._close_finished_loans()
+        self._conn().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return True
+
+    def start_compactor(self, interval=300, min_bytes=1024 * 1024, min_closed=None):
+        """Checkpoint in a daemon thread whenever the WAL has grown past `min_bytes`.
+        `min_closed` is the JSON store's archiving threshold; unused here."""
+        if self._compactor:
+            return
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if os.path.getsize(self.path + '-wal') >= min_bytes:
+                        self.compact()
+                except FileNotFoundError:
+                    continue
+                except Exception as e:
+                    print(f"SQLite checkpoint failed: {e}")
+        self._compactor = threading.Thread(target=run, name='sqlite-checkpoint', daemon=True)
+        self._compactor.start()
+
+    def import_records(self, books, borrowals):
+        """Bulk upsert books and borrow records in a single transaction."""
+        with self._transaction() as conn:
+            for book in books:
+                self._put_book(conn, inventory.normalize(book))
+            for record in borrowals:
+                self._put_borrowal(conn, record)
+        self._notify(None)
+
+    def version(self):
+        """Opaque string that changes with every committed write, in any process."""
+        return str(self._version())
+
+    # --- lookups ---
+    def get_book(self, book_id):
+        return self._get_book(self._conn(), book_id)
+
+    def get_books(self, book_ids):
+        """Books for `book_ids` in the given order, skipping unknown ids."""
+        book_ids = list(book_ids)
+        if not book_ids:
+            return []
+        rows = self._rows(f"SELECT data FROM books WHERE book_id IN ({','.join('?' * len(book_ids))})", book_ids)
+        by_id = {book['book_id']: book for book in rows}
+        return [by_id[b] for b in book_ids if b in by_id]
+
+    def list_books(self):
+        return self._rows("SELECT data FROM books ORDER BY rowid")
+
+    def list_borrowals(self):
+        return self._rows("SELECT data FROM borrowals ORDER BY rowid")
+
+    def get_borrowal(self, borrow_code):
+        rows = self._rows("SELECT data FROM borrowals WHERE borrow_code = ?", (borrow_code,))
+        return rows[0] if rows else None
+
+    def get_borrowals(self, borrow_codes):
+        """{borrow_code: record} for the known codes among `borrow_codes`."""
+        borrow_codes, found = list(borrow_codes), {}
+        for i in range(0, len(borrow_codes), 500):
+            chunk = borrow_codes[i:i + 500]
+            for record in self._rows(f"SELECT data FROM borrowals WHERE borrow_code IN ({','.join('?' * len(chunk))})", chunk):
+                found[record['borrow_code']] = record
+        return found
+
+    def borrowals_for_email(self, email):
+        return self._rows("SELECT data FROM borrowals WHERE original_email = ? ORDER BY rowid", (email,))
+
+    def active_borrowals_for_email(self, email):
+        """(record, book) pairs for this user's loans that are still open."""
+        rows = self._conn().execute(
+            "SELECT r.data, b.data FROM borrowals r JOIN books b ON b.book_id = r.book_id "
+            "WHERE r.original_email = ? AND r.returned = 0 "
+            "AND json_extract(b.data, '$.available_count') < json_extract(b.data, '$.quantity') ORDER BY r.rowid", (email,))
+        pairs = [(serialization.loads(r), serialization.loads(b)) for r, b in rows]
+        return [(record, book) for record, book in pairs if inventory.loan_is_active(record, book)]
+
+    def _with_status(self, rows):
+        """(record JSON, book JSON or None) rows -> records with `is_returned`."""
+        records = []
+        for data, book in rows:
+            record = serialization.loads(data)
+            record['is_returned'] = not inventory.loan_is_active(record, serialization.loads(book) if book else None)
+            records.append(record)
+        return records
+
+    def list_borrowals_with_status(self):
+        """Copies of all borrow records with an `is_returned` flag."""
+        return self._with_status(self._conn().execute(
+            "SELECT r.data, b.data FROM borrowals r LEFT JOIN books b ON b.book_id = r.book_id ORDER BY r.rowid"))
+
+    def active_borrowals(self):
+        """Borrow records of loans still open, oldest first."""
+        records = self._with_status(self._conn().execute(
+            "SELECT r.data, b.data FROM borrowals r LEFT JOIN books b ON b.book_id = r.book_id "
+            "WHERE r.returned = 0 ORDER BY r.rowid"))
+        return [r for r in records if not r.pop('is_returned')]
+
+    def page_books(self, after=None, limit=50, status=None):
+        """Books ordered by book_id after the `after` cursor, optionally only
+        those with a copy 'available' or 'borrowed'. Returns (books, next cursor or None)."""
+        sql, params = "SELECT data FROM books WHERE 1", []
+        if after is not None:
+            sql += " AND book_id > ?"
+            params.append(after)
+        if status == 'available':
+            sql += " AND json_extract(data, '$.available_count') > 0"
+        elif status == 'borrowed':
+            sql += " AND json_extract(data, '$.available_count') < json_extract(data, '$.quantity')"
+        rows = self._rows(sql + " ORDER BY book_id LIMIT ?", params + [limit + 1])
+        return rows[:limit], (rows[limit - 1]['book_id'] if len(rows) > limit else None)
+
+    def page_borrowals(self, before=None, limit=50, status=None, student_class=None,
+                       date_from=None, date_to=None, today=None):
+        """Borrow records with `is_returned`, newest borrow_code first, before the `before` cursor.
+
+        Filters: status 'active' | 'returned' | 'overdue' (active and due
+        before `today`), exact student_class, and borrow_date within the ISO
+        'YYYY-mm-dd' bounds. Returns (records, next cursor or None).
+        """
+        sql = "SELECT r.data, b.data FROM borrowals r LEFT JOIN books b ON b.book_id = r.book_id WHERE r.borrow_code < ?"
+        params = []
+        if status in ('active', 'overdue'):
+            sql += " AND r.returned = 0"
+            if status == 'overdue':
+                sql += " AND r.return_date < ?"
+                params.append(today.strftime('%Y-%m-%d'))
+        if student_class is not None:
+            sql += " AND json_extract(r.data, '$.student_class') = ?"
+            params.append(student_class)
+        d = "json_extract(r.data, '$.borrow_date')"
+        borrowed_on = f"(substr({d}, 7, 4) || '-' || substr({d}, 4, 2) || '-' || substr({d}, 1, 2))"
+        if date_from:
+            sql += f" AND r.month >= ? AND {borrowed_on} >= ?"
+            params += [date_from[:7], date_from]
+        if date_to:
+            sql += f" AND r.month <= ? AND {borrowed_on} <= ?"
+            params += [date_to[:7], date_to]
+        sql += " ORDER BY r.borrow_code DESC LIMIT ?"
+        # Whether a loan is open depends on its book's copies, so status is checked
+        # here; keep fetching until the page is full or the records run out
+        page, cursor, chunk = [], before if before is not None else '\uffff', max(limit + 1, 100)
+        while True:
+            rows = self._conn().execute(sql, [cursor] + params + [chunk]).fetchall()
+            for record in self._with_status(rows):
+                cursor = record['borrow_code']
+                if status == 'active' or status == 'overdue':
+                    if record['is_returned']:
+                        continue
+                elif status == 'returned' and not record['is_returned']:
+                    continue
+                if len(page) == limit:
+                    return page, page[-1]['borrow_code']
+                page.append(record)
+            if len(rows) < chunk:
+                return page, None
+
+    def available_books(self, exclude_ids=(), limit=None):
+        """Books with a copy on the shelf, in catalog order."""
+        exclude_ids = list(exclude_ids)
+        sql = "SELECT data FROM books WHERE json_extract(data, '$.available_count') > 0"
+        if exclude_ids:
+            sql += f" AND book_id NOT IN ({','.join('?' * len(exclude_ids))})"
+        sql += " ORDER BY rowid"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self._rows(sql, exclude_ids)
+
+    def count_books(self):
+        """Copies in the catalog."""
+        return self._scalar("SELECT COALESCE(SUM(json_extract(data, '$.quantity')), 0) FROM books")
+
+    def count_borrowed(self):
+        """Copies lent out."""
+        return self._scalar("SELECT COALESCE(SUM(json_extract(data, '$.quantity') - json_extract(data, '$.available_count')), 0) "
+                            "FROM books")
+
+    def count_overdue(self, today):
+        """Lent copies whose return_date is before `today` (a date)."""
+        due = "json_extract(c.value, '$.return_date')"
+        return self._scalar(
+            "SELECT COUNT(*) FROM books b, json_each(b.data, '$.copies') c "
+            f"WHERE b.return_date < ? AND json_extract(c.value, '$.status') = 'borrowed' "
+            f"AND substr({due}, 7, 4) || '-' || substr({due}, 4, 2) || '-' || substr({due}, 1, 2) < ?",
+            (today.strftime('%Y-%m-%d'),) * 2)
+
+    def recent_borrowals(self, limit=5):
+        return self._rows("SELECT data FROM borrowals ORDER BY borrow_code DESC LIMIT ?", (limit,))
+
+    # --- mutations ---
+    def add_book(self, book):
+        """Add a book with `quantity` copies. Returns the stored book."""
+        book = inventory.next_rev(inventory.normalize(book))
+        with self._transaction() as conn:
+            self._put_book(conn, book)
+        self._notify({'op': 'add_book', 'books': [book]})
+        return book
+
+    def add_books(self, books):
+        """Add many books in one transaction, skipping book_ids already present.
+        Returns the books added."""
+        books = [inventory.next_rev(inventory.normalize(book)) for book in books]
+        with self._transaction() as conn:
+            books = [book for book in books if not self._get_book(conn, book['book_id'])]
+            for book in books:
+                self._put_book(conn, book)
+        if books:
+            self._notify({'op': 'add_books', 'books': books})
+        return books
+
+    def update_book(self, book_id, fields, rev=None):
+        """Apply `fields` to a book; a new `quantity` adds or removes copies on the shelf.
+
+        Returns the updated book or None if missing; raises ValueError if the
+        quantity would drop below the copies lent out, RevisionConflict if
+        `rev` is given and the book has moved past it.
+        """
+        with self._transaction() as conn:
+            book = self._get_book(conn, book_id)
+            if not book:
+                return None
+            inventory.check_rev(book, rev)
+            book.update(fields)
+            book = inventory.resize(book, int(fields['quantity'])) if 'quantity' in fields else inventory.normalize(book)
+            self._put_book(conn, inventory.next_rev(book))
+        self._notify({'op': 'update_book', 'books': [book]})
+        return book
+
+    def delete_book(self, book_id, rev=None):
+        """Remove a book. Returns the removed book or None if missing; raises
+        ValueError while a copy is lent out, RevisionConflict as update_book."""
+        with self._transaction() as conn:
+            book = self._get_book(conn, book_id)
+            if book:
+                inventory.check_rev(book, rev)
+                if inventory.lent_copies(book):
+                    raise ValueError("cannot delete a book with copies lent out")
+                conn.execute("DELETE FROM books WHERE book_id = ?", (book_id,))
+                self._touch('book', book_id)
+        if book:
+            self._notify({'op': 'delete_book', 'deleted': [book_id]})
+        return book
+
+    def borrow(self, book_id, return_date, record):
+        """Lend any free copy and record the loan (with its `copy_id`) in one transaction.
+
+        Returns the updated book, or None if it is missing or has no free copy.
+        """
+        with self._transaction() as conn:
+            book = self._get_book(conn, book_id)
+            if not book:
+                return None
+            book, copy_ = inventory.allocate(book, record['borrow_code'], return_date)
+            if not book:
+                return None
+            record['copy_id'] = copy_['copy_id']
+            self._put_book(conn, inventory.next_rev(book))
+            self._put_borrowal(conn, record)
+        self._notify({'op': 'borrow', 'books': [book], 'borrowals': [record]})
+        return book
+
+    def _get_borrowal(self, conn, borrow_code):
+        row = conn.execute("SELECT data FROM borrowals WHERE borrow_code = ?", (borrow_code,)).fetchone()
+        return serialization.loads(row[0]) if row else None
+
+    def return_loan(self, book_id, borrow_code=None, returned_date=None):
+        """Put back the copy lent under `borrow_code` (or the book's only lent copy)
+        and mark its borrow record returned on `returned_date` ('dd/mm/YYYY').
+
+        Returns (book, record or None), or None if there is no such loan.
+        """
+        with self._transaction() as conn:
+            book = self._get_book(conn, book_id)
+            record = self._get_borrowal(conn, borrow_code) if borrow_code else None
+            if not book or record is not None and inventory.is_returned(record):
+                return None
+            book, copy_ = inventory.release(book, borrow_code, legacy=record is not None and not record.get('copy_id'))
+            if not book:
+                return None
+            if record is None and copy_['borrow_code']:
+                record = self._get_borrowal(conn, copy_['borrow_code'])
+            self._put_book(conn, inventory.next_rev(book))
+            entry = {'op': 'return', 'books': [book]}
+            if record is not None:
+                record['returned_date'] = returned_date
+                self._put_borrowal(conn, record)
+                entry['borrowals'] = [record]
+        self._notify(entry)
+        return book, record
@@ -25,7 +25,8 @@ def main():
         logger.info("🚀 Starting SmartLib Server...")
         
         # Import và chạy Flask app
-        from app import app
+        from app import create_app
+        app = create_app(warm=True)
         
         # Chạy server
         app.run(
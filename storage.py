@@ -0,0 +1,66 @@
+"""Storage backend selection and JSON -> SQLite migration.
+
+Both backends expose the same API (get_book, list_books, borrow,
+return_loan, count_overdue, ...), so app.py does not care which one
+is active. Choose with STORAGE_BACKEND=json (default) or sqlite.
+
+One-shot migration of the JSON files under DATA_DIR:
+    python storage.py migrate
+"""
+import os
+import sys
+import argparse
+
+from catalog_store import CatalogStore
+from sqlite_store import SqliteStore
+
+BACKENDS = ('json', 'sqlite')
+SQLITE_FILENAME = 'library.db'
+
+
+def open_json_store(data_dir):
+    return CatalogStore(os.path.join(data_dir, 'database.json'),
+                        os.path.join(data_dir, 'borrowers.json'),
+                        os.path.join(data_dir, 'catalog.journal'))
+
+def open_sqlite_store(data_dir):
+    return SqliteStore(os.getenv('SQLITE_PATH') or os.path.join(data_dir, SQLITE_FILENAME))
+
+def open_store(data_dir, backend=None):
+    backend = (backend or os.getenv('STORAGE_BACKEND', 'json')).strip().lower()
+    if backend == 'json':
+        return open_json_store(data_dir)
+    if backend == 'sqlite':
+        return open_sqlite_store(data_dir)
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}', expected one of {', '.join(BACKENDS)}")
+
+
+def migrate_json_to_sqlite(data_dir):
+    """Copy books and borrow records (snapshot + journal) into the SQLite database.
+
+    Safe to re-run: records are upserted by book_id / borrow_code.
+    """
+    source = open_json_store(data_dir)
+    books, borrowals = source.list_books(), source.list_borrowals()
+    target = open_sqlite_store(data_dir)
+    target.import_records(books, borrowals)
+    target.compact()
+    return len(books), len(borrowals), target.path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LibraNCT storage tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    migrate = sub.add_parser('migrate', help="copy database.json/borrowers.json into SQLite")
+    migrate.add_argument('--data-dir', default=os.getenv('DATA_DIR', os.path.dirname(os.path.abspath(__file__))))
+    args = parser.parse_args(argv)
+
+    if args.command == 'migrate':
+        n_books, n_borrowals, path = migrate_json_to_sqlite(args.data_dir)
+        print(f"Migrated {n_books} books and {n_borrowals} borrow records into {path}")
+        print("Set STORAGE_BACKEND=sqlite to serve from it.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""OCR through the local OCR.space stand-in: misses reach it once, hits never do."""
+import asyncio
+
+import pytest
+
+import services
+from ocr_cache import OCRCache
+from bench import ocr_standin
+
+
+@pytest.fixture
+def standin(tmp_path, monkeypatch):
+    server, url = ocr_standin.start()
+    monkeypatch.setattr(services, 'OCR_SPACE_URL', url)
+    monkeypatch.setattr(services, 'ocr_cache', OCRCache(str(tmp_path / 'ocr_cache.db')))
+    yield server
+    server.shutdown()
+
+
+def test_sync_scan_is_cached(standin):
+    cover = ocr_standin.make_image('Toán học 10\nNXB Giáo dục')
+    assert services.process_ocr_for_text(cover) == 'Toán học 10 NXB Giáo dục'
+    assert (standin.requests, services.ocr_cache.misses, services.ocr_cache.hits) == (1, 1, 0)
+
+    assert services.process_ocr_for_text(cover) == 'Toán học 10 NXB Giáo dục'
+    assert (standin.requests, services.ocr_cache.misses, services.ocr_cache.hits) == (1, 1, 1)
+
+    assert services.process_ocr_for_text(ocr_standin.make_image('Ngữ văn 11')) == 'Ngữ văn 11'
+    assert (standin.requests, services.ocr_cache.misses, services.ocr_cache.hits) == (2, 2, 1)
+    assert services.ocr_cache.stats()['entries'] == 2
+
+
+def test_async_scan_shares_the_cache(standin):
+    cover = ocr_standin.make_image('Vật lý 12')
+    assert services.process_ocr_for_text(cover) == 'Vật lý 12'
+
+    async def scan(image):
+        try:
+            return await services.process_ocr_for_text_async(image)
+        finally:
+            await services.close_async_clients()
+
+    assert asyncio.run(scan(cover)) == 'Vật lý 12'
+    assert (standin.requests, services.ocr_cache.hits) == (1, 1)
+    assert asyncio.run(scan(ocr_standin.make_image('Hóa học 12'))) == 'Hóa học 12'
+    assert (standin.requests, services.ocr_cache.misses) == (2, 2)
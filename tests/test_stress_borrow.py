@@ -0,0 +1,12 @@
+"""Lost-update regression check: a reduced bench.stress_borrow run on each backend."""
+import pytest
+
+from bench import stress_borrow
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_no_lost_updates(backend):
+    problems, results, _ = stress_borrow.run(backend, workers=4, ops=60, books=2, copies=3)
+    assert problems == []
+    # The run has to have raced on something for the check to mean anything
+    assert sum(r['borrows'] for r in results) and sum(r['returns'] for r in results)
@@ -0,0 +1,59 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class TokenCache:
+    """Bounded LRU cache of verified ID token claims, keyed by a SHA-256 of the token.
+
+    An entry is served until the token's own `exp` (less `leeway` seconds)
+    or `max_age` seconds after verification, whichever comes first; expired
+    entries are dropped on lookup, so an expired token is always sent back
+    to full verification and rejected there.
+    """
+
+    def __init__(self, max_size=1024, max_age=300, leeway=5):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.leeway = leeway
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # token hash -> (claims, valid_until)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token):
+        """Cached claims for `token`, or None if unknown or expired."""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, claims):
+        now = time.time()
+        valid_until = now + self.max_age
+        if 'exp' in claims:
+            valid_until = min(valid_until, float(claims['exp']) - self.leeway)
+        if valid_until <= now:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (claims, valid_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}